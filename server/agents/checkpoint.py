@@ -0,0 +1,216 @@
+import asyncio
+import logging
+import time
+from typing import Any, AsyncIterator, Dict, Optional, Sequence, Set, Tuple
+
+import aiosqlite
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+)
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+from utils.env import get_env_variable
+
+logger = logging.getLogger(__name__)
+
+# 为空时不启用持久化会话，每次请求仍需携带完整历史
+CHECKPOINT_DB_PATH = get_env_variable("CHECKPOINT_DB_PATH", "")
+# 会话最后一次活跃后保留的秒数
+CHECKPOINT_TTL_SECONDS = float(get_env_variable("CHECKPOINT_TTL_SECONDS", str(7 * 24 * 3600)))
+# 压缩后每个会话保留的 checkpoint 数，恢复会话只需要最新的一个
+CHECKPOINT_KEEP_LAST = int(get_env_variable("CHECKPOINT_KEEP_LAST", "1"))
+# 两次过期清理之间的最小间隔（秒）
+CHECKPOINT_CLEANUP_INTERVAL = float(get_env_variable("CHECKPOINT_CLEANUP_INTERVAL", "600"))
+# "exit" 只在运行结束时写一次 checkpoint，而不是每个超步都写
+CHECKPOINT_DURABILITY = get_env_variable("CHECKPOINT_DURABILITY", "exit")
+
+
+class SqliteCheckpointer(BaseCheckpointSaver):
+    """
+    基于 SQLite 的会话 checkpointer
+    - 可以在模块导入时创建；AsyncSqliteSaver 需要运行中的事件循环，
+      因此在事件循环中第一次使用时才打开连接，并通过其公开构造函数创建，读写都委托给它
+    - 每次运行后压缩：每个会话只保留最近 keep_last 个 checkpoint 及其 writes
+    - 按会话最后活跃时间做 TTL 清理
+    只支持异步接口
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl: float = CHECKPOINT_TTL_SECONDS,
+        keep_last: int = CHECKPOINT_KEEP_LAST,
+        cleanup_interval: float = CHECKPOINT_CLEANUP_INTERVAL,
+    ):
+        super().__init__()
+        self.path = path
+        self.ttl = ttl
+        self.keep_last = max(1, keep_last)
+        self.cleanup_interval = cleanup_interval
+        self._saver: Optional[AsyncSqliteSaver] = None
+        self._open_lock = asyncio.Lock()
+        self._last_cleanup = 0.0
+        self._tasks: Set[asyncio.Task] = set()
+        self.compactions = 0
+        self.compacted_checkpoints = 0
+        self.expired_threads = 0
+
+    async def saver(self) -> AsyncSqliteSaver:
+        """打开连接并建表，只执行一次"""
+        if self._saver is not None:
+            return self._saver
+        async with self._open_lock:
+            if self._saver is None:
+                saver = AsyncSqliteSaver(await aiosqlite.connect(self.path), serde=self.serde)
+                await saver.setup()
+                async with saver.lock:
+                    await saver.conn.execute(
+                        "CREATE TABLE IF NOT EXISTS thread_activity ("
+                        "thread_id TEXT PRIMARY KEY, updated_at REAL NOT NULL)"
+                    )
+                    await saver.conn.commit()
+                self._saver = saver
+        return self._saver
+
+    async def setup(self) -> None:
+        await self.saver()
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await (await self.saver()).aget_tuple(config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        saver = await self.saver()
+        async for item in saver.alist(config, filter=filter, before=before, limit=limit):
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await (await self.saver()).aput(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        await (await self.saver()).aput_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await (await self.saver()).adelete_thread(thread_id)
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        # 版本号格式与 AsyncSqliteSaver 一致，与已有数据库中的 checkpoint 兼容
+        return AsyncSqliteSaver.get_next_version(self, current, channel)
+
+    async def compact(self, thread_id: str) -> int:
+        """删除该会话较旧的 checkpoint 及其 writes，并刷新最后活跃时间"""
+        saver = await self.saver()
+        async with saver.lock, saver.conn.cursor() as cur:
+            await cur.execute(
+                """
+                DELETE FROM checkpoints WHERE rowid IN (
+                    SELECT rowid FROM (
+                        SELECT rowid, ROW_NUMBER() OVER (
+                            PARTITION BY checkpoint_ns ORDER BY checkpoint_id DESC
+                        ) AS position
+                        FROM checkpoints WHERE thread_id = ?
+                    ) WHERE position > ?
+                )
+                """,
+                (thread_id, self.keep_last),
+            )
+            deleted = cur.rowcount
+            await cur.execute(
+                """
+                DELETE FROM writes WHERE thread_id = ? AND NOT EXISTS (
+                    SELECT 1 FROM checkpoints c
+                    WHERE c.thread_id = writes.thread_id
+                      AND c.checkpoint_ns = writes.checkpoint_ns
+                      AND c.checkpoint_id = writes.checkpoint_id
+                )
+                """,
+                (thread_id,),
+            )
+            await cur.execute(
+                "INSERT INTO thread_activity (thread_id, updated_at) VALUES (?, ?) "
+                "ON CONFLICT(thread_id) DO UPDATE SET updated_at = excluded.updated_at",
+                (thread_id, time.time()),
+            )
+            await saver.conn.commit()
+        self.compactions += 1
+        self.compacted_checkpoints += deleted
+        return deleted
+
+    async def cleanup_expired(self) -> int:
+        """删除超过 TTL 未活跃的会话"""
+        saver = await self.saver()
+        cutoff = time.time() - self.ttl
+        async with saver.lock, saver.conn.cursor() as cur:
+            await cur.execute("SELECT thread_id FROM thread_activity WHERE updated_at < ?", (cutoff,))
+            expired = [(row[0],) for row in await cur.fetchall()]
+            if expired:
+                await cur.executemany("DELETE FROM checkpoints WHERE thread_id = ?", expired)
+                await cur.executemany("DELETE FROM writes WHERE thread_id = ?", expired)
+                await cur.executemany("DELETE FROM thread_activity WHERE thread_id = ?", expired)
+                await saver.conn.commit()
+        self._last_cleanup = time.monotonic()
+        self.expired_threads += len(expired)
+        return len(expired)
+
+    async def maintain(self, thread_id: str):
+        try:
+            await self.compact(thread_id)
+            if time.monotonic() - self._last_cleanup >= self.cleanup_interval:
+                expired = await self.cleanup_expired()
+                if expired:
+                    logger.info("Removed %d expired conversation threads", expired)
+        except Exception as e:
+            logger.warning("Checkpoint maintenance failed for thread %s: %s", thread_id, e)
+
+    def schedule_maintenance(self, thread_id: str):
+        """在后台执行压缩和过期清理，不阻塞响应"""
+        task = asyncio.create_task(self.maintain(thread_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def aclose(self):
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._saver is not None:
+            await self._saver.conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "compactions": self.compactions,
+            "compacted_checkpoints": self.compacted_checkpoints,
+            "expired_threads": self.expired_threads,
+        }
+
+
+def create_checkpointer() -> Optional[SqliteCheckpointer]:
+    if not CHECKPOINT_DB_PATH:
+        return None
+    return SqliteCheckpointer(CHECKPOINT_DB_PATH)
+
+
+# 所有代理共享同一个 SQLite 数据库，按 thread_id 区分会话
+checkpointer = create_checkpointer()
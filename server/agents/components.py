@@ -0,0 +1,225 @@
+import re
+from typing import AsyncIterator, Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+from core.types.models import EventData, EventType, StreamEvent
+from utils.env import get_env_variable
+
+# enhanced_markdown 代理提示模型使用的组件标签
+COMPONENT_NAMES: FrozenSet[str] = frozenset(
+    name.strip()
+    for name in get_env_variable("STREAM_COMPONENT_NAMES", "highlight,CandlestickChart").split(",")
+    if name.strip()
+)
+# 单个标签（从 "<" 到 ">"）最多缓冲的字符数
+COMPONENT_MAX_TAG_CHARS = int(get_env_variable("COMPONENT_MAX_TAG_CHARS", "1024"))
+# 成对标签内部内容最多缓冲的字符数，超出后按普通文本输出
+COMPONENT_MAX_INNER_CHARS = int(get_env_variable("COMPONENT_MAX_INNER_CHARS", "8192"))
+
+_NAME_RE = re.compile(r"[A-Za-z][\w-]*")
+_ATTR_RE = re.compile(r"""([A-Za-z_:][\w:.-]*)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|\{([^}]*)\}|([^\s"'=<>`/]+)))?""")
+
+_TEXT, _TAG, _INNER = 0, 1, 2
+
+
+class Component(NamedTuple):
+    name: str
+    attributes: Dict[str, Union[str, bool]]
+    # 成对标签的内部内容，自闭合标签为 None
+    children: Optional[str]
+
+
+Segment = Union[str, Component]
+
+
+def parse_attributes(source: str) -> Dict[str, Union[str, bool]]:
+    attributes: Dict[str, Union[str, bool]] = {}
+    for match in _ATTR_RE.finditer(source):
+        name, double, single, expression, bare = match.groups()
+        value = next((v for v in (double, single, expression, bare) if v is not None), None)
+        attributes[name] = True if value is None else value
+    return attributes
+
+
+class ComponentParser:
+    """
+    流式组件标签解析器
+    - 输入任意切分的文本增量，输出普通文本片段和完整的 Component
+    - 标签可以跨 token 边界；不是已知组件的 "<" 立即按文本输出
+    - 只缓冲当前未完成的标签（上限 max_tag_chars）或成对标签的内部内容（上限 max_inner_chars），
+      每个字符只被扫描常数次，整体为线性时间
+    """
+
+    def __init__(
+        self,
+        names: Iterable[str] = COMPONENT_NAMES,
+        max_tag_chars: int = COMPONENT_MAX_TAG_CHARS,
+        max_inner_chars: int = COMPONENT_MAX_INNER_CHARS,
+    ):
+        self.names = frozenset(names)
+        self.max_tag_chars = max_tag_chars
+        self.max_inner_chars = max_inner_chars
+        self._state = _TEXT
+        self._buffer = ""
+        # 正在收集内部内容的组件：(开始标签原文, 组件名, 属性)
+        self._open: Optional[Tuple[str, str, Dict[str, Union[str, bool]]]] = None
+        self.components = 0
+        self.max_buffered = 0
+
+    @staticmethod
+    def _emit_text(out: List[Segment], text: str):
+        if not text:
+            return
+        if out and isinstance(out[-1], str):
+            out[-1] += text
+        else:
+            out.append(text)
+
+    def _check_tag(self, complete: bool) -> Optional[bool]:
+        """判断缓冲的标签：True 为已知组件，False 不是组件，None 需要更多输入"""
+        body = self._buffer[1:]
+        match = _NAME_RE.match(body)
+        if match is None:
+            return None if not body else False
+        name = match.group()
+        if match.end() == len(body):
+            # 名称还在增长，只要仍是某个组件名的前缀就继续等待
+            return None if any(known.startswith(name) for known in self.names) else False
+        if name not in self.names:
+            return False
+        if not complete:
+            return None if len(self._buffer) <= self.max_tag_chars else False
+        return True
+
+    def feed(self, text: str) -> List[Segment]:
+        out: List[Segment] = []
+        # 常见情况：没有未完成的标签且本段没有 "<"
+        if self._state == _TEXT and "<" not in text:
+            if text:
+                out.append(text)
+            return out
+
+        i = 0
+        while i < len(text):
+            if self._state == _TEXT:
+                j = text.find("<", i)
+                if j < 0:
+                    self._emit_text(out, text[i:])
+                    break
+                self._emit_text(out, text[i:j])
+                self._buffer = "<"
+                self._state = _TAG
+                i = j + 1
+
+            elif self._state == _TAG:
+                j = text.find(">", i)
+                end = len(text) if j < 0 else j + 1
+                self._buffer += text[i:end]
+                i = end
+                self.max_buffered = max(self.max_buffered, len(self._buffer))
+
+                verdict = self._check_tag(complete=j >= 0)
+                if verdict is None:
+                    continue
+                if verdict is False:
+                    # 不是组件：输出到下一个 "<" 之前的内容，剩余部分重新扫描
+                    buffer, self._buffer, self._state = self._buffer, "", _TEXT
+                    k = buffer.find("<", 1)
+                    if k < 0:
+                        self._emit_text(out, buffer)
+                    else:
+                        self._emit_text(out, buffer[:k])
+                        text, i = buffer[k:] + text[i:], 0
+                    continue
+
+                tag, self._buffer = self._buffer, ""
+                name = _NAME_RE.match(tag, 1).group()
+                inner = tag[1 + len(name):-1]
+                self_closing = inner.rstrip().endswith("/")
+                attributes = parse_attributes(inner.rstrip().rstrip("/"))
+                if self_closing:
+                    self.components += 1
+                    out.append(Component(name, attributes, None))
+                    self._state = _TEXT
+                else:
+                    self._open = (tag, name, attributes)
+                    self._state = _INNER
+
+            else:
+                tag, name, attributes = self._open
+                close = f"</{name}>"
+                # 只在新数据及与旧数据的重叠部分中查找结束标签
+                search_from = max(0, len(self._buffer) - len(close) + 1)
+                self._buffer += text[i:]
+                self.max_buffered = max(self.max_buffered, len(self._buffer))
+                k = self._buffer.find(close, search_from)
+                if k < 0:
+                    if len(self._buffer) > self.max_inner_chars:
+                        # 超出缓冲上限，放弃解析该组件
+                        self._emit_text(out, tag + self._buffer)
+                        self._buffer, self._open, self._state = "", None, _TEXT
+                    break
+
+                rest = self._buffer[k + len(close):]
+                self.components += 1
+                out.append(Component(name, attributes, self._buffer[:k]))
+                self._buffer, self._open, self._state = "", None, _TEXT
+                text, i = rest, 0
+        return out
+
+    def flush(self) -> List[Segment]:
+        """输出所有未完成的缓冲内容（模型输出结束时调用）"""
+        out: List[Segment] = []
+        if self._state == _TAG:
+            self._emit_text(out, self._buffer)
+        elif self._state == _INNER:
+            self._emit_text(out, self._open[0] + self._buffer)
+        self._buffer, self._open, self._state = "", None, _TEXT
+        return out
+
+
+def _segment_event(segment: Segment, source: StreamEvent) -> StreamEvent:
+    if isinstance(segment, str):
+        data = EventData(type=EventType.CHAT_TOKEN, content=segment, metadata=source.event.metadata)
+    else:
+        data = EventData(
+            type=EventType.CHAT_COMPONENT,
+            content=segment.children,
+            metadata={
+                **(source.event.metadata or {}),
+                "component": segment.name,
+                "attributes": segment.attributes,
+            },
+        )
+    return StreamEvent(event=data, run_id=source.run_id, thread_id=source.thread_id)
+
+
+async def parse_component_events(
+    events: AsyncIterator[StreamEvent],
+    parser: ComponentParser,
+) -> AsyncIterator[StreamEvent]:
+    """
+    把 CHAT_TOKEN 流拆分为纯文本增量和 CHAT_COMPONENT 事件
+    遇到非 token 事件（模型输出结束、步骤边界等）时先输出缓冲中的未完成内容
+    """
+    last_token: Optional[StreamEvent] = None
+    async for event in events:
+        if event.event.type != EventType.CHAT_TOKEN:
+            if last_token is not None:
+                for segment in parser.flush():
+                    yield _segment_event(segment, last_token)
+                last_token = None
+            yield event
+            continue
+
+        last_token = event
+        segments = parser.feed(event.event.content or "")
+        if len(segments) == 1 and segments[0] == event.event.content:
+            # 没有标签的 token 原样转发
+            yield event
+            continue
+        for segment in segments:
+            yield _segment_event(segment, event)
+
+    if last_token is not None:
+        for segment in parser.flush():
+            yield _segment_event(segment, last_token)
@@ -0,0 +1,237 @@
+import json
+import logging
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+
+from llm.tokens import count_tokens
+from utils.env import get_env_variable
+
+logger = logging.getLogger(__name__)
+
+# 每次模型调用的上下文 token 预算（不含输出）
+CONTEXT_TOKEN_BUDGET = int(get_env_variable("CONTEXT_TOKEN_BUDGET", "16000"))
+# 按模型覆盖预算，例如 {"gpt-4o": 32000, "gemini-2.0-flash": 64000}
+CONTEXT_TOKEN_BUDGETS: Dict[str, int] = json.loads(get_env_variable("CONTEXT_TOKEN_BUDGETS", "{}"))
+# 历史报告超过该长度才摘要
+CONTEXT_REPORT_SUMMARY_MIN_CHARS = int(get_env_variable("CONTEXT_REPORT_SUMMARY_MIN_CHARS", "1500"))
+# 摘要中保留的原文预览长度
+CONTEXT_SUMMARY_PREVIEW_CHARS = int(get_env_variable("CONTEXT_SUMMARY_PREVIEW_CHARS", "300"))
+CONTEXT_SUMMARY_CACHE_SIZE = int(get_env_variable("CONTEXT_SUMMARY_CACHE_SIZE", "4096"))
+
+# 每条消息的角色、分隔符等固定开销
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_TAG_RE = re.compile(r"<(script|style)\b.*?</\1>|<[^>]+>", re.S | re.I)
+_SPACE_RE = re.compile(r"\s+")
+
+
+def _text(message: BaseMessage) -> str:
+    content = message.content
+    if isinstance(content, str):
+        return content
+    return "".join(block if isinstance(block, str) else str(block.get("text", "")) for block in content)
+
+
+def _preview(text: str, limit: int) -> str:
+    text = _SPACE_RE.sub(" ", _TAG_RE.sub(" ", text)).strip()
+    return text if len(text) <= limit else text[:limit] + "…"
+
+
+class ContextManager:
+    """
+    模型调用前的上下文管理阶段
+    - 固定前缀（系统提示等）和最新一轮对话（最后一条用户消息及之后）原样保留
+    - 更早轮次的工具结果和生成的报告替换为简短摘要，摘要按消息 id 缓存
+    - 仍超出模型预算时，从最早的轮次开始整轮丢弃
+    """
+
+    def __init__(
+        self,
+        default_budget: int = CONTEXT_TOKEN_BUDGET,
+        budgets: Optional[Dict[str, int]] = None,
+        report_min_chars: int = CONTEXT_REPORT_SUMMARY_MIN_CHARS,
+        preview_chars: int = CONTEXT_SUMMARY_PREVIEW_CHARS,
+        cache_size: int = CONTEXT_SUMMARY_CACHE_SIZE,
+    ):
+        self.default_budget = default_budget
+        self.budgets = CONTEXT_TOKEN_BUDGETS if budgets is None else budgets
+        self.report_min_chars = report_min_chars
+        self.preview_chars = preview_chars
+        self.cache_size = cache_size
+        # (message.id, model) -> (摘要后的消息, token 数)
+        self._summaries: "OrderedDict[Tuple[str, str], Tuple[BaseMessage, int]]" = OrderedDict()
+        # (message.id, model, 内容长度) -> token 数
+        self._token_counts: "OrderedDict[Tuple[str, str, int], int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.tokens_in = 0
+        self.tokens_sent = 0
+        self.summarized = 0
+        self.summary_cache_hits = 0
+        self.dropped_messages = 0
+        self.over_budget = 0
+
+    def budget_for(self, model: Optional[str]) -> int:
+        return int(self.budgets.get(model or "", self.default_budget))
+
+    def _cache_get(self, cache: OrderedDict, key: Any) -> Any:
+        with self._lock:
+            value = cache.get(key)
+            if value is not None:
+                cache.move_to_end(key)
+            return value
+
+    def _cache_put(self, cache: OrderedDict, key: Any, value: Any):
+        with self._lock:
+            cache[key] = value
+            while len(cache) > self.cache_size:
+                cache.popitem(last=False)
+
+    def count(self, message: BaseMessage, model: Optional[str]) -> int:
+        # 摘要沿用原消息的 id，键中加入内容长度以区分
+        key = (message.id, model or "", len(_text(message))) if message.id else None
+        if key is not None:
+            cached = self._cache_get(self._token_counts, key)
+            if cached is not None:
+                return cached
+        tokens = MESSAGE_OVERHEAD_TOKENS + count_tokens(_text(message), model)
+        tool_calls = getattr(message, "tool_calls", None)
+        if tool_calls:
+            tokens += count_tokens(json.dumps(tool_calls, default=str), model)
+        if key is not None:
+            self._cache_put(self._token_counts, key, tokens)
+        return tokens
+
+    def _summarize(self, message: BaseMessage) -> Optional[BaseMessage]:
+        """返回历史消息的摘要版本，不需要摘要时返回 None"""
+        if isinstance(message, ToolMessage):
+            content = _text(message)
+            if len(content) <= self.preview_chars:
+                return None
+            return ToolMessage(
+                content=(
+                    f"[{message.name or 'tool'} result from an earlier turn, {len(content):,} chars omitted. "
+                    f"Preview: {_preview(content, self.preview_chars)}]"
+                ),
+                tool_call_id=message.tool_call_id,
+                name=message.name,
+                id=message.id,
+            )
+        if isinstance(message, AIMessage) and not message.tool_calls:
+            content = _text(message)
+            if len(content) < self.report_min_chars:
+                return None
+            return AIMessage(
+                content=(
+                    f"[Earlier report, {len(content):,} chars omitted. "
+                    f"Beginning: {_preview(content, self.preview_chars)}]"
+                ),
+                id=message.id,
+            )
+        return None
+
+    def _compact(self, message: BaseMessage, model: Optional[str]) -> Tuple[BaseMessage, int]:
+        key = (message.id, model or "")
+        if message.id:
+            cached = self._cache_get(self._summaries, key)
+            if cached is not None:
+                self.summary_cache_hits += 1
+                return cached
+        summary = self._summarize(message)
+        if summary is None:
+            return message, self.count(message, model)
+        self.summarized += 1
+        result = (summary, MESSAGE_OVERHEAD_TOKENS + count_tokens(_text(summary), model))
+        if message.id:
+            self._cache_put(self._summaries, key, result)
+        return result
+
+    @staticmethod
+    def _turns(messages: Sequence[BaseMessage]) -> List[List[BaseMessage]]:
+        """按用户消息切分轮次，工具调用和对应的工具结果总在同一轮内"""
+        turns: List[List[BaseMessage]] = []
+        for message in messages:
+            if not turns or message.type == "human":
+                turns.append([])
+            turns[-1].append(message)
+        return turns
+
+    def prepare(
+        self,
+        pinned: Sequence[BaseMessage],
+        messages: Sequence[BaseMessage],
+        model: Optional[str] = None,
+        node: Optional[str] = None,
+    ) -> List[BaseMessage]:
+        """构建发送给模型的消息列表"""
+        budget = self.budget_for(model)
+        turns = self._turns(messages)
+        latest = turns.pop() if turns else []
+
+        pinned_tokens = sum(self.count(message, model) for message in pinned)
+        latest_tokens = sum(self.count(message, model) for message in latest)
+        tokens_in = pinned_tokens + latest_tokens
+
+        history: List[Tuple[List[BaseMessage], int]] = []
+        for turn in turns:
+            compacted = []
+            turn_tokens = 0
+            for message in turn:
+                tokens_in += self.count(message, model)
+                compacted_message, tokens = self._compact(message, model)
+                compacted.append(compacted_message)
+                turn_tokens += tokens
+            history.append((compacted, turn_tokens))
+
+        total = pinned_tokens + latest_tokens + sum(tokens for _, tokens in history)
+        dropped = 0
+        while history and total > budget:
+            turn, tokens = history.pop(0)
+            total -= tokens
+            dropped += len(turn)
+        if total > budget:
+            self.over_budget += 1
+            logger.warning(
+                "Context exceeds budget even after compaction",
+                extra={"node": node, "model": model, "context_tokens": total, "budget": budget},
+            )
+
+        self.calls += 1
+        self.tokens_in += tokens_in
+        self.tokens_sent += total
+        self.dropped_messages += dropped
+        logger.info(
+            "Context prepared",
+            extra={
+                "node": node,
+                "model": model,
+                "budget": budget,
+                "tokens_in": tokens_in,
+                "context_tokens": total,
+                "messages_in": len(pinned) + len(messages),
+                "messages_sent": len(pinned) + sum(len(turn) for turn, _ in history) + len(latest),
+                "dropped_messages": dropped,
+            },
+        )
+
+        return [*pinned, *(message for turn, _ in history for message in turn), *latest]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "tokens_in": self.tokens_in,
+            "tokens_sent": self.tokens_sent,
+            "avg_context_tokens": self.tokens_sent / self.calls if self.calls else 0.0,
+            "saved_ratio": 1 - self.tokens_sent / self.tokens_in if self.tokens_in else 0.0,
+            "summarized": self.summarized,
+            "summary_cache_hits": self.summary_cache_hits,
+            "dropped_messages": self.dropped_messages,
+            "over_budget": self.over_budget,
+        }
+
+
+context_manager = ContextManager()
@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import threading
+import time
+from contextlib import aclosing
+from typing import Any, AsyncGenerator, AsyncIterator, Awaitable, Callable, Dict, Optional, TypeVar
+
+from utils.env import get_env_variable
+
+logger = logging.getLogger(__name__)
+
+# 轮询客户端连接状态的间隔（秒）
+DISCONNECT_POLL_INTERVAL = float(get_env_variable("DISCONNECT_POLL_INTERVAL", "0.25"))
+# 上游任务领先于 SSE 发送的最大事件数
+DISCONNECT_MAX_PENDING = int(get_env_variable("DISCONNECT_MAX_PENDING", "256"))
+
+T = TypeVar("T")
+DisconnectCheck = Callable[[], Awaitable[bool]]
+
+_EVENT, _DONE, _ERROR, _DISCONNECTED = range(4)
+
+
+class ClientDisconnected(Exception):
+    """客户端在响应完成前断开了连接，运行已被取消"""
+
+
+class DisconnectStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.disconnects = 0
+        self.cancel_seconds = 0.0
+        self.max_cancel_seconds = 0.0
+
+    def record(self, cancel_seconds: float):
+        with self._lock:
+            self.disconnects += 1
+            self.cancel_seconds += cancel_seconds
+            self.max_cancel_seconds = max(self.max_cancel_seconds, cancel_seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "disconnects": self.disconnects,
+                "avg_cancel_ms": self.cancel_seconds / self.disconnects * 1000 if self.disconnects else 0.0,
+                "max_cancel_ms": self.max_cancel_seconds * 1000,
+            }
+
+
+disconnect_stats = DisconnectStats()
+
+
+async def _wait_disconnected(is_disconnected: DisconnectCheck, poll_interval: float):
+    while not await is_disconnected():
+        await asyncio.sleep(poll_interval)
+
+
+async def _cancel(task: asyncio.Future) -> float:
+    """取消任务并等待其清理完成，返回耗时"""
+    started_at = time.monotonic()
+    task.cancel()
+    await asyncio.wait({task})
+    return time.monotonic() - started_at
+
+
+async def cancel_on_disconnect(
+    items: AsyncIterator[T],
+    is_disconnected: DisconnectCheck,
+    poll_interval: float = DISCONNECT_POLL_INTERVAL,
+    max_pending: int = DISCONNECT_MAX_PENDING,
+) -> AsyncIterator[T]:
+    """
+    在独立任务中消费上游流，同时轮询客户端连接状态
+    客户端断开时取消上游任务（LangGraph 运行及其中正在进行的 provider 请求），并抛出 ClientDisconnected
+    """
+    queue: asyncio.Queue = asyncio.Queue(max_pending)
+
+    async def produce():
+        try:
+            async with aclosing(items) as stream:
+                async for item in stream:
+                    await queue.put((_EVENT, item))
+            await queue.put((_DONE, None))
+        except Exception as e:
+            await queue.put((_ERROR, e))
+
+    async def watch():
+        await _wait_disconnected(is_disconnected, poll_interval)
+        started_at = time.monotonic()
+        producer.cancel()
+        # 客户端已不再读取，丢弃积压的事件后通知消费方
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait((_DISCONNECTED, started_at))
+
+    producer = asyncio.create_task(produce())
+    watcher = asyncio.create_task(watch())
+    try:
+        while True:
+            kind, value = await queue.get()
+            if kind == _EVENT:
+                yield value
+            elif kind == _DONE:
+                return
+            elif kind == _ERROR:
+                raise value
+            else:
+                await asyncio.wait({producer})
+                disconnect_stats.record(time.monotonic() - value)
+                raise ClientDisconnected()
+    finally:
+        if not watcher.done():
+            watcher.cancel()
+        if not producer.done():
+            # 提前结束（break、预算超限）时也等上游清理完成，确保 provider 请求已关闭
+            await _cancel(producer)
+
+
+async def cancel_stream(stream: Optional[AsyncGenerator]):
+    """
+    ASGI 服务器发现客户端断开时会取消（spec < 2.4）或关闭（发送失败）响应生成器，此时由它关闭上游流
+    关闭会取消其中的 LangGraph 运行，耗时计入断开统计
+    """
+    if stream is None:
+        return
+    started_at = time.monotonic()
+    try:
+        await stream.aclose()
+    finally:
+        disconnect_stats.record(time.monotonic() - started_at)
+
+
+async def run_until_disconnected(
+    awaitable: Awaitable[T],
+    is_disconnected: Optional[DisconnectCheck],
+    poll_interval: float = DISCONNECT_POLL_INTERVAL,
+) -> T:
+    """等待 awaitable 完成；客户端先断开时取消它并抛出 ClientDisconnected"""
+    task = asyncio.ensure_future(awaitable)
+    if is_disconnected is None:
+        return await task
+
+    watcher = asyncio.ensure_future(_wait_disconnected(is_disconnected, poll_interval))
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    finally:
+        watcher.cancel()
+    if task.done():
+        return task.result()
+    disconnect_stats.record(await _cancel(task))
+    raise ClientDisconnected()
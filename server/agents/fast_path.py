@@ -0,0 +1,129 @@
+import logging
+import re
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+from langchain_core.messages import AIMessage
+
+from agents.tools.tickers import extract_tickers, latest_user_text
+from utils.env import get_env_variable
+
+logger = logging.getLogger(__name__)
+
+# 启用快速路径的代理，逗号分隔，默认全部关闭。快速路径跳过模型对请求的理解，
+# 确认路由规则适合该代理的请求后再开启，例如 FAST_PATH_AGENTS=raw_web,enhanced_markdown
+FAST_PATH_AGENTS = {
+    name.strip()
+    for name in get_env_variable("FAST_PATH_AGENTS", "").split(",")
+    if name.strip()
+}
+# 超过该词数的请求可能包含其他要求，交给模型处理
+FAST_PATH_MAX_WORDS = int(get_env_variable("FAST_PATH_MAX_WORDS", "12"))
+
+_INTENT_RE = re.compile(
+    r"\b(analy[sz]e|analysis|report|stock|shares?|price|quote|chart|performance|trend|outlook)\b"
+    r"|分析|股票|股价|报告|行情|走势",
+    re.I,
+)
+# 对比、多只股票等请求需要模型理解
+_AMBIGUOUS_RE = re.compile(r"\b(compare|comparison|vs\.?|versus|between|and|or)\b|对比|比较|和|与", re.I)
+_WORD_RE = re.compile(r"[$\w'-]+")
+
+
+class FastPathRouter:
+    """
+    chat_node 之前的确定性路由
+    对 "分析某只股票" 这类只含一个明确股票代码的请求，直接合成 get_stock_data 工具调用并跳到 process_tools，
+    省掉一次选择工具的模型往返；其余请求仍交给 chat_node
+    """
+
+    def __init__(
+        self,
+        agent_name: str,
+        tool_name: str = "get_stock_data",
+        arg_name: str = "stock_name",
+        enabled: Optional[bool] = None,
+    ):
+        self.agent_name = agent_name
+        self.tool_name = tool_name
+        self.arg_name = arg_name
+        self.enabled = agent_name in FAST_PATH_AGENTS if enabled is None else enabled
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hits = 0
+        self.decision_seconds = 0.0
+        # chat_node 模型往返耗时的指数滑动平均，用于估算快速路径节省的时间
+        self.llm_latency_ewma: Optional[float] = None
+        self.saved_seconds = 0.0
+
+    def match(self, state: Dict[str, Any]) -> Optional[str]:
+        """请求只涉及一个明确的股票时返回其代码"""
+        messages = state.get("messages") or []
+        # 只处理新一轮的用户输入，工具循环中的再次进入交给模型
+        if not messages or getattr(messages[-1], "type", None) != "human":
+            return None
+        text = latest_user_text(state)
+        words = _WORD_RE.findall(text)
+        if not words or len(words) > FAST_PATH_MAX_WORDS or _AMBIGUOUS_RE.search(text):
+            return None
+        tickers = extract_tickers(text)
+        if len(tickers) != 1:
+            return None
+        # 需要有分析类意图，或者整个输入就是股票本身
+        if not _INTENT_RE.search(text) and len(words) > 1:
+            return None
+        return tickers[0]
+
+    def observe_llm_latency(self, seconds: float, alpha: float = 0.2):
+        with self._lock:
+            if self.llm_latency_ewma is None:
+                self.llm_latency_ewma = seconds
+            else:
+                self.llm_latency_ewma += alpha * (seconds - self.llm_latency_ewma)
+
+    async def node(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """图节点：命中时追加合成的工具调用消息"""
+        started_at = time.perf_counter()
+        ticker = self.match(state) if self.enabled else None
+        elapsed = time.perf_counter() - started_at
+
+        with self._lock:
+            self.requests += 1
+            self.decision_seconds += elapsed
+            if ticker is not None:
+                self.hits += 1
+                self.saved_seconds += self.llm_latency_ewma or 0.0
+
+        if ticker is None:
+            return {"next_step": "chat_node"}
+
+        logger.info("Fast path hit", extra={"agent": self.agent_name, "ticker": ticker})
+        tool_call = {"name": self.tool_name, "args": {self.arg_name: ticker}, "id": f"call_{uuid.uuid4().hex[:24]}"}
+        return {
+            "messages": state["messages"] + [AIMessage(content="", tool_calls=[tool_call], id=str(uuid.uuid4()))],
+            "next_step": "process_tools",
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "requests": self.requests,
+                "hits": self.hits,
+                "hit_ratio": self.hits / self.requests if self.requests else 0.0,
+                "avg_decision_ms": self.decision_seconds / self.requests * 1000 if self.requests else 0.0,
+                "llm_latency_ewma_ms": (self.llm_latency_ewma or 0.0) * 1000,
+                "estimated_saved_seconds": self.saved_seconds,
+            }
+
+
+fast_path_routers: Dict[str, FastPathRouter] = {}
+
+
+def get_fast_path_router(agent_name: str, **kwargs) -> FastPathRouter:
+    router = fast_path_routers.get(agent_name)
+    if router is None:
+        router = fast_path_routers[agent_name] = FastPathRouter(agent_name, **kwargs)
+    return router
@@ -1,34 +1,40 @@
-from langchain_core.messages import ToolMessage, HumanMessage
+import time
+
+from langchain_core.messages import HumanMessage
 from langchain_core.runnables import RunnableConfig
 from langgraph.graph import StateGraph, START, END
 from langchain_core.messages import SystemMessage
 
+from agents.checkpoint import checkpointer
+from agents.context import context_manager
+from agents.fast_path import get_fast_path_router
+from agents.metrics import register_component_stats
+from agents.tools.executor import ToolExecutor
+from agents.tools.tickers import speculative_tool_calls
 from agents.tools.stock import get_stock_data
 from agents.state import AgentState, get_llm_client
 
+tool_executor = ToolExecutor([get_stock_data])
+register_component_stats("tool_executor", tool_executor.stats, agent="enhanced_markdown")
+# 单一股票的分析请求跳过选择工具的模型调用
+fast_path = get_fast_path_router("enhanced_markdown")
+
 
-async def process_tools_node(state: AgentState) -> AgentState:
+async def process_tools_node(state: AgentState, config: RunnableConfig) -> AgentState:
     """处理工具调用的节点"""
     # 获取最后一条消息
     last_message = state["messages"][-1]
 
     if hasattr(last_message, 'tool_calls') and last_message.tool_calls:
-        # 处理工具调用
-        tool_messages = []
-        for tool_call in last_message.tool_calls:
-            if tool_call['name'] == 'get_stock_data':
-                stock_name = tool_call['args']['stock_name']
-                result = get_stock_data(stock_name)
-                tool_messages.append(ToolMessage(
-                    content=str(result),
-                    tool_call_id=tool_call['id']
-                ))
+        # 并发执行工具调用，阻塞型工具在线程池中运行
+        tool_messages = await tool_executor.run(last_message.tool_calls, config)
 
         return {
             "messages": state["messages"] + tool_messages,
             "next_step": "generate_report"
         }
 
+    tool_executor.discard_prefetches(config)
     return {
         "messages": state["messages"],
         "next_step": "end"
@@ -54,10 +60,13 @@ async def generate_report(state: AgentState) -> AgentState:
     model = get_llm_client(state)
 
     # Run the model to generate a response
-    response = await model.ainvoke([
-        SystemMessage(content=generate_role_define_prompt),
-        *state["messages"],
-    ], RunnableConfig(recursion_limit=25))
+    # 按模型预算裁剪历史：旧的工具结果和报告替换为摘要
+    response = await model.ainvoke(context_manager.prepare(
+        [SystemMessage(content=generate_role_define_prompt)],
+        state["messages"],
+        model=state["model"],
+        node="generate_report",
+    ), RunnableConfig(recursion_limit=25))
 
     messages = state["messages"] + [response]
 
@@ -66,7 +75,10 @@ async def generate_report(state: AgentState) -> AgentState:
         "next_step": "process_tools"
     }
 
-async def chat_node(state: AgentState) -> AgentState:
+async def chat_node(state: AgentState, config: RunnableConfig) -> AgentState:
+    # 推测性预取：模型决定调用工具之前，先开始拉取用户输入中出现的股票数据
+    tool_executor.prefetch(speculative_tool_calls(state), config)
+
     system_prompt = """
         You are a stock market analyst expert.
         You are given a stock ticker and a date.
@@ -82,20 +94,22 @@ async def chat_node(state: AgentState) -> AgentState:
     """
 
     model = get_llm_client(state)
-    model_with_tools = model.bind_tools([get_stock_data], parallel_tool_calls=False)
+    model_with_tools = model.bind_tools([get_stock_data])
 
     # 准备消息列表
-    messages = [SystemMessage(content=system_prompt)]
+    pinned = [SystemMessage(content=system_prompt)]
 
     # 如果有动态prompt参数，则作为用户消息添加
     if state.get("prompt"):
-        messages.append(HumanMessage(content=state["prompt"]))
+        pinned.append(HumanMessage(content=state["prompt"]))
 
-    # 添加原有的消息
-    messages.extend(state["messages"])
+    # 添加原有的消息，按模型预算裁剪历史
+    messages = context_manager.prepare(pinned, state["messages"], model=state["model"], node="chat_node")
 
     # Run the model to generate a response
+    started_at = time.perf_counter()
     response = await model_with_tools.ainvoke(messages, RunnableConfig(recursion_limit=25))
+    fast_path.observe_llm_latency(time.perf_counter() - started_at)
 
     messages = state["messages"] + [response]
 
@@ -106,13 +120,17 @@ async def chat_node(state: AgentState) -> AgentState:
 
 workflow = StateGraph(AgentState)
 
+workflow.add_node("fast_path", fast_path.node)
 workflow.add_node("chat_node", chat_node)
 workflow.add_node("process_tools", process_tools_node)
 workflow.add_node("generate_report", generate_report)
 
-workflow.set_entry_point("chat_node")
+workflow.set_entry_point("fast_path")
 
 # 添加路由逻辑
+def route_after_fast_path(state: AgentState) -> str:
+    return state["next_step"]
+
 def route_after_chat(state: AgentState) -> str:
     return state["next_step"]
 
@@ -122,7 +140,12 @@ def route_after_tools(state: AgentState) -> str:
 def route_after_generate(state: AgentState) -> str:
     return state["next_step"]
 
-workflow.add_edge(START, "chat_node")
+workflow.add_edge(START, "fast_path")
+
+workflow.add_conditional_edges("fast_path", route_after_fast_path, {
+    "process_tools": "process_tools",
+    "chat_node": "chat_node"
+})
 
 workflow.add_conditional_edges("chat_node", route_after_chat, {
     "process_tools": "process_tools",
@@ -139,4 +162,5 @@ workflow.add_conditional_edges("generate_report", route_after_generate, {
     "end": END
 })
 
-graph = workflow.compile()
+# checkpointer 为 None（未配置 CHECKPOINT_DB_PATH）时不持久化会话
+graph = workflow.compile(checkpointer=checkpointer)
@@ -1,16 +1,35 @@
+import asyncio
 import logging
 import uuid
 import os
 from datetime import datetime
-from typing import AsyncIterator, Dict, Any, Union, Optional
+from typing import AsyncIterator, Dict, Any, List, Union, Optional, Tuple
 
 from langchain_core.messages import BaseMessage, HumanMessage
+from langgraph.constants import TAG_HIDDEN
 
-from core.types.models import ChatRequest, ChatResponse, StreamChunk, ChatMessage, EventType, EventData, StreamEvent
+from core.types.models import ChatRequest, ChatResponse, StreamChunk, ChatMessage, EventType, EventData, StreamEvent, StreamOptions
 from agents.state import AgentState
+from llm.tokens import UsageTracker, aget_encoder
+from utils.env import get_env_variable
+from utils.log import Lazy, raw_event_sampler
+from agents.checkpoint import CHECKPOINT_DURABILITY
+from agents.metrics import METRICS_NODES, RunMetrics
+from agents.tracing import RunTrace, tracer
+from agents.components import ComponentParser, parse_component_events
+from agents.disconnect import (
+    ClientDisconnected,
+    DisconnectCheck,
+    cancel_on_disconnect,
+    cancel_stream,
+    run_until_disconnected,
+)
+from agents.response_cache import RunRecorder, replay_frames, request_cache_key, response_cache
+from agents.sse import OpenAIChunkEncoder, SSEWriter, TokenCoalescer, coalesce_events
 
 import time
 import json
+from contextlib import aclosing
 from core.types.models import (
     OpenAIChatCompletionResponse,
     OpenAIChatCompletionStreamResponse,
@@ -20,44 +39,163 @@ from core.types.models import (
     convert_to_chat_request
 )
 
+# 单次请求的默认 token 预算（prompt + completion），0 表示不限制
+REQUEST_TOKEN_BUDGET = int(get_env_variable("REQUEST_TOKEN_BUDGET", "0"))
+
 # 创建专门的事件日志器
 event_logger = logging.getLogger(f"{__name__}.events")
 event_logger.setLevel(logging.INFO)
 
+class StepTracker:
+    """
+    单次运行内的步骤状态跟踪器
+    步骤事件默认只携带节点名、耗时和状态增量（新消息的 id/大小、next_step），
+    full_state=True 时才回退到发送完整的原始 data
+    """
+
+    def __init__(self, full_state: bool = False):
+        self.full_state = full_state
+        self._started_at: Dict[str, float] = {}
+        self._seen_messages: set = set()
+        self._anonymous_messages: set = set()
+
+    @staticmethod
+    def _content_key(message: Any) -> Any:
+        content = getattr(message, "content", message)
+        if not isinstance(content, str):
+            content = repr(content)
+        return getattr(message, "type", None), getattr(message, "tool_call_id", None), hash(content)
+
+    def _is_new(self, message: Any) -> bool:
+        """
+        节点内创建的消息可能还没有 id，add_messages 之后才原地补上，前后两步看到的 id 不同；
+        没有 id 的消息额外按 (类型, tool_call_id, 内容) 记录，之后带上 id 出现时仍能识别为同一条
+        """
+        message_id = getattr(message, "id", None)
+        if message_id in self._seen_messages:
+            return False
+        content_key = self._content_key(message) if self._anonymous_messages or not message_id else None
+        if content_key in self._anonymous_messages:
+            if message_id:
+                self._seen_messages.add(message_id)
+            return False
+        if message_id:
+            self._seen_messages.add(message_id)
+        else:
+            self._anonymous_messages.add(content_key)
+        return True
+
+    @staticmethod
+    def _message_size(message: Any) -> int:
+        content = getattr(message, "content", message)
+        return len(content) if isinstance(content, (str, list)) else len(str(content))
+
+    def _messages_delta(self, state: Any) -> list:
+        if not isinstance(state, dict):
+            return []
+        delta = []
+        for message in state.get("messages") or []:
+            if not self._is_new(message):
+                continue
+            delta.append({
+                "id": getattr(message, "id", None),
+                "type": getattr(message, "type", type(message).__name__),
+                "size": self._message_size(message),
+            })
+        return delta
+
+    def on_start(self, raw_event: Dict[str, Any]) -> Dict[str, Any]:
+        data = raw_event.get("data", {})
+        self._started_at[raw_event.get("run_id", "")] = time.perf_counter()
+        if self.full_state:
+            return data
+
+        state = data.get("input") if isinstance(data, dict) else None
+        new_messages = self._messages_delta(state)
+        metadata: Dict[str, Any] = {"node": raw_event.get("name", "")}
+        if new_messages:
+            metadata["new_messages"] = new_messages
+        return metadata
+
+    def on_end(self, raw_event: Dict[str, Any]) -> Dict[str, Any]:
+        data = raw_event.get("data", {})
+        started_at = self._started_at.pop(raw_event.get("run_id", ""), None)
+        if self.full_state:
+            return data
+
+        metadata: Dict[str, Any] = {"node": raw_event.get("name", "")}
+        if started_at is not None:
+            metadata["duration_ms"] = round((time.perf_counter() - started_at) * 1000, 2)
+
+        output = data.get("output") if isinstance(data, dict) else None
+        new_messages = self._messages_delta(output)
+        if new_messages:
+            metadata["new_messages"] = new_messages
+        if isinstance(output, dict) and "next_step" in output:
+            metadata["next_step"] = output["next_step"]
+        return metadata
+
+
 class LangGraphEventProcessor:
     """LangGraph 事件处理器，用于过滤和格式化事件"""
 
+    # 始终转发的事件类型
+    FORWARDED_EVENTS = frozenset({
+        "on_chat_model_stream",  # 聊天模型流式输出
+        "on_tool_start",         # 工具开始
+        "on_tool_end",           # 工具结束
+        "on_chain_start",        # 链开始
+        "on_chain_end",          # 链结束
+    })
+    # 在调试模式下转发更多事件
+    DEBUG_EVENTS = frozenset({
+        "on_llm_start",
+        "on_llm_end",
+        "on_retriever_start",
+        "on_retriever_end",
+    })
+    # 下推到 astream_events 的 run 类型过滤，与上面的事件类型一一对应
+    FORWARDED_RUN_TYPES = ("chat_model", "tool", "chain")
+    DEBUG_RUN_TYPES = ("llm", "retriever")
+
     def __init__(self, debug_mode: bool = False):
         self.debug_mode = debug_mode
+        self.forwarded_events = self.FORWARDED_EVENTS | self.DEBUG_EVENTS if debug_mode else self.FORWARDED_EVENTS
 
-    def _should_forward_event(self, event: Dict[str, Any]) -> bool:
-        """判断事件是否应该转发到前端"""
-        event_type = event.get("event", "")
-        event_name = event.get("name", "")
-
-        # 始终转发的事件类型
-        important_events = [
-            "on_chat_model_stream",  # 聊天模型流式输出
-            "on_tool_start",         # 工具开始
-            "on_tool_end",           # 工具结束
-            "on_chain_start",        # 链开始
-            "on_chain_end",          # 链结束
-        ]
-
-        # 在调试模式下转发更多事件
+    def stream_filters(self, graph) -> Dict[str, Any]:
+        """构建传给 astream_events 的过滤参数，让不需要的事件在源头就被丢弃"""
         if self.debug_mode:
-            debug_events = [
-                "on_llm_start",
-                "on_llm_end",
-                "on_retriever_start",
-                "on_retriever_end",
-            ]
-            important_events.extend(debug_events)
-
-        return event_type in important_events
+            # 调试模式保留内部运行，便于排查
+            return {"include_types": [*self.FORWARDED_RUN_TYPES, *self.DEBUG_RUN_TYPES]}
+
+        filters: Dict[str, Any] = {
+            "include_types": list(self.FORWARDED_RUN_TYPES),
+            "exclude_tags": [TAG_HIDDEN],
+        }
+        # 条件边的路由函数也会产生 chain 事件，对前端没有意义
+        builder = getattr(graph, "builder", None)
+        branch_names = [
+            name
+            for branches in getattr(builder, "branches", {}).values()
+            for name in branches
+        ]
+        if branch_names:
+            filters["exclude_names"] = branch_names
+        return filters
 
-    def _format_event(self, raw_event: Dict[str, Any], run_id: str, thread_id: str) -> Optional[StreamEvent]:
+    def _should_forward_event(self, event: Dict[str, Any]) -> bool:
+        """判断事件是否应该转发到前端"""
+        return event.get("event", "") in self.forwarded_events
+
+    def _format_event(
+        self,
+        raw_event: Dict[str, Any],
+        run_id: str,
+        thread_id: str,
+        steps: Optional[StepTracker] = None,
+    ) -> Optional[StreamEvent]:
         """将原始 LangGraph 事件格式化为标准事件"""
+        steps = steps or StepTracker()
         event_type = raw_event.get("event", "")
         data = raw_event.get("data", {})
         name = raw_event.get("name", "")
@@ -116,7 +254,7 @@ class LangGraphEventProcessor:
                     event=EventData(
                         type=EventType.STEP_START,
                         step_name=name,
-                        metadata=data
+                        metadata=steps.on_start(raw_event)
                     ),
                     run_id=run_id,
                     thread_id=thread_id
@@ -127,7 +265,7 @@ class LangGraphEventProcessor:
                     event=EventData(
                         type=EventType.STEP_END,
                         step_name=name,
-                        metadata=data
+                        metadata=steps.on_end(raw_event)
                     ),
                     run_id=run_id,
                     thread_id=thread_id
@@ -146,7 +284,7 @@ class LangGraphEventProcessor:
                 )
 
         except Exception as e:
-            event_logger.error(f"Error formatting event: {e}")
+            event_logger.error("Error formatting event: %s", e)
             return StreamEvent(
                 event=EventData(
                     type=EventType.ERROR,
@@ -162,22 +300,32 @@ class LangGraphEventProcessor:
 class LangGraphHandler:
     """LangGraph 处理器，用于标准化调用和响应处理"""
 
-    def __init__(self, graph, debug_mode: bool = False):
+    def __init__(self, graph, debug_mode: bool = False, agent_name: Optional[str] = None):
         """
         初始化处理器
         Args:
             graph: 编译后的 LangGraph 实例
             debug_mode: 是否启用调试模式
+            agent_name: 代理名称，用于缓存等按代理区分的配置
         """
         self.graph = graph
+        self.agent_name = agent_name or getattr(graph, "name", "agent")
+        # 未携带 thread_id 的请求使用不带 checkpointer 的副本，避免为一次性会话写 checkpoint
+        self.checkpointer = getattr(graph, "checkpointer", None)
+        self.stateless_graph = graph.copy(update={"checkpointer": None}) if self.checkpointer else graph
         self.event_processor = LangGraphEventProcessor(debug_mode)
+        self.stream_filters = self.event_processor.stream_filters(graph)
 
     def _prepare_state(self, request: ChatRequest) -> AgentState:
         """准备 LangGraph 状态"""
         # 转换消息格式
         messages = [msg.to_langchain_message() for msg in request.messages] if request.messages else []
+        # 提前分配 id：add_messages 会在运行中原地补 id，StepTracker 以 id 去重，没有 id 的输入消息会被重复计入增量
+        for message in messages:
+            if message.id is None:
+                message.id = str(uuid.uuid4())
 
-        print(f"_prepare_state: {request}")
+        event_logger.debug("_prepare_state: %s", Lazy(request))
         # 构建初始状态
         state = AgentState(
             provider=request.provider,
@@ -190,64 +338,203 @@ class LangGraphHandler:
 
         return state
 
-    async def stream(self, request: ChatRequest) -> AsyncIterator[str]:
-        """流式调用 LangGraph - 优雅的事件处理"""
+    def _resolve_thread(self, request: ChatRequest) -> Tuple[Any, str, bool]:
+        """返回 (要运行的图, thread_id, 是否为持久化会话)"""
+        if request.thread_id and self.checkpointer is not None:
+            return self.graph, request.thread_id, True
+        if request.thread_id:
+            # 没有配置 checkpointer 时服务端不保存历史，只带新消息的客户端会丢失上下文
+            event_logger.warning(
+                "thread_id sent but no checkpointer is configured, running without server-side history",
+                extra={"agent": self.agent_name, "thread_id": request.thread_id},
+            )
+        return self.stateless_graph, str(uuid.uuid4()), False
+
+    @staticmethod
+    def _run_options(graph) -> Dict[str, Any]:
+        """只有持久化会话（带 checkpointer 的图）才传 durability，没有 checkpointer 时传入会触发 UserWarning"""
+        return {"durability": CHECKPOINT_DURABILITY} if getattr(graph, "checkpointer", None) is not None else {}
+
+    def _prepare_config(self, request: ChatRequest, run_id: str, thread_id: str) -> Dict[str, Any]:
+        """准备 LangGraph 运行配置"""
+        config = request.config or {}
+        config.update({
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": "",
+                "run_id": run_id,
+                **config.get("configurable", {})
+            }
+        })
+        return config
+
+    async def _iter_events(
+        self,
+        graph,
+        state: AgentState,
+        config: Dict[str, Any],
+        run_id: str,
+        thread_id: str,
+        options: StreamOptions,
+        metrics: Optional[RunMetrics] = None,
+        trace: Optional[RunTrace] = None,
+    ) -> AsyncIterator[StreamEvent]:
+        """运行 LangGraph 并产出过滤、格式化后的事件"""
+        steps = StepTracker(full_state=options.full_state)
+        raw_count = forwarded_count = 0
+        # 显式关闭事件流，提前结束（断开连接、超出预算）时立即取消图运行
+        async with aclosing(graph.astream_events(
+                state, config=config, version="v2", **self._run_options(graph), **self.stream_filters
+        )) as raw_events:
+            async for raw_event in raw_events:
+                raw_count += 1
+                if metrics is not None:
+                    metrics.on_raw_event(raw_event)
+                if trace is not None:
+                    trace.on_raw_event(raw_event)
+                # 按采样率记录原始事件，参数延迟格式化并截断
+                if raw_event_sampler() and event_logger.isEnabledFor(logging.INFO):
+                    event_logger.info("Raw event: %s", Lazy(raw_event))
+
+                # 过滤和格式化事件
+                if self.event_processor._should_forward_event(raw_event):
+                    formatted_event = self.event_processor._format_event(raw_event, run_id, thread_id, steps)
+
+                    if formatted_event:
+                        forwarded_count += 1
+                        yield formatted_event
+
+        event_logger.info(
+            "Run events", extra={"run_id": run_id, "raw_events": raw_count, "forwarded_events": forwarded_count}
+        )
+
+    async def _record_events(self, events: AsyncIterator[StreamEvent], recorder: RunRecorder) -> AsyncIterator[StreamEvent]:
+        """边转发边记录事件，供响应缓存回放"""
+        async for event in events:
+            recorder.add(event.event.model_dump(mode="json", exclude={"timestamp"}))
+            yield event
+
+    async def _replay_events(self, frames: list, run_id: str, thread_id: str, paced: bool) -> AsyncIterator[StreamEvent]:
+        """以新的 run_id / thread_id 回放缓存的事件"""
+        async for payload in replay_frames(frames, paced):
+            yield StreamEvent(event=EventData(**payload), run_id=run_id, thread_id=thread_id)
+
+    async def stream(self, request: ChatRequest, is_disconnected: Optional[DisconnectCheck] = None) -> AsyncIterator[str]:
+        """
+        流式调用 LangGraph - 优雅的事件处理
+        is_disconnected: 检查客户端是否已断开，断开时取消图运行及正在进行的 provider 请求
+        """
+        writer = SSEWriter()
+        options = request.stream_options or StreamOptions()
+        # 断开可能发生在缓存查询等任何 await 处，异常分支用到的变量先初始化
+        run_id = thread_id = events = metrics = trace = None
+        trace_status = "ok"
         try:
+            graph, thread_id, persistent = self._resolve_thread(request)
+
+            # 查询响应缓存（需在 config 被修改之前计算键）
+            # 持久化会话的输出依赖服务端保存的历史，不参与缓存
+            cache_key = cached = recorder = None
+            if options.cache and not persistent and response_cache.enabled_for(self.agent_name):
+                cache_key = request_cache_key("events", self.agent_name, request)
+                cached = await response_cache.get(cache_key)
+
             state = self._prepare_state(request)
 
             # 生成运行 ID
             run_id = str(uuid.uuid4())
-            thread_id = str(uuid.uuid4())
 
             # 准备配置
-            config = request.config or {}
-            config.update({
-                "configurable": {
-                    "thread_id": thread_id,
-                    "checkpoint_ns": "",
-                    "run_id": run_id,
-                    **config.get("configurable", {})
-                }
-            })
+            config = self._prepare_config(request, run_id, thread_id)
+            metrics = RunMetrics(self.agent_name, request.provider, "stream")
+            trace = tracer.start_run(
+                "agent.stream",
+                agent=self.agent_name, run_id=run_id, thread_id=thread_id,
+                provider=request.provider or "", model=request.model or "", cached=cached is not None,
+            )
 
             # 发送开始事件
             start_event = StreamEvent(
                 event=EventData(
                     type=EventType.CHAT_START,
                     content="开始处理对话",
-                    metadata={"messages_count": len(state["messages"])}
+                    metadata={"messages_count": len(state["messages"]), "cached": cached is not None}
                 ),
                 run_id=run_id,
                 thread_id=thread_id
             )
-            yield f"data: {start_event.model_dump_json()}\n\n"
-
-            # 处理 LangGraph 事件流
-            async for raw_event in self.graph.astream_events(state, config=config, version="v2"):
-                # 记录原始事件到日志
-                event_logger.info(f"Raw event: {raw_event}")
-
-                # 过滤和格式化事件
-                if self.event_processor._should_forward_event(raw_event):
-                    formatted_event = self.event_processor._format_event(raw_event, run_id, thread_id)
-
-                    if formatted_event:
-                        # 使用 Server-Sent Events 格式
-                        yield f"data: {formatted_event.model_dump_json()}\n\n"
+            yield writer.encode(start_event)
+
+            # 处理 LangGraph 事件流，缓存命中时直接回放
+            if cached is not None:
+                events = self._replay_events(cached, run_id, thread_id, options.replay_pacing)
+            else:
+                events = self._iter_events(graph, state, config, run_id, thread_id, options, metrics, trace)
+                if cache_key is not None:
+                    recorder = RunRecorder()
+                    events = self._record_events(events, recorder)
+            if options.parse_components:
+                events = parse_component_events(events, ComponentParser())
+            if options.coalesce_tokens:
+                events = coalesce_events(
+                    events,
+                    TokenCoalescer(options.coalesce_window_ms, options.coalesce_max_bytes),
+                )
+            if is_disconnected is not None:
+                events = cancel_on_disconnect(events, is_disconnected)
+
+            async for formatted_event in events:
+                # 使用 Server-Sent Events 格式
+                if trace is None or not trace.sample_write():
+                    yield writer.encode(formatted_event)
+                else:
+                    # 生成器在 yield 处挂起的时间即该帧写给客户端的耗时，只对抽样帧计时
+                    frame = writer.encode(formatted_event)
+                    written_at = time.perf_counter_ns()
+                    yield frame
+                    trace.add_write(time.perf_counter_ns() - written_at)
+
+            # 只缓存完整且没有错误事件的运行
+            if recorder is not None and all(payload["type"] != EventType.ERROR for _, payload in recorder.frames):
+                await response_cache.put(cache_key, self.agent_name, recorder.frames)
+            if persistent:
+                self.checkpointer.schedule_maintenance(thread_id)
+
+            stream_stats = writer.stats()
+            event_logger.info("Stream stats", extra={"run_id": run_id, **stream_stats})
 
             # 发送结束事件
             end_event = StreamEvent(
                 event=EventData(
                     type=EventType.CHAT_END,
-                    content="对话处理完成"
+                    content="对话处理完成",
+                    metadata={"stream_stats": stream_stats} if options.coalesce_tokens else None
                 ),
                 run_id=run_id,
                 thread_id=thread_id
             )
-            yield f"data: {end_event.model_dump_json()}\n\n"
+            yield writer.encode(end_event)
+
+        except ClientDisconnected:
+            # 客户端已离开：运行已取消，不缓存也不再发送任何事件
+            event_logger.info("Client disconnected, run cancelled", extra={"run_id": run_id, "agent": self.agent_name})
+            if metrics is not None:
+                metrics.error("disconnected")
+            trace_status = "cancelled"
+
+        except (GeneratorExit, asyncio.CancelledError):
+            event_logger.info("Client disconnected, run cancelled", extra={"run_id": run_id, "agent": self.agent_name})
+            if metrics is not None:
+                metrics.error("disconnected")
+            trace_status = "cancelled"
+            await cancel_stream(events)
+            raise
 
         except Exception as e:
-            event_logger.error(f"Error in stream: {e}")
+            event_logger.exception("Error in stream: %s", e)
+            if metrics is not None:
+                metrics.error("stream")
+            trace_status = "error"
 
             # 发送错误事件
             error_event = StreamEvent(
@@ -255,27 +542,161 @@ class LangGraphHandler:
                     type=EventType.ERROR,
                     content=f"处理过程中发生错误: {str(e)}"
                 ),
-                run_id=run_id if 'run_id' in locals() else str(uuid.uuid4()),
-                thread_id=thread_id if 'thread_id' in locals() else str(uuid.uuid4())
+                run_id=run_id or str(uuid.uuid4()),
+                thread_id=thread_id or str(uuid.uuid4())
             )
-            yield f"data: {error_event.model_dump_json()}\n\n"
+            yield writer.encode(error_event)
             raise e
 
+        finally:
+            if metrics is not None:
+                metrics.add_bytes(writer.bytes_sent)
+                metrics.finish()
+            if trace is not None:
+                trace.set_attribute("sse.bytes", writer.bytes_sent)
+                trace.finish(trace_status)
+            if events is not None:
+                await events.aclose()
 
-class OpenAICompatibleLangGraphHandler(LangGraphHandler):
-    """OpenAI 兼容的 LangGraph 处理器"""
 
-    def __init__(self, graph, debug_mode: bool = False):
-        super().__init__(graph, debug_mode)
-        self.completion_id = f"chatcmpl-{uuid.uuid4().hex[:20]}"
+class OpenAICompletion:
+    """单次 OpenAI 兼容 completion 的状态：响应 id、创建时间、输出文本和 token 用量"""
+
+    __slots__ = ("id", "created_at", "parts", "prompt_tokens", "completion_tokens")
+
+    def __init__(self):
+        self.id = f"chatcmpl-{uuid.uuid4().hex[:20]}"
         self.created_at = int(time.time())
-        self.completion_text = ""
+        self.parts: List[str] = []
         self.prompt_tokens = 0
         self.completion_tokens = 0
 
-    async def stream(self, openai_request: ChatRequest) -> AsyncIterator[str]:
-        """以 OpenAI 兼容格式流式处理请求"""
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+
+class OpenAICompatibleLangGraphHandler(LangGraphHandler):
+    """
+    OpenAI 兼容的 LangGraph 处理器
+    与 LangGraphHandler 一样按代理在启动时构建并在请求间复用，单次 completion 的状态放在 OpenAICompletion 中
+    """
+
+    # 缓存回放时没有真实的模型调用，用固定的 run 标识统计用量
+    REPLAY_RUN_ID = "replay"
+    # 只输出聊天模型的文本；工具和 METRICS_NODES 中节点的事件用于节点 / 工具耗时直方图和 trace
+    CONTENT_FILTERS = {"include_types": ["chat_model", "tool"], "include_names": sorted(METRICS_NODES)}
+
+    @staticmethod
+    def _message_text(message: Any) -> str:
+        content = getattr(message, "content", message)
+        if isinstance(content, tuple):
+            content = content[-1]
+        if isinstance(content, str):
+            return content
+        if isinstance(content, list):
+            return "".join(
+                block if isinstance(block, str) else str(block.get("text", ""))
+                for block in content
+            )
+        return str(content)
+
+    async def _iter_content(
+        self,
+        graph,
+        state: AgentState,
+        config: Dict[str, Any],
+        run_id: str,
+        usage: UsageTracker,
+        metrics: Optional[RunMetrics] = None,
+        trace: Optional[RunTrace] = None,
+    ) -> AsyncIterator[str]:
+        """运行 LangGraph 并产出聊天模型的文本增量，同时统计 token 用量"""
+        raw_count = forwarded_count = 0
+        # 显式关闭事件流，提前结束（断开连接、超出预算）时立即取消图运行
+        async with aclosing(graph.astream_events(
+                state, config=config, version="v2", **self.CONTENT_FILTERS, **self._run_options(graph)
+        )) as raw_events:
+            async for raw_event in raw_events:
+                raw_count += 1
+                if metrics is not None:
+                    metrics.on_raw_event(raw_event)
+                if trace is not None:
+                    trace.on_raw_event(raw_event)
+                event_type = raw_event.get("event")
+                model_run_id = raw_event.get("run_id", "")
+                chunk_data = raw_event.get("data", {})
+
+                if event_type == "on_chat_model_start":
+                    # 本地估算 prompt tokens，provider 返回用量后会被替换
+                    for message in chunk_data.get("input", {}).get("messages", []):
+                        # 聊天模型的输入通常是按批次嵌套的消息列表
+                        for item in message if isinstance(message, list) else [message]:
+                            usage.on_prompt(model_run_id, self._message_text(item))
+
+                elif event_type == "on_chat_model_end":
+                    output = chunk_data.get("output")
+                    usage.on_usage(model_run_id, getattr(output, "usage_metadata", None), final=True)
+
+                # 只处理聊天模型流式输出
+                elif event_type == "on_chat_model_stream":
+                    chunk = chunk_data.get("chunk", {})
+                    usage.on_usage(model_run_id, getattr(chunk, "usage_metadata", None))
+
+                    # 提取内容
+                    content = ""
+                    if hasattr(chunk, 'content'):
+                        content = chunk.content
+                    elif isinstance(chunk, dict):
+                        content = chunk.get("content", "")
+                    elif isinstance(chunk, str):
+                        content = chunk
+
+                    if content:
+                        usage.on_completion(model_run_id, content)
+                        forwarded_count += 1
+                        yield content
+
+        event_logger.info(
+            "Run events", extra={"run_id": run_id, "raw_events": raw_count, "forwarded_events": forwarded_count}
+        )
+
+    async def _replay_content(self, frames: list, paced: bool, usage: UsageTracker) -> AsyncIterator[str]:
+        async for content in replay_frames(frames, paced):
+            usage.on_completion(self.REPLAY_RUN_ID, content)
+            yield content
+
+    async def stream(
+        self,
+        openai_request: ChatRequest,
+        is_disconnected: Optional[DisconnectCheck] = None,
+        completion: Optional[OpenAICompletion] = None,
+    ) -> AsyncIterator[str]:
+        """以 OpenAI 兼容格式流式处理请求，客户端断开时取消运行；用量写入调用方传入的 completion"""
+        completion = completion or OpenAICompletion()
+        options = openai_request.stream_options or StreamOptions()
+        # 编码表首次加载可能需要下载，在线程中完成，避免计数时阻塞事件循环
+        await aget_encoder(openai_request.model)
+        usage = UsageTracker(openai_request.model)
+        token_budget = options.token_budget or REQUEST_TOKEN_BUDGET
+        finish_reason = "stop"
+        # 断开可能发生在缓存查询等任何 await 处，异常分支用到的变量先初始化
+        run_id = contents = metrics = trace = None
+        trace_status = "ok"
+        sent_bytes = 0
         try:
+            graph, thread_id, persistent = self._resolve_thread(openai_request)
+
+            # 查询响应缓存，持久化会话不参与缓存
+            cache_key = cached = recorder = None
+            if options.cache and not persistent and response_cache.enabled_for(self.agent_name):
+                cache_key = request_cache_key("openai", self.agent_name, openai_request)
+                cached = await response_cache.get(cache_key)
+
             # 转换为内部格式
             internal_request = convert_to_chat_request(openai_request)
 
@@ -285,27 +706,20 @@ class OpenAICompatibleLangGraphHandler(LangGraphHandler):
 
             # 生成运行 ID
             run_id = str(uuid.uuid4())
-            thread_id = str(uuid.uuid4())
 
             # 准备配置
-            config = internal_request.config or {}
-            config.update({
-                "configurable": {
-                    "thread_id": thread_id,
-                    "checkpoint_ns": "",
-                    "run_id": run_id,
-                    **config.get("configurable", {})
-                }
-            })
-
-            # 估算 prompt tokens（简单估算）
-            prompt_text = " ".join([msg.content for msg in openai_request.messages])
-            self.prompt_tokens = len(prompt_text.split()) * 1.3  # 粗略估算
+            config = self._prepare_config(internal_request, run_id, thread_id)
+            metrics = RunMetrics(self.agent_name, openai_request.provider, "openai_stream")
+            trace = tracer.start_run(
+                "agent.openai_stream",
+                agent=self.agent_name, run_id=run_id, thread_id=thread_id,
+                provider=openai_request.provider or "", model=openai_request.model, cached=cached is not None,
+            )
 
             # 发送初始流式响应
             initial_chunk = OpenAIChatCompletionStreamResponse(
-                id=self.completion_id,
-                created=self.created_at,
+                id=completion.id,
+                created=completion.created_at,
                 model=openai_request.model,
                 choices=[OpenAIChoice(
                     index=0,
@@ -313,60 +727,115 @@ class OpenAICompatibleLangGraphHandler(LangGraphHandler):
                     finish_reason=None
                 )]
             )
-            yield f"data: {initial_chunk.model_dump_json()}\n\n"
-
-            # 处理 LangGraph 事件流
-            async for raw_event in self.graph.astream_events(state, config=config, version="v2"):
-                # 只处理聊天模型流式输出
-                if raw_event.get("event") == "on_chat_model_stream":
-                    chunk_data = raw_event.get("data", {})
-                    chunk = chunk_data.get("chunk", {})
-
-                    # 提取内容
-                    content = ""
-                    if hasattr(chunk, 'content'):
-                        content = chunk.content
-                    elif isinstance(chunk, dict):
-                        content = chunk.get("content", "")
-                    elif isinstance(chunk, str):
-                        content = chunk
-
-                    if content:
-                        self.completion_text += content
-
-                        # 创建 OpenAI 格式的流式响应
-                        stream_chunk = OpenAIChatCompletionStreamResponse(
-                            id=self.completion_id,
-                            created=self.created_at,
-                            model=openai_request.model,
-                            choices=[OpenAIChoice(
-                                index=0,
-                                delta={"content": content},
-                                finish_reason=None
-                            )]
-                        )
-                        yield f"data: {stream_chunk.model_dump_json()}\n\n"
-
-            # 估算完成 tokens
-            self.completion_tokens = len(self.completion_text.split()) * 1.3
+            frame = f"data: {initial_chunk.model_dump_json()}\n\n"
+            sent_bytes += len(frame)
+            yield frame
+
+            # 每个 token 的 chunk 只有 delta 内容不同，预先编译固定部分
+            chunk_encoder = OpenAIChunkEncoder(completion.id, completion.created_at, openai_request.model)
+
+            # 处理 LangGraph 事件流，缓存命中时直接回放
+            if cached is not None:
+                for message in openai_request.messages or []:
+                    usage.on_prompt(self.REPLAY_RUN_ID, message.content)
+                contents = self._replay_content(cached, options.replay_pacing, usage)
+            else:
+                contents = self._iter_content(graph, state, config, run_id, usage, metrics, trace)
+                if cache_key is not None:
+                    recorder = RunRecorder()
+            if is_disconnected is not None:
+                contents = cancel_on_disconnect(contents, is_disconnected)
+
+            async for content in contents:
+                if recorder is not None:
+                    recorder.add(content)
+                completion.parts.append(content)
+
+                # 创建 OpenAI 格式的流式响应
+                frame = chunk_encoder.encode(content)
+                sent_bytes += len(frame.encode("utf-8"))
+                if trace is None or not trace.sample_write():
+                    yield frame
+                else:
+                    written_at = time.perf_counter_ns()
+                    yield frame
+                    trace.add_write(time.perf_counter_ns() - written_at)
+
+                # 超出单次请求的 token 预算时立即中止运行
+                if token_budget and usage.total_tokens > token_budget:
+                    finish_reason = "length"
+                    event_logger.warning(
+                        "Token budget exceeded",
+                        extra={"run_id": run_id, "token_budget": token_budget, "total_tokens": usage.total_tokens},
+                    )
+                    break
+
+            await contents.aclose()
+
+            if recorder is not None and finish_reason == "stop":
+                await response_cache.put(cache_key, self.agent_name, recorder.frames)
+            if persistent:
+                self.checkpointer.schedule_maintenance(thread_id)
+
+            completion.prompt_tokens = usage.prompt_tokens
+            completion.completion_tokens = usage.completion_tokens
 
             # 发送结束块
             final_chunk = OpenAIChatCompletionStreamResponse(
-                id=self.completion_id,
-                created=self.created_at,
+                id=completion.id,
+                created=completion.created_at,
                 model=openai_request.model,
                 choices=[OpenAIChoice(
                     index=0,
                     delta={},
-                    finish_reason="stop"
+                    finish_reason=finish_reason
                 )]
             )
-            yield f"data: {final_chunk.model_dump_json()}\n\n"
+            frame = f"data: {final_chunk.model_dump_json()}\n\n"
+            sent_bytes += len(frame)
+            yield frame
+
+            # 按 OpenAI 格式发送用量块（choices 为空）
+            if options.include_usage:
+                usage_chunk = OpenAIChatCompletionStreamResponse(
+                    id=completion.id,
+                    created=completion.created_at,
+                    model=openai_request.model,
+                    choices=[],
+                    usage=OpenAIUsage(
+                        prompt_tokens=completion.prompt_tokens,
+                        completion_tokens=completion.completion_tokens,
+                        total_tokens=completion.total_tokens,
+                    )
+                )
+                frame = f"data: {usage_chunk.model_dump_json()}\n\n"
+                sent_bytes += len(frame)
+                yield frame
 
             # 发送结束标记
+            sent_bytes += len("data: [DONE]\n\n")
             yield "data: [DONE]\n\n"
 
+        except ClientDisconnected:
+            event_logger.info("Client disconnected, run cancelled", extra={"run_id": run_id, "agent": self.agent_name})
+            if metrics is not None:
+                metrics.error("disconnected")
+            trace_status = "cancelled"
+
+        except (GeneratorExit, asyncio.CancelledError):
+            event_logger.info("Client disconnected, run cancelled", extra={"run_id": run_id, "agent": self.agent_name})
+            if metrics is not None:
+                metrics.error("disconnected")
+            trace_status = "cancelled"
+            await cancel_stream(contents)
+            raise
+
         except Exception as e:
+            if metrics is not None:
+                metrics.error("stream")
+            trace_status = "error"
+            if contents is not None:
+                await contents.aclose()
             # 发送错误块
             error_chunk = {
                 "error": {
@@ -375,5 +844,94 @@ class OpenAICompatibleLangGraphHandler(LangGraphHandler):
                     "code": None
                 }
             }
-            yield f"data: {json.dumps(error_chunk)}\n\n"
+            frame = f"data: {json.dumps(error_chunk)}\n\n"
+            sent_bytes += len(frame.encode("utf-8"))
+            yield frame
+
+        finally:
+            if metrics is not None:
+                metrics.add_bytes(sent_bytes)
+                metrics.finish()
+            if trace is not None:
+                trace.set_attribute("sse.bytes", sent_bytes)
+                trace.set_attribute("llm.prompt_tokens", usage.prompt_tokens)
+                trace.set_attribute("llm.completion_tokens", usage.completion_tokens)
+                trace.finish(trace_status)
+
+    async def complete(
+        self,
+        openai_request: ChatRequest,
+        is_disconnected: Optional[DisconnectCheck] = None,
+        completion: Optional[OpenAICompletion] = None,
+    ) -> OpenAIChatCompletionResponse:
+        """
+        非流式处理请求（stream=false）
+        直接 ainvoke 图并返回完整的 OpenAIChatCompletionResponse，不经过事件管线和 SSE 编码
+        客户端在完成前断开时取消运行并抛出 ClientDisconnected
+        """
+        completion = completion or OpenAICompletion()
+        internal_request = convert_to_chat_request(openai_request)
+        state = self._prepare_state(internal_request)
+
+        graph, thread_id, persistent = self._resolve_thread(internal_request)
+        run_id = str(uuid.uuid4())
+        config = self._prepare_config(internal_request, run_id, thread_id)
 
+        metrics = RunMetrics(self.agent_name, openai_request.provider, "openai_complete")
+        try:
+            result = await run_until_disconnected(
+                graph.ainvoke(state, config=config, **self._run_options(graph)), is_disconnected
+            )
+        except (ClientDisconnected, asyncio.CancelledError):
+            metrics.error("disconnected")
+            raise
+        except Exception:
+            metrics.error("complete")
+            raise
+        finally:
+            metrics.finish()
+        # 持久化会话的结果包含历史消息，只统计最后一条用户消息之后产生的消息
+        messages = result["messages"]
+        first_new = len(messages)
+        while first_new > 0 and getattr(messages[first_new - 1], "type", None) != "human":
+            first_new -= 1
+        new_messages = messages[first_new:]
+        if persistent:
+            self.checkpointer.schedule_maintenance(thread_id)
+
+        # 优先使用 provider 返回的用量，缺失时本地计数
+        await aget_encoder(openai_request.model)
+        usage = UsageTracker(openai_request.model)
+        answer = ""
+        for index, message in enumerate(new_messages):
+            if getattr(message, "type", None) != "ai":
+                continue
+            model_run_id = message.id or str(index)
+            usage_metadata = getattr(message, "usage_metadata", None)
+            if usage_metadata:
+                usage.on_usage(model_run_id, usage_metadata, final=True)
+            else:
+                for input_message in openai_request.messages or []:
+                    usage.on_prompt(model_run_id, input_message.content)
+                usage.on_completion(model_run_id, self._message_text(message))
+            answer = self._message_text(message)
+
+        completion.parts = [answer]
+        completion.prompt_tokens = usage.prompt_tokens
+        completion.completion_tokens = usage.completion_tokens
+
+        return OpenAIChatCompletionResponse(
+            id=completion.id,
+            created=completion.created_at,
+            model=openai_request.model,
+            choices=[OpenAIChoice(
+                index=0,
+                message=OpenAIMessage(role="assistant", content=answer),
+                finish_reason="stop"
+            )],
+            usage=OpenAIUsage(
+                prompt_tokens=completion.prompt_tokens,
+                completion_tokens=completion.completion_tokens,
+                total_tokens=completion.total_tokens,
+            )
+        )
@@ -0,0 +1,206 @@
+import logging
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from utils.env import get_env_variable
+from utils.metrics import MetricsRegistry, Sample
+
+logger = logging.getLogger(__name__)
+
+# 记录耗时的图节点
+METRICS_NODES = frozenset(
+    name.strip()
+    for name in get_env_variable("METRICS_NODES", "fast_path,chat_node,process_tools,generate_report").split(",")
+    if name.strip()
+)
+
+LABELS = ("agent", "provider")
+
+metrics_registry = MetricsRegistry()
+
+time_to_first_token = metrics_registry.histogram(
+    "genui_time_to_first_token_seconds",
+    "Time from the start of a run to the first streamed model token.",
+    LABELS,
+    buckets=(0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 8.0, 13.0, 21.0, 34.0),
+)
+inter_token_gap = metrics_registry.histogram(
+    "genui_inter_token_gap_seconds",
+    "Gap between consecutive tokens of the same model call.",
+    LABELS,
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+tokens_per_second = metrics_registry.histogram(
+    "genui_tokens_per_second",
+    "Streaming throughput of each model call after its first token.",
+    LABELS,
+    buckets=(5, 10, 20, 30, 40, 60, 80, 120, 160, 240, 320),
+)
+node_duration = metrics_registry.histogram(
+    "genui_node_duration_seconds",
+    "Duration of graph nodes.",
+    (*LABELS, "node"),
+)
+tool_duration = metrics_registry.histogram(
+    "genui_tool_duration_seconds",
+    "Duration of tool calls.",
+    (*LABELS, "tool"),
+)
+sse_bytes = metrics_registry.counter(
+    "genui_sse_bytes_total",
+    "Bytes of server-sent event frames sent to clients.",
+    LABELS,
+)
+streams = metrics_registry.counter(
+    "genui_streams_total",
+    "Runs started, by endpoint.",
+    (*LABELS, "endpoint"),
+)
+active_streams = metrics_registry.gauge(
+    "genui_active_streams",
+    "Runs currently streaming.",
+    LABELS,
+)
+errors = metrics_registry.counter(
+    "genui_errors_total",
+    "Failed, cancelled or rejected runs, by kind.",
+    (*LABELS, "kind"),
+)
+
+
+class RunMetrics:
+    """
+    单次运行的指标记录
+    标签子项在构造时解析一次，逐 token 的路径上只有时间戳比较和直方图 observe
+    """
+
+    __slots__ = (
+        "_ttft", "_gap", "_tps", "_bytes", "_active", "_labels", "started_at",
+        "_first_token", "_model_runs", "_spans", "_finished",
+    )
+
+    def __init__(self, agent: str, provider: Optional[str], endpoint: str):
+        self._labels = (agent, provider or "")
+        self._ttft = time_to_first_token.labels(*self._labels)
+        self._gap = inter_token_gap.labels(*self._labels)
+        self._tps = tokens_per_second.labels(*self._labels)
+        self._bytes = sse_bytes.labels(*self._labels)
+        self._active = active_streams.labels(*self._labels)
+        self.started_at = time.perf_counter()
+        self._first_token = False
+        # 模型调用 run_id -> [首 token 时间, 上一个 token 时间, token 数]
+        self._model_runs: Dict[str, List[Any]] = {}
+        # 节点 / 工具 run_id -> (开始时间, 直方图子项)
+        self._spans: Dict[str, Tuple[float, Any]] = {}
+        self._finished = False
+        streams.labels(*self._labels, endpoint).inc()
+        self._active.inc()
+
+    def on_raw_event(self, raw_event: Dict[str, Any]):
+        """从 astream_events 的原始事件中提取 token、节点和工具时间"""
+        event_type = raw_event.get("event")
+        if event_type == "on_chat_model_stream":
+            now = time.perf_counter()
+            if not self._first_token:
+                self._first_token = True
+                self._ttft.observe(now - self.started_at)
+            model_run = self._model_runs.get(raw_event.get("run_id", ""))
+            if model_run is None:
+                self._model_runs[raw_event.get("run_id", "")] = [now, now, 1]
+            else:
+                self._gap.observe(now - model_run[1])
+                model_run[1] = now
+                model_run[2] += 1
+        elif event_type == "on_chat_model_end":
+            model_run = self._model_runs.pop(raw_event.get("run_id", ""), None)
+            if model_run is not None and model_run[2] > 1 and model_run[1] > model_run[0]:
+                self._tps.observe((model_run[2] - 1) / (model_run[1] - model_run[0]))
+        elif event_type in ("on_chain_start", "on_tool_start"):
+            name = raw_event.get("name", "")
+            if event_type == "on_tool_start":
+                child = tool_duration.labels(*self._labels, name)
+            elif name in METRICS_NODES:
+                child = node_duration.labels(*self._labels, name)
+            else:
+                return
+            self._spans[raw_event.get("run_id", "")] = (time.perf_counter(), child)
+        elif event_type in ("on_chain_end", "on_tool_end"):
+            span = self._spans.pop(raw_event.get("run_id", ""), None)
+            if span is not None:
+                span[1].observe(time.perf_counter() - span[0])
+
+    def add_bytes(self, size: int):
+        self._bytes.inc(size)
+
+    def error(self, kind: str):
+        errors.labels(*self._labels, kind).inc()
+
+    def finish(self):
+        if not self._finished:
+            self._finished = True
+            self._active.dec()
+
+
+def record_error(agent: str, provider: Optional[str], kind: str):
+    """运行开始前的错误（例如准入被拒绝）"""
+    errors.labels(agent, provider or "", kind).inc()
+
+
+# 已有组件的 stats()，抓取时展开为 genui_component_stat 指标
+_component_stats: List[Tuple[str, Callable[[], Dict[str, Any]], Dict[str, str]]] = []
+
+
+def register_component_stats(component: str, stats: Callable[[], Dict[str, Any]], **labels: str):
+    _component_stats.append((component, stats, labels))
+
+
+def _flatten(prefix: str, value: Any) -> Iterable[Tuple[str, float]]:
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from _flatten(f"{prefix}_{key}" if prefix else str(key), item)
+    elif isinstance(value, bool):
+        yield prefix, float(value)
+    elif isinstance(value, (int, float)):
+        yield prefix, float(value)
+
+
+@metrics_registry.collector
+def _collect_component_stats():
+    samples: List[Sample] = []
+    for component, stats, labels in _component_stats:
+        try:
+            values = stats()
+        except Exception as e:
+            logger.warning("Failed to collect %s stats: %s", component, e)
+            continue
+        for stat, value in _flatten("", values):
+            samples.append(("genui_component_stat", {"component": component, **labels, "stat": stat}, value))
+    yield "genui_component_stat", "Internal counters reported by component stats().", "untyped", samples
+
+
+def _register_builtin_components():
+    from agents.checkpoint import checkpointer
+    from agents.context import context_manager
+    from agents.disconnect import disconnect_stats
+    from agents.fast_path import fast_path_routers
+    from agents.response_cache import response_cache
+    from agents.tracing import tracer
+    from agents.tools.stock import stock_data_cache
+    from llm import get_llm_client_stats
+    from llm.admission import admission_controller
+    from llm.providers.hedged import hedge_stats
+
+    register_component_stats("llm_clients", get_llm_client_stats)
+    register_component_stats("stock_data_cache", stock_data_cache.stats)
+    register_component_stats("response_cache", response_cache.stats)
+    register_component_stats("context_manager", context_manager.stats)
+    register_component_stats("fast_path", lambda: {name: router.stats() for name, router in fast_path_routers.items()})
+    register_component_stats("disconnect", disconnect_stats.stats)
+    register_component_stats("admission", admission_controller.stats)
+    register_component_stats("hedge", hedge_stats.stats)
+    register_component_stats("tracing", tracer.stats)
+    if checkpointer is not None:
+        register_component_stats("checkpointer", checkpointer.stats)
+
+
+_register_builtin_components()
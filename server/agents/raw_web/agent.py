@@ -1,26 +1,34 @@
+import logging
 import random
-from typing import List, Optional
+import time
 
-from langchain_openai import ChatOpenAI
 from datetime import datetime, timedelta
 
 from langchain_core.messages import ToolMessage
 from langchain_core.runnables import RunnableConfig
 from langgraph.graph import StateGraph, START, END
-from langgraph.graph.message import MessagesState
 from langchain_core.messages import SystemMessage
 from langchain_core.tools import tool
 
-class State(MessagesState):
-    steps: List[dict] = []
-    next_step: Optional[str]
+from agents.checkpoint import checkpointer
+from agents.context import context_manager
+from agents.fast_path import get_fast_path_router
+from agents.metrics import register_component_stats
+from agents.state import AgentState, get_llm_client
+from agents.tools.executor import ToolExecutor
+from agents.tools.tickers import speculative_tool_calls
+
+logger = logging.getLogger(__name__)
+
+class State(AgentState):
+    """provider / model 来自请求，节点通过 get_llm_client 取模型"""
 
 @tool
 def get_stock_data(stock_name: str) -> dict:
     """
         获取指定股票的数据
     """
-    print(f"get_stock_data: {stock_name}")
+    logger.info("get_stock_data: %s", stock_name)
 
     stock_data = {
         stock_name: []
@@ -62,28 +70,26 @@ def get_stock_data(stock_name: str) -> dict:
 
     return stock_data
 
-async def process_tools_node(state: State) -> State:
+tool_executor = ToolExecutor([get_stock_data])
+register_component_stats("tool_executor", tool_executor.stats, agent="raw_web")
+# 单一股票的分析请求跳过选择工具的模型调用
+fast_path = get_fast_path_router("raw_web")
+
+async def process_tools_node(state: State, config: RunnableConfig) -> State:
     """处理工具调用的节点"""
     # 获取最后一条消息
     last_message = state["messages"][-1]
 
     if hasattr(last_message, 'tool_calls') and last_message.tool_calls:
-        # 处理工具调用
-        tool_messages = []
-        for tool_call in last_message.tool_calls:
-            if tool_call['name'] == 'get_stock_data':
-                stock_name = tool_call['args']['stock_name']
-                result = get_stock_data(stock_name)
-                tool_messages.append(ToolMessage(
-                    content=str(result),
-                    tool_call_id=tool_call['id']
-                ))
+        # 并发执行工具调用，阻塞型工具在线程池中运行
+        tool_messages = await tool_executor.run(last_message.tool_calls, config)
 
         return {
             "messages": state["messages"] + tool_messages,
             "next_step": "generate_report"
         }
 
+    tool_executor.discard_prefetches(config)
     return {
         "messages": state["messages"],
         "next_step": "end"
@@ -127,13 +133,17 @@ async def generate_report(state: State) -> State:
     - Data of chart MUST keep origin format, NEVER ellipsize them.
     """
 
-    model = ChatOpenAI(model="gpt-4o")
+    # 完整的 HTML 报告较长，不使用默认的 max_tokens
+    model = get_llm_client(state, max_tokens=None)
 
     # Run the model to generate a response
-    response = await model.ainvoke([
-        SystemMessage(content=generate_role_define_prompt),
-        *state["messages"],
-    ], RunnableConfig(recursion_limit=25))
+    # 按模型预算裁剪历史：旧的工具结果和报告替换为摘要
+    response = await model.ainvoke(context_manager.prepare(
+        [SystemMessage(content=generate_role_define_prompt)],
+        state["messages"],
+        model=state["model"],
+        node="generate_report",
+    ), RunnableConfig(recursion_limit=25))
 
     messages = state["messages"] + [response]
 
@@ -142,7 +152,10 @@ async def generate_report(state: State) -> State:
         "next_step": "process_tools"
     }
 
-async def chat_node(state: State) -> State:
+async def chat_node(state: State, config: RunnableConfig) -> State:
+    # 推测性预取：模型决定调用工具之前，先开始拉取用户输入中出现的股票数据
+    tool_executor.prefetch(speculative_tool_calls(state), config)
+
     system_prompt = """
         You are a stock market analyst expert.
         You are given a stock ticker and a date.
@@ -156,14 +169,17 @@ async def chat_node(state: State) -> State:
         You will use the following tools:
         - get_stock_data: Get the stock data
     """
-    model = ChatOpenAI(model="gpt-4o")
-    model_with_tools = model.bind_tools([get_stock_data], parallel_tool_calls=False)
+    model_with_tools = get_llm_client(state).bind_tools([get_stock_data])
 
     # Run the model to generate a response
-    response = await model_with_tools.ainvoke([
-        SystemMessage(content=system_prompt),
-        *state["messages"],
-    ], RunnableConfig(recursion_limit=25))
+    started_at = time.perf_counter()
+    response = await model_with_tools.ainvoke(context_manager.prepare(
+        [SystemMessage(content=system_prompt)],
+        state["messages"],
+        model=state["model"],
+        node="chat_node",
+    ), RunnableConfig(recursion_limit=25))
+    fast_path.observe_llm_latency(time.perf_counter() - started_at)
 
     messages = state["messages"] + [response]
 
@@ -174,13 +190,17 @@ async def chat_node(state: State) -> State:
 
 workflow = StateGraph(State)
 
+workflow.add_node("fast_path", fast_path.node)
 workflow.add_node("chat_node", chat_node)
 workflow.add_node("process_tools", process_tools_node)
 workflow.add_node("generate_report", generate_report)
 
-workflow.set_entry_point("chat_node")
+workflow.set_entry_point("fast_path")
 
 # 添加路由逻辑
+def route_after_fast_path(state: State) -> str:
+    return state["next_step"]
+
 def route_after_chat(state: State) -> str:
     return state["next_step"]
 
@@ -190,7 +210,12 @@ def route_after_tools(state: State) -> str:
 def route_after_generate(state: State) -> str:
     return state["next_step"]
 
-workflow.add_edge(START, "chat_node")
+workflow.add_edge(START, "fast_path")
+
+workflow.add_conditional_edges("fast_path", route_after_fast_path, {
+    "process_tools": "process_tools",
+    "chat_node": "chat_node"
+})
 
 workflow.add_conditional_edges("chat_node", route_after_chat, {
     "process_tools": "process_tools",
@@ -207,4 +232,5 @@ workflow.add_conditional_edges("generate_report", route_after_generate, {
     "end": END
 })
 
-graph = workflow.compile()
+# checkpointer 为 None（未配置 CHECKPOINT_DB_PATH）时不持久化会话
+graph = workflow.compile(checkpointer=checkpointer)
@@ -0,0 +1,54 @@
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+from langgraph.graph.state import CompiledStateGraph
+
+from .langgraph_handler import LangGraphHandler, OpenAICompatibleLangGraphHandler
+
+
+class AgentRegistry:
+    """代理注册表：启动时一次性解析，请求路径上只做 O(1) 字典查找"""
+
+    def __init__(self, agents: Dict[str, CompiledStateGraph], default_agent: Optional[str] = None):
+        self._graphs: Dict[str, CompiledStateGraph] = dict(agents)
+        # LangGraphHandler 不持有请求级状态，可以预先构建并在请求间复用
+        self._handlers: Dict[str, LangGraphHandler] = {
+            name: LangGraphHandler(graph, agent_name=name) for name, graph in self._graphs.items()
+        }
+        # OpenAI 兼容处理器同样无请求级状态（单次 completion 的状态在 OpenAICompletion 中）
+        self._openai_handlers: Dict[str, OpenAICompatibleLangGraphHandler] = {
+            name: OpenAICompatibleLangGraphHandler(graph, agent_name=name) for name, graph in self._graphs.items()
+        }
+        self.names: Tuple[str, ...] = tuple(self._graphs)
+        self.default_agent = default_agent or (self.names[0] if self.names else "raw_web")
+        self.not_found_hint = f"Available agents: {list(self.names)}"
+
+    def __contains__(self, agent_name: str) -> bool:
+        return agent_name in self._graphs
+
+    def get_graph(self, agent_name: str) -> Optional[CompiledStateGraph]:
+        return self._graphs.get(agent_name)
+
+    def get_handler(self, agent_name: str) -> Optional[LangGraphHandler]:
+        return self._handlers.get(agent_name)
+
+    def get_openai_handler(self, agent_name: str) -> Optional[OpenAICompatibleLangGraphHandler]:
+        return self._openai_handlers.get(agent_name)
+
+    def resolve_model(self, model: Optional[str]) -> Tuple[str, Optional[str]]:
+        """
+        解析 "agent:model" 形式的模型名称
+        Returns:
+            (代理名称, 去掉代理前缀后的模型名称)
+        """
+        if not model:
+            return self.default_agent, model
+        return _split_model(model, self.default_agent)
+
+
+@lru_cache(maxsize=1024)
+def _split_model(model: str, default_agent: str) -> Tuple[str, str]:
+    agent_name, sep, model_name = model.partition(":")
+    if not sep:
+        return default_agent, model
+    return agent_name, model_name
@@ -0,0 +1,261 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from core.types.models import ChatRequest
+from utils.env import get_env_variable
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_MAX_BYTES = int(get_env_variable("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# 为空时不启用磁盘层
+RESPONSE_CACHE_DIR = get_env_variable("RESPONSE_CACHE_DIR", "")
+# 磁盘层的总字节数上限，超出时按最近使用顺序删除最旧的条目
+RESPONSE_CACHE_DISK_MAX_BYTES = int(get_env_variable("RESPONSE_CACHE_DISK_MAX_BYTES", str(512 * 1024 * 1024)))
+# 默认 TTL（秒），0 表示不缓存。代理的输出通常不确定，缓存需要按代理显式开启，
+# 客户端还要在 stream_options 中传 cache=true 才会读写缓存
+RESPONSE_CACHE_TTL = float(get_env_variable("RESPONSE_CACHE_TTL", "0"))
+# 按代理覆盖 TTL，例如 {"raw_web": 600, "enhanced_markdown": 0}
+RESPONSE_CACHE_AGENT_TTLS: Dict[str, float] = json.loads(get_env_variable("RESPONSE_CACHE_AGENT_TTLS", "{}"))
+
+# (相对运行开始的秒数, 事件负载)
+Frame = Tuple[float, Any]
+
+
+def request_cache_key(kind: str, agent_name: str, request: ChatRequest) -> str:
+    """对请求中影响输出的字段做规范化后取哈希"""
+    options = request.stream_options
+    canonical = {
+        "kind": kind,
+        "agent": agent_name,
+        "provider": request.provider,
+        "model": request.model,
+        "prompt": (request.prompt or "").strip(),
+        "messages": [
+            [message.role, " ".join(message.content.split())]
+            for message in request.messages or []
+        ],
+        "config": request.config or {},
+        "full_state": bool(options and options.full_state),
+    }
+    payload = json.dumps(canonical, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class RunRecorder:
+    """记录一次运行产出的事件负载及其相对时间"""
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.frames: List[Frame] = []
+
+    def add(self, payload: Any):
+        self.frames.append((round(time.monotonic() - self.started_at, 4), payload))
+
+
+async def replay_frames(frames: List[Frame], paced: bool = False) -> AsyncIterator[Any]:
+    """回放缓存的事件负载，paced=True 时按原始节奏输出"""
+    started_at = time.monotonic()
+    for offset, payload in frames:
+        if paced:
+            delay = offset - (time.monotonic() - started_at)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        yield payload
+
+
+class ResponseCache:
+    """
+    代理运行的精确匹配响应缓存
+    内存层按字节数做 LRU 淘汰，可选的磁盘层在进程重启后仍然有效
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = RESPONSE_CACHE_MAX_BYTES,
+        disk_dir: str = RESPONSE_CACHE_DIR,
+        disk_max_bytes: int = RESPONSE_CACHE_DISK_MAX_BYTES,
+        default_ttl: float = RESPONSE_CACHE_TTL,
+        agent_ttls: Optional[Dict[str, float]] = None,
+    ):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.default_ttl = default_ttl
+        self.agent_ttls = RESPONSE_CACHE_AGENT_TTLS if agent_ttls is None else agent_ttls
+        self._entries: "OrderedDict[str, Tuple[float, int, List[Frame]]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        # 磁盘层条目的大小，按最近使用排序
+        self._disk_entries: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+        self.disk_evictions = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._scan_disk()
+
+    def ttl_for(self, agent_name: str) -> float:
+        return float(self.agent_ttls.get(agent_name, self.default_ttl))
+
+    def enabled_for(self, agent_name: str) -> bool:
+        return self.ttl_for(agent_name) > 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _store_memory(self, key: str, expires_at: float, size: int, frames: List[Frame]):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (expires_at, size, frames)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def _scan_disk(self):
+        """启动时登记已有的磁盘条目，按修改时间从旧到新排列"""
+        entries = []
+        for entry in os.scandir(self.disk_dir):
+            if entry.name.endswith(".json") and entry.is_file():
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name[:-len(".json")], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk_entries[key] = size
+            self._disk_bytes += size
+        self._evict_disk()
+
+    def _forget_disk(self, key: str):
+        with self._lock:
+            size = self._disk_entries.pop(key, None)
+            if size is not None:
+                self._disk_bytes -= size
+
+    def _evict_disk(self):
+        """删除最久未使用的磁盘条目，直到总大小回到上限以内"""
+        while True:
+            with self._lock:
+                if self._disk_bytes <= self.disk_max_bytes or not self._disk_entries:
+                    return
+                key, size = self._disk_entries.popitem(last=False)
+                self._disk_bytes -= size
+                self.disk_evictions += 1
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def _read_disk(self, key: str) -> Optional[Tuple[float, int, List[Frame]]]:
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                raw = f.read()
+        except FileNotFoundError:
+            self._forget_disk(key)
+            return None
+        entry = json.loads(raw)
+        if entry["expires_at"] <= time.time():
+            os.remove(self._path(key))
+            self._forget_disk(key)
+            return None
+        with self._lock:
+            if key in self._disk_entries:
+                self._disk_entries.move_to_end(key)
+        return entry["expires_at"], len(raw), [tuple(frame) for frame in entry["frames"]]
+
+    def _write_disk(self, key: str, serialized: str):
+        size = len(serialized.encode("utf-8"))
+        if size > self.disk_max_bytes:
+            return
+        tmp_path = f"{self._path(key)}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(serialized)
+        os.replace(tmp_path, self._path(key))
+        with self._lock:
+            self._disk_bytes += size - self._disk_entries.pop(key, 0)
+            self._disk_entries[key] = size
+        self._evict_disk()
+
+    async def get(self, key: str) -> Optional[List[Frame]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.time():
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    return entry[2]
+                del self._entries[key]
+                self._bytes -= entry[1]
+
+        if self.disk_dir:
+            try:
+                entry = await asyncio.to_thread(self._read_disk, key)
+            except Exception as e:
+                logger.warning("Failed to read response cache entry %s: %s", key, e)
+                entry = None
+            if entry is not None:
+                self._store_memory(key, *entry)
+                with self._lock:
+                    self.disk_hits += 1
+                return entry[2]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    async def put(self, key: str, agent_name: str, frames: List[Frame]):
+        ttl = self.ttl_for(agent_name)
+        if ttl <= 0:
+            return
+        expires_at = time.time() + ttl
+        serialized = json.dumps(
+            {"agent": agent_name, "expires_at": expires_at, "frames": frames},
+            ensure_ascii=False,
+            separators=(",", ":"),
+        )
+        self._store_memory(key, expires_at, len(serialized), frames)
+        with self._lock:
+            self.stores += 1
+
+        if self.disk_dir:
+            try:
+                await asyncio.to_thread(self._write_disk, key, serialized)
+            except Exception as e:
+                logger.warning("Failed to write response cache entry %s: %s", key, e)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "disk_entries": len(self._disk_entries),
+                "disk_bytes": self._disk_bytes,
+                "disk_max_bytes": self.disk_max_bytes,
+                "disk_evictions": self.disk_evictions,
+                "hit_ratio": hits / lookups if lookups else 0.0,
+            }
+
+
+response_cache = ResponseCache()
@@ -1,6 +1,9 @@
-from typing import Annotated
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from fastapi.responses import StreamingResponse, JSONResponse
+import gzip
+import logging
+import math
+from typing import Annotated, AsyncIterator, Optional
+from fastapi import APIRouter, Depends, HTTPException, Request, status, Query
+from fastapi.responses import Response, StreamingResponse, JSONResponse
 from langgraph.graph.state import CompiledStateGraph
 
 from core.types.models import (
@@ -8,10 +11,22 @@ from core.types.models import (
     ErrorResponse,
 )
 from llm import import_clients
+from llm.tokens import aget_encoder
+from llm.admission import BATCH, INTERACTIVE, PRIORITIES, AdmissionRejected, Ticket, admission_controller, estimate_tokens
 
 from .raw_web.agent import graph as raw_web_graph
 from .l0.enhanced_markdown.agent import graph as enhanced_markdown_graph
-from .langgraph_handler import LangGraphHandler, OpenAICompatibleLangGraphHandler
+from .disconnect import ClientDisconnected, run_until_disconnected
+from .metrics import record_error
+from .langgraph_handler import LangGraphHandler, OpenAICompatibleLangGraphHandler, OpenAICompletion
+from .registry import AgentRegistry
+
+logger = logging.getLogger(__name__)
+
+# 非流式响应超过该大小且客户端支持时使用 gzip 压缩
+GZIP_MIN_BYTES = 1024
+# 客户端在响应完成前关闭连接（nginx 约定的状态码，只用于日志和访问统计）
+CLIENT_CLOSED_REQUEST = 499
 
 router = APIRouter(
     prefix="/api/agents",
@@ -25,34 +40,102 @@ AVAILABLE_AGENTS = {
     "enhanced_markdown": enhanced_markdown_graph,
 }
 
-def get_agent(agent_name: str) -> CompiledStateGraph:
+# 启动时一次性加载 LLM provider 并构建代理注册表，请求路径上不再重复扫描目录
+import_clients()
+agent_registry = AgentRegistry(AVAILABLE_AGENTS)
+
+
+def _json_response(body: str, http_request: Request) -> Response:
+    """构建 JSON 响应，按 Accept-Encoding 协商 gzip"""
+    content = body.encode("utf-8")
+    headers = {"Vary": "Accept-Encoding"}
+    if len(content) >= GZIP_MIN_BYTES and "gzip" in http_request.headers.get("accept-encoding", ""):
+        content = gzip.compress(content, compresslevel=5)
+        headers["Content-Encoding"] = "gzip"
+    return Response(content=content, media_type="application/json", headers=headers)
+
+async def _admit(request: ChatRequest, http_request: Request, default_priority: int) -> Ticket:
     """
-    依赖注入函数：根据代理名称获取对应的 CompiledStateGraph
+    在打开 provider 流之前申请容量
+    一次运行内的模型调用是串行的，整个运行占用一个并发名额，超出容量时在响应开始前就返回 429
     """
-    import_clients()
-    if agent_name not in AVAILABLE_AGENTS:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Agent '{agent_name}' not found. Available agents: {list(AVAILABLE_AGENTS.keys())}"
-        )
-    return AVAILABLE_AGENTS[agent_name]
+    priority = PRIORITIES[request.priority] if request.priority else default_priority
+    texts = [request.prompt or "", *(message.content for message in request.messages or [])]
+    # 估算和之后各节点的上下文裁剪都要用编码表，首次加载放到线程里，不阻塞事件循环
+    await aget_encoder(request.model)
+    return await run_until_disconnected(
+        admission_controller.admit(
+            request.provider, request.model, priority, estimate_tokens(texts, request.model)
+        ),
+        http_request.is_disconnected,
+    )
+
+
+def _rejected_response(error: AdmissionRejected, content: dict) -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        content=content,
+        headers={"Retry-After": str(math.ceil(error.retry_after))},
+    )
+
+
+class _AdmittedStreamingResponse(StreamingResponse):
+    """
+    持有准入名额的流式响应：整个响应结束时释放名额，OpenAI 兼容请求按 completion 的实际用量修正 token 桶
+    释放放在 __call__ 的 finally 里而不是 body 生成器里：客户端在 body 开始迭代前断开时，
+    生成器从未启动，它的 finally 也就不会执行
+    """
+
+    def __init__(
+        self, content: AsyncIterator[str], ticket: Ticket,
+        completion: Optional[OpenAICompletion] = None, **kwargs,
+    ):
+        super().__init__(content, **kwargs)
+        self.ticket = ticket
+        self.completion = completion
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            try:
+                # 断开时 Starlette 不会关闭 body 迭代器，这里关闭以便处理器结束运行并记下用量
+                await self.body_iterator.aclose()
+            finally:
+                used = self.completion.total_tokens if self.completion is not None else 0
+                self.ticket.release(used or None)
+
+
+def _agent_not_found(agent_name: str) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail=f"Agent '{agent_name}' not found. {agent_registry.not_found_hint}"
+    )
+
+async def get_agent(agent_name: str) -> LangGraphHandler:
+    """
+    依赖注入函数：根据代理名称获取预构建的处理器
+    声明为 async，避免 FastAPI 将同步依赖调度到线程池
+    """
+    handler = agent_registry.get_handler(agent_name)
+    if handler is None:
+        raise _agent_not_found(agent_name)
+    return handler
 
-def get_agent_from_query(agent_name: str = Query(..., description="代理名称")) -> CompiledStateGraph:
+async def get_agent_from_query(agent_name: str = Query(..., description="代理名称")) -> LangGraphHandler:
     """
     从查询参数获取代理
     """
-    return get_agent(agent_name)
+    return await get_agent(agent_name)
 
-def get_agent_from_model_or_query(
+async def get_agent_from_model_or_query(
     request: ChatRequest,
     agent_name: str = Query(None, description="代理名称，可选，如果不提供则从请求体或model字段解析")
-) -> CompiledStateGraph:
+) -> OpenAICompatibleLangGraphHandler:
     """
     从查询参数、请求体或模型名称获取代理
     优先级：查询参数 > 请求体agent_name > model字段解析
     """
-    import_clients()
-
     # 优先使用查询参数中的agent_name
     if agent_name:
         target_agent_name = agent_name
@@ -60,33 +143,36 @@ def get_agent_from_model_or_query(
     elif request.agent_name:
         target_agent_name = request.agent_name
     else:
-        # 最后从模型名称中提取代理名称
-        if ":" in request.model:
-            target_agent_name, model_name = request.model.split(":", 1)
-            # 更新请求中的模型名称
-            request.model = model_name
-        else:
-            # 默认使用第一个可用的代理
-            target_agent_name = list(AVAILABLE_AGENTS.keys())[0] if AVAILABLE_AGENTS else "raw_web"
-
-    if target_agent_name not in AVAILABLE_AGENTS:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Agent '{target_agent_name}' not found. Available agents: {list(AVAILABLE_AGENTS.keys())}"
-        )
+        # 最后从模型名称中提取代理名称，并更新请求中的模型名称
+        target_agent_name, request.model = agent_registry.resolve_model(request.model)
 
-    return AVAILABLE_AGENTS[target_agent_name]
+    handler = agent_registry.get_openai_handler(target_agent_name)
+    if handler is None:
+        raise _agent_not_found(target_agent_name)
+    return handler
 
 @router.post("/stream/{agent_name}")
-async def agent_stream(request: ChatRequest, agent: Annotated[CompiledStateGraph, Depends(get_agent)]):
+async def agent_stream(
+    request: ChatRequest,
+    http_request: Request,
+    handler: Annotated[LangGraphHandler, Depends(get_agent)]
+):
     """原有的流式端点"""
-    print(f"agent: {agent}")
+    logger.debug("agent: %s", handler.graph)
 
     try:
-        # 为注入的代理创建处理器
-        handler = LangGraphHandler(agent)
-        return StreamingResponse(
-            handler.stream(request),
+        ticket = await _admit(request, http_request, INTERACTIVE)
+    except AdmissionRejected as e:
+        record_error(handler.agent_name, request.provider, "rejected")
+        return _rejected_response(
+            e, ErrorResponse(error="Server is over capacity", detail=str(e)).model_dump()
+        )
+    except ClientDisconnected:
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
+
+    try:
+        return _AdmittedStreamingResponse(
+            handler.stream(request, http_request.is_disconnected), ticket,
             media_type="text/event-stream",
             headers={
                 "Cache-Control": "no-cache",
@@ -96,6 +182,7 @@ async def agent_stream(request: ChatRequest, agent: Annotated[CompiledStateGraph
             }
         )
     except Exception as e:
+        ticket.release()
         return JSONResponse(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             content=ErrorResponse(error="Stream processing failed", detail=str(e)).model_dump()
@@ -104,17 +191,28 @@ async def agent_stream(request: ChatRequest, agent: Annotated[CompiledStateGraph
 @router.post("/v1/chat/completions")
 async def openai_chat_completions(
     request: ChatRequest,
-    agent: Annotated[CompiledStateGraph, Depends(get_agent_from_model_or_query)]
+    http_request: Request,
+    handler: Annotated[OpenAICompatibleLangGraphHandler, Depends(get_agent_from_model_or_query)]
 ):
     """OpenAI 兼容的 /v1/chat/completions 端点"""
-    print(f"agent: {agent}")
+    logger.debug("agent: %s", handler.graph)
 
+    ticket = None
+    # 单次 completion 的 id 和用量，处理器本身在请求间复用
+    completion = OpenAICompletion()
     try:
-        # 创建 OpenAI 兼容的处理器
-        handler = OpenAICompatibleLangGraphHandler(agent)
-
-        return StreamingResponse(
-            handler.stream(request),
+        ticket = await _admit(request, http_request, BATCH if request.stream is False else INTERACTIVE)
+
+        # stream=false 时直接返回完整响应，不走 SSE
+        if request.stream is False:
+            try:
+                response = await handler.complete(request, http_request.is_disconnected, completion)
+            finally:
+                ticket.release(completion.total_tokens or None)
+            return _json_response(response.model_dump_json(), http_request)
+
+        return _AdmittedStreamingResponse(
+            handler.stream(request, http_request.is_disconnected, completion), ticket, completion,
             media_type="text/event-stream",
             headers={
                 "Cache-Control": "no-cache",
@@ -124,7 +222,19 @@ async def openai_chat_completions(
             }
         )
 
+    except AdmissionRejected as e:
+        record_error(handler.agent_name, request.provider, "rejected")
+        return _rejected_response(
+            e, {"error": {"message": str(e), "type": "rate_limit_error", "code": "rate_limit_exceeded"}}
+        )
+
+    except ClientDisconnected:
+        logger.info("Client disconnected before completion", extra={"agent": handler.agent_name})
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
+
     except Exception as e:
+        if ticket is not None:
+            ticket.release()
         # 返回 OpenAI 格式的错误响应
         error_response = {
             "error": {
@@ -0,0 +1,176 @@
+import asyncio
+import json
+import time
+from typing import AsyncIterator, Dict, List, Optional
+
+from core.types.models import (
+    EventData,
+    EventType,
+    OpenAIChatCompletionStreamResponse,
+    OpenAIChoice,
+    StreamEvent,
+)
+
+
+class SSEWriter:
+    """将 StreamEvent 编码为 SSE 帧，并统计帧数与传输字节数"""
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.frames = 0
+        self.tokens = 0
+        self.bytes_sent = 0
+        # 未合并时预计发送的字节数（按每个 token 单独成帧估算）
+        self.bytes_uncoalesced = 0
+
+    def encode(self, event: StreamEvent) -> str:
+        frame = f"data: {event.model_dump_json()}\n\n"
+        size = len(frame.encode("utf-8"))
+        self.frames += 1
+        self.bytes_sent += size
+
+        data = event.event
+        merged = (data.metadata or {}).get("tokens", 1) if data.type == EventType.CHAT_TOKEN else 0
+        if merged > 1:
+            content_size = len(json.dumps(data.content or "", ensure_ascii=False).encode("utf-8"))
+            envelope = size - content_size
+            self.bytes_uncoalesced += merged * envelope + content_size
+        else:
+            self.bytes_uncoalesced += size
+        self.tokens += merged
+        return frame
+
+    def stats(self) -> Dict[str, float]:
+        elapsed = max(time.monotonic() - self.started_at, 1e-9)
+        return {
+            "frames": self.frames,
+            "tokens": self.tokens,
+            "frames_per_sec": round(self.frames / elapsed, 2),
+            "bytes_sent": self.bytes_sent,
+            "bytes_saved": self.bytes_uncoalesced - self.bytes_sent,
+        }
+
+
+class TokenCoalescer:
+    """
+    合并连续的 CHAT_TOKEN 事件
+    在时间窗口到期、内容超过字节预算或遇到非 token 事件（工具/步骤边界）时立即刷新
+    """
+
+    def __init__(self, window_ms: int = 50, max_bytes: int = 4096):
+        self.window = window_ms / 1000
+        self.max_bytes = max_bytes
+        self._parts: List[str] = []
+        self._bytes = 0
+        self._since: Optional[float] = None
+        self._head: Optional[StreamEvent] = None
+
+    def deadline(self) -> Optional[float]:
+        """当前缓冲需要被刷新的时间点，没有缓冲时返回 None"""
+        return None if self._since is None else self._since + self.window
+
+    def push(self, event: StreamEvent) -> List[StreamEvent]:
+        if event.event.type != EventType.CHAT_TOKEN:
+            return self.flush() + [event]
+
+        out: List[StreamEvent] = []
+        # 不同模型节点的 token 不合并到同一帧
+        if self._head is not None and self._head.event.metadata != event.event.metadata:
+            out = self.flush()
+
+        content = event.event.content or ""
+        if self._head is None:
+            self._head = event
+            self._since = time.monotonic()
+        self._parts.append(content)
+        self._bytes += len(content.encode("utf-8"))
+
+        if self._bytes >= self.max_bytes:
+            out.extend(self.flush())
+        return out
+
+    def flush(self) -> List[StreamEvent]:
+        if self._head is None:
+            return []
+        head = self._head
+        merged = StreamEvent(
+            event=EventData(
+                type=EventType.CHAT_TOKEN,
+                content="".join(self._parts),
+                metadata={**(head.event.metadata or {}), "tokens": len(self._parts)},
+            ),
+            run_id=head.run_id,
+            thread_id=head.thread_id,
+        )
+        self._parts = []
+        self._bytes = 0
+        self._since = None
+        self._head = None
+        return [merged]
+
+
+async def coalesce_events(
+    events: AsyncIterator[StreamEvent],
+    coalescer: TokenCoalescer,
+) -> AsyncIterator[StreamEvent]:
+    """
+    以合并模式转发事件流
+    上游长时间没有新事件时，也会在时间窗口到期后刷新已缓冲的 token
+    """
+    iterator = events.__aiter__()
+    next_event: Optional[asyncio.Future] = None
+    try:
+        while True:
+            if next_event is None:
+                next_event = asyncio.ensure_future(iterator.__anext__())
+
+            deadline = coalescer.deadline()
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            done, _ = await asyncio.wait({next_event}, timeout=timeout)
+            if not done:
+                for event in coalescer.flush():
+                    yield event
+                continue
+
+            task, next_event = next_event, None
+            try:
+                event = task.result()
+            except StopAsyncIteration:
+                break
+            for out in coalescer.push(event):
+                yield out
+
+        for event in coalescer.flush():
+            yield event
+    finally:
+        if next_event is not None:
+            next_event.cancel()
+
+
+class OpenAIChunkEncoder:
+    """
+    预编译的 OpenAI 流式 chunk 编码器
+    id / created / model / object 在一次 completion 内不变，只序列化一次前缀和后缀，
+    每个 token 只需转义 delta 内容后拼接
+    """
+
+    _PLACEHOLDER = "__delta_content__"
+
+    def __init__(self, completion_id: str, created: int, model: str):
+        template = OpenAIChatCompletionStreamResponse(
+            id=completion_id,
+            created=created,
+            model=model,
+            choices=[OpenAIChoice(
+                index=0,
+                delta={"content": self._PLACEHOLDER},
+                finish_reason=None
+            )]
+        ).model_dump_json()
+        prefix, suffix = template.rsplit(json.dumps(self._PLACEHOLDER), 1)
+        self._prefix = "data: " + prefix
+        self._suffix = suffix + "\n\n"
+
+    def encode(self, content: str) -> str:
+        """编码一个 delta content chunk，结果与 Pydantic 的 model_dump_json 一致"""
+        return self._prefix + json.dumps(content, ensure_ascii=False) + self._suffix
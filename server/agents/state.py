@@ -1,3 +1,4 @@
+import logging
 from typing import List, Optional
 from langgraph.graph.message import MessagesState
 
@@ -5,6 +6,8 @@ from llm.base import BaseLLMClient
 from langchain_core.language_models import BaseChatModel
 from llm import LLM
 
+logger = logging.getLogger(__name__)
+
 class AgentState(MessagesState):
     provider: Optional[str] = "openai"
     model: Optional[str] = "gpt-4o"
@@ -13,7 +16,8 @@ class AgentState(MessagesState):
     next_step: Optional[str]
 
 
-def get_llm_client(state: AgentState) -> BaseChatModel:
-    llm = LLM(provider=state["provider"], model_name=state["model"])
-    print(f"get_llm_client: {llm}")
+def get_llm_client(state: AgentState, **kwargs) -> BaseChatModel:
+    """按请求的 provider / model 从客户端缓存取模型，kwargs 覆盖 LLM 的其余参数"""
+    llm = LLM(provider=state["provider"], model_name=state["model"], **kwargs)
+    logger.debug("get_llm_client: %s", llm)
     return llm.get_client()
\ No newline at end of file
@@ -0,0 +1,110 @@
+import csv
+import io
+import json
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.env import get_env_variable
+
+# 可选的工具结果编码：
+# - repr:     原始 str(result)，每行重复所有键名
+# - columnar: 表头 + 行数组的紧凑 JSON
+# - csv:      CSV，日期列只保留首个完整日期，后续为相对上一行的天数增量
+ENCODINGS = ("repr", "columnar", "csv")
+
+DEFAULT_TOOL_RESULT_ENCODING = get_env_variable("TOOL_RESULT_ENCODING", "columnar")
+
+# 按工具选择编码，未列出的工具使用默认编码
+TOOL_RESULT_ENCODINGS: Dict[str, str] = {
+    "get_stock_data": get_env_variable("STOCK_DATA_ENCODING", DEFAULT_TOOL_RESULT_ENCODING),
+}
+
+DATE_DELTA_NOTE = "date column: first value is an ISO date, following values are +days after the previous row"
+
+
+def _is_table(value: Any) -> bool:
+    """同构的字典列表（时间序列）才做列式编码"""
+    if not isinstance(value, list) or len(value) < 2 or not isinstance(value[0], dict):
+        return False
+    keys = value[0].keys()
+    return all(isinstance(row, dict) and row.keys() == keys for row in value)
+
+
+def _date_column(columns: List[str]) -> Optional[int]:
+    for index, column in enumerate(columns):
+        if column.lower() == "date":
+            return index
+    return None
+
+
+def _delta_dates(values: List[Any]) -> Optional[List[str]]:
+    try:
+        dates = [date.fromisoformat(str(value)[:10]) for value in values]
+    except ValueError:
+        return None
+    encoded = [dates[0].isoformat()]
+    for previous, current in zip(dates, dates[1:]):
+        encoded.append(f"{(current - previous).days:+d}")
+    return encoded
+
+
+def _table_matrix(rows: List[dict]) -> Tuple[List[str], List[List[Any]]]:
+    """按首行的键顺序取值；_is_table 比较键时不看顺序，不能直接用 row.values()"""
+    columns = list(rows[0].keys())
+    return columns, [[row[column] for column in columns] for row in rows]
+
+
+def _table_to_columnar(rows: List[dict]) -> Dict[str, Any]:
+    columns, matrix = _table_matrix(rows)
+    return {"columns": columns, "rows": matrix}
+
+
+def _table_to_csv(rows: List[dict]) -> str:
+    columns, matrix = _table_matrix(rows)
+
+    date_index = _date_column(columns)
+    note = ""
+    if date_index is not None:
+        deltas = _delta_dates([row[date_index] for row in matrix])
+        if deltas is not None:
+            for row, value in zip(matrix, deltas):
+                row[date_index] = value
+            note = f"# {DATE_DELTA_NOTE}\n"
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(columns)
+    writer.writerows(matrix)
+    return note + buffer.getvalue()
+
+
+def _compact(value: Any, encoding: str) -> Any:
+    if _is_table(value):
+        return _table_to_csv(value) if encoding == "csv" else _table_to_columnar(value)
+    if isinstance(value, dict):
+        return {key: _compact(item, encoding) for key, item in value.items()}
+    return value
+
+
+def encode_tool_result(tool_name: str, result: Any, encoding: Optional[str] = None) -> str:
+    """
+    将工具结果编码为 ToolMessage 内容
+    时间序列（同构的字典列表）按工具配置的编码压缩，其余结构保持不变
+    """
+    encoding = encoding or TOOL_RESULT_ENCODINGS.get(tool_name, DEFAULT_TOOL_RESULT_ENCODING)
+    if encoding == "repr":
+        return str(result)
+
+    compacted = _compact(result, encoding)
+    if isinstance(compacted, str):
+        return compacted
+    if encoding == "csv" and isinstance(compacted, dict):
+        # CSV 表格以分段文本输出，避免在 JSON 中再转义一遍换行
+        parts = []
+        for key, item in compacted.items():
+            if isinstance(item, str) and "\n" in item:
+                parts.append(f"## {key}\n{item}")
+            else:
+                parts.append(f"## {key}\n{json.dumps(item, ensure_ascii=False, separators=(',', ':'), default=str)}")
+        return "\n".join(parts)
+    return json.dumps(compacted, ensure_ascii=False, separators=(",", ":"), default=str)
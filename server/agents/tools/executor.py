@@ -0,0 +1,284 @@
+import asyncio
+import contextvars
+import json
+import logging
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import ToolMessage
+from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables.config import get_async_callback_manager_for_config
+from langchain_core.tools import BaseTool, StructuredTool, Tool
+
+from agents.tools.encoding import encode_tool_result
+from utils.env import get_env_variable
+
+logger = logging.getLogger(__name__)
+
+TOOL_EXECUTOR_MAX_WORKERS = int(get_env_variable("TOOL_EXECUTOR_MAX_WORKERS", "8"))
+TOOL_TIMEOUT_SECONDS = float(get_env_variable("TOOL_TIMEOUT_SECONDS", "30"))
+TOOL_MAX_CONCURRENCY = int(get_env_variable("TOOL_MAX_CONCURRENCY", "4"))
+TOOL_PREFETCH_ENABLED = get_env_variable("TOOL_PREFETCH_ENABLED", "true").lower() == "true"
+# 预取结果在未被使用时保留的秒数
+TOOL_PREFETCH_TTL_SECONDS = float(get_env_variable("TOOL_PREFETCH_TTL_SECONDS", "60"))
+
+# 所有阻塞型工具共享一个有上限的线程池，避免阻塞事件循环
+_blocking_pool = ThreadPoolExecutor(
+    max_workers=TOOL_EXECUTOR_MAX_WORKERS,
+    thread_name_prefix="tool-executor",
+)
+
+# (运行 ID, 工具名, 规范化参数)
+CallKey = Tuple[str, str, str]
+
+
+def _run_key(config: Optional[RunnableConfig]) -> Optional[str]:
+    """预取按运行隔离；没有 run_id 时无法区分并发请求，不做预取"""
+    run_id = (config or {}).get("configurable", {}).get("run_id")
+    return str(run_id) if run_id else None
+
+
+def _call_key(run_key: str, name: str, args: Dict[str, Any]) -> CallKey:
+    return run_key, name, json.dumps(args, sort_keys=True, default=str)
+
+
+class _Prefetch:
+    __slots__ = ("task", "started_at", "finished_at", "timer")
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.started_at = time.monotonic()
+        self.finished_at: Optional[float] = None
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class ToolExecutor:
+    """
+    通用工具执行阶段
+    - 按名称索引分发工具调用
+    - 相互独立的工具调用并发执行
+    - 同步（阻塞）工具放到有上限的线程池中运行
+    - 每个工具单独的超时和并发上限
+    - 推测性预取：模型决定调用工具之前先开始执行，调用参数一致时直接使用预取结果
+    """
+
+    def __init__(
+        self,
+        tools: Sequence[BaseTool],
+        timeouts: Optional[Dict[str, float]] = None,
+        concurrency: Optional[Dict[str, int]] = None,
+    ):
+        self.tools: Dict[str, BaseTool] = {tool.name: tool for tool in tools}
+        self.timeouts = timeouts or {}
+        self.concurrency = concurrency or {}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._prefetches: Dict[CallKey, _Prefetch] = {}
+        self.prefetch_started = 0
+        self.prefetch_hits = 0
+        self.prefetch_discarded = 0
+        self.prefetch_saved_seconds = 0.0
+
+    def _semaphore(self, name: str) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(name)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.concurrency.get(name, TOOL_MAX_CONCURRENCY))
+            self._semaphores[name] = semaphore
+        return semaphore
+
+    @staticmethod
+    def is_blocking(tool: BaseTool) -> bool:
+        # @tool 生成的 StructuredTool / Tool 覆盖了 _arun，没有 coroutine 时仍是在默认线程池里跑同步函数
+        if isinstance(tool, (StructuredTool, Tool)):
+            return tool.coroutine is None
+        return type(tool)._arun is BaseTool._arun
+
+    async def _invoke(
+        self, tool: BaseTool, args: Dict[str, Any], config: Optional[RunnableConfig], timeout: Optional[float]
+    ) -> Any:
+        """
+        在工具的并发上限内执行一次调用
+        线程池中的阻塞调用无法中断：超时或取消时调用方立即返回，但名额一直占用到线程真正结束，
+        上游变慢时同一工具最多占用并发上限个线程，不会堆满共享线程池
+        """
+        semaphore = self._semaphore(tool.name)
+        await semaphore.acquire()
+        if not self.is_blocking(tool):
+            try:
+                return await asyncio.wait_for(tool.ainvoke(args, config), timeout)
+            finally:
+                semaphore.release()
+
+        # 复制上下文，让线程中的工具调用仍然挂在当前 run 的回调上（产生 on_tool_* 事件）
+        context = contextvars.copy_context()
+        loop = asyncio.get_running_loop()
+        try:
+            future = loop.run_in_executor(_blocking_pool, context.run, tool.invoke, args, config)
+        except BaseException:
+            semaphore.release()
+            raise
+
+        def release(done: asyncio.Future):
+            semaphore.release()
+            if not done.cancelled():
+                # 调用方已经超时离开时取出异常，避免 "Future exception was never retrieved" 警告
+                done.exception()
+
+        future.add_done_callback(release)
+        # shield：取消的只是等待，future 保持到线程结束才完成并释放名额
+        return await asyncio.wait_for(asyncio.shield(future), timeout)
+
+    def prefetch(self, tool_calls: List[Dict[str, Any]], config: Optional[RunnableConfig] = None):
+        """
+        推测性地提前执行工具调用（不产生回调事件）
+        之后同一次运行中参数相同的调用会直接使用该结果，未被使用的预取会被取消
+        """
+        run_key = _run_key(config)
+        if not TOOL_PREFETCH_ENABLED or run_key is None:
+            return
+        loop = asyncio.get_running_loop()
+        # 显式清空回调，预取不应出现在事件流中
+        silent_config = {**(config or {}), "callbacks": []}
+        for tool_call in tool_calls:
+            tool = self.tools.get(tool_call["name"])
+            key = _call_key(run_key, tool_call["name"], tool_call["args"])
+            if tool is None or key in self._prefetches:
+                continue
+
+            entry = _Prefetch()
+
+            async def run(tool=tool, args=tool_call["args"], entry=entry):
+                try:
+                    return await self._invoke(tool, args, silent_config, self.timeouts.get(tool.name, TOOL_TIMEOUT_SECONDS))
+                finally:
+                    entry.finished_at = time.monotonic()
+
+            entry.task = asyncio.create_task(run())
+            entry.timer = loop.call_later(TOOL_PREFETCH_TTL_SECONDS, self._discard, key)
+            self._prefetches[key] = entry
+            self.prefetch_started += 1
+
+    def _discard(self, key: CallKey):
+        entry = self._prefetches.pop(key, None)
+        if entry is None:
+            return
+        entry.timer.cancel()
+        if not entry.task.done():
+            # 线程池中的阻塞调用无法中断，取消后并发名额保留到线程结束
+            entry.task.cancel()
+        elif not entry.task.cancelled():
+            # 取出异常，避免 "Task exception was never retrieved" 警告
+            entry.task.exception()
+        self.prefetch_discarded += 1
+
+    def discard_prefetches(self, config: Optional[RunnableConfig] = None):
+        """丢弃本次运行中未被使用的预取"""
+        run_key = _run_key(config)
+        if run_key is None:
+            return
+        for key in [key for key in self._prefetches if key[0] == run_key]:
+            self._discard(key)
+
+    def _take_prefetch(self, name: str, args: Dict[str, Any], config: Optional[RunnableConfig]) -> Optional[_Prefetch]:
+        run_key = _run_key(config)
+        if run_key is None:
+            return None
+        entry = self._prefetches.pop(_call_key(run_key, name, args), None)
+        if entry is None:
+            return None
+        entry.timer.cancel()
+        # 节省的时间：预取在真正需要之前已经运行的时长
+        saved = (entry.finished_at or time.monotonic()) - entry.started_at
+        self.prefetch_hits += 1
+        self.prefetch_saved_seconds += saved
+        logger.info(
+            "Tool prefetch hit",
+            extra={"tool": name, "run_id": run_key, "saved_ms": round(saved * 1000, 1)},
+        )
+        return entry
+
+    async def _use_prefetch(
+        self,
+        tool: BaseTool,
+        args: Dict[str, Any],
+        entry: _Prefetch,
+        config: Optional[RunnableConfig],
+    ) -> Any:
+        """等待预取结果，并补发工具回调，使事件流与正常执行一致"""
+        callback_manager = get_async_callback_manager_for_config(config or {})
+        run_manager = await callback_manager.on_tool_start(
+            {"name": tool.name, "description": tool.description},
+            json.dumps(args, default=str),
+            name=tool.name,
+            inputs=args,
+        )
+        try:
+            result = await entry.task
+        except BaseException as e:
+            await run_manager.on_tool_error(e)
+            raise
+        await run_manager.on_tool_end(result)
+        return result
+
+    async def _execute(self, tool_call: Dict[str, Any], config: Optional[RunnableConfig]) -> ToolMessage:
+        name = tool_call["name"]
+        tool = self.tools.get(name)
+        if tool is None:
+            return ToolMessage(
+                content=f"Error: tool '{name}' not found. Available tools: {list(self.tools)}",
+                tool_call_id=tool_call["id"],
+                name=name,
+                id=str(uuid.uuid4()),
+                status="error",
+            )
+
+        timeout = self.timeouts.get(name, TOOL_TIMEOUT_SECONDS)
+        prefetched = self._take_prefetch(name, tool_call["args"], config)
+        try:
+            if prefetched is not None:
+                result = await asyncio.wait_for(self._use_prefetch(tool, tool_call["args"], prefetched, config), timeout)
+            else:
+                result = await self._invoke(tool, tool_call["args"], config, timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Tool %s timed out after %ss", name, timeout)
+            return ToolMessage(
+                content=f"Error: tool '{name}' timed out after {timeout}s",
+                tool_call_id=tool_call["id"],
+                name=name,
+                id=str(uuid.uuid4()),
+                status="error",
+            )
+        except Exception as e:
+            logger.exception("Tool %s failed", name)
+            return ToolMessage(
+                content=f"Error: tool '{name}' failed: {e}",
+                tool_call_id=tool_call["id"],
+                name=name,
+                id=str(uuid.uuid4()),
+                status="error",
+            )
+
+        # 构造时就分配 id：否则 add_messages 之后才补上，步骤增量会把同一条消息当作新消息再发一次
+        return ToolMessage(
+            content=encode_tool_result(name, result),
+            tool_call_id=tool_call["id"],
+            name=name,
+            id=str(uuid.uuid4()),
+        )
+
+    async def run(self, tool_calls: List[Dict[str, Any]], config: Optional[RunnableConfig] = None) -> List[ToolMessage]:
+        """并发执行一组工具调用，结果顺序与调用顺序一致"""
+        results = list(await asyncio.gather(*(self._execute(tool_call, config) for tool_call in tool_calls)))
+        # 与模型实际调用不匹配的预取不再需要
+        self.discard_prefetches(config)
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "prefetch_started": self.prefetch_started,
+            "prefetch_hits": self.prefetch_hits,
+            "prefetch_discarded": self.prefetch_discarded,
+            "prefetch_hit_ratio": self.prefetch_hits / self.prefetch_started if self.prefetch_started else 0.0,
+            "prefetch_saved_seconds": self.prefetch_saved_seconds,
+        }
@@ -0,0 +1,148 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from utils.env import get_env_variable
+
+MARKET_TIMEZONE = ZoneInfo("America/New_York")
+MARKET_OPEN = (9, 30)
+MARKET_CLOSE = (16, 0)
+
+# 开盘期间行情持续变化，缓存时间较短；休市期间数据不变，缓存到下次开盘（有上限）
+MARKET_DATA_TTL_OPEN = float(get_env_variable("MARKET_DATA_TTL_OPEN", "60"))
+MARKET_DATA_TTL_CLOSED_MAX = float(get_env_variable("MARKET_DATA_TTL_CLOSED_MAX", "21600"))
+MARKET_DATA_CACHE_SIZE = int(get_env_variable("MARKET_DATA_CACHE_SIZE", "256"))
+
+Fetcher = Callable[[str, date, date], Any]
+
+
+def is_market_open(now: datetime) -> bool:
+    local = now.astimezone(MARKET_TIMEZONE)
+    if local.weekday() >= 5:
+        return False
+    return MARKET_OPEN <= (local.hour, local.minute) < MARKET_CLOSE
+
+
+def seconds_until_next_open(now: datetime) -> float:
+    local = now.astimezone(MARKET_TIMEZONE)
+    candidate = local.replace(hour=MARKET_OPEN[0], minute=MARKET_OPEN[1], second=0, microsecond=0)
+    if candidate <= local:
+        candidate += timedelta(days=1)
+    while candidate.weekday() >= 5:
+        candidate += timedelta(days=1)
+    return (candidate - local).total_seconds()
+
+
+def market_aware_ttl(now: datetime) -> float:
+    """根据交易时段计算缓存有效期（秒）"""
+    if is_market_open(now):
+        return MARKET_DATA_TTL_OPEN
+    return min(seconds_until_next_open(now), MARKET_DATA_TTL_CLOSED_MAX)
+
+
+class MarketDataCache:
+    """
+    行情数据缓存
+    - 以 (ticker, start, end) 为键
+    - 按交易时段计算 TTL
+    - LRU 淘汰，容量有上限
+    - single-flight：同一键的并发 miss 只触发一次上游请求，其余调用等待同一结果
+    """
+
+    def __init__(
+        self,
+        fetcher: Fetcher,
+        maxsize: int = MARKET_DATA_CACHE_SIZE,
+        ttl: Callable[[datetime], float] = market_aware_ttl,
+        clock: Callable[[], datetime] = lambda: datetime.now(MARKET_TIMEZONE),
+    ):
+        self.fetcher = fetcher
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.fetches = 0
+        self.fetch_errors = 0
+        self.fetch_seconds_total = 0.0
+        self.fetch_seconds_max = 0.0
+
+    def get(self, ticker: str, start: date, end: date) -> Any:
+        key = (ticker.upper(), start, end)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+            self.misses += 1
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                inflight = Future()
+                self._inflight[key] = inflight
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            return inflight.result()
+
+        started_at = time.perf_counter()
+        try:
+            value = self.fetcher(key[0], start, end)
+        except BaseException as e:
+            with self._lock:
+                self.fetch_errors += 1
+                del self._inflight[key]
+            inflight.set_exception(e)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started_at
+            with self._lock:
+                self.fetches += 1
+                self.fetch_seconds_total += elapsed
+                self.fetch_seconds_max = max(self.fetch_seconds_max, elapsed)
+
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl(self.clock()), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            del self._inflight[key]
+        inflight.set_result(value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "upstream_fetches": self.fetches,
+                "upstream_errors": self.fetch_errors,
+                "upstream_latency_avg_ms": self.fetch_seconds_total / self.fetches * 1000 if self.fetches else 0.0,
+                "upstream_latency_max_ms": self.fetch_seconds_max * 1000,
+            }
@@ -1,6 +1,24 @@
+import logging
+
 from langchain_core.tools import tool
 from yahoo_finance import Share
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+
+from agents.tools.market_cache import MARKET_TIMEZONE, MarketDataCache
+
+logger = logging.getLogger(__name__)
+
+# 默认获取最近 5 天的历史数据
+HISTORY_WINDOW_DAYS = 5
+
+
+def fetch_historical(stock_name: str, start_date: date, end_date: date) -> list:
+    """从 Yahoo Finance 拉取历史数据（阻塞调用）"""
+    share = Share(stock_name)
+    return share.get_historical(start_date.isoformat(), end_date.isoformat())
+
+
+stock_data_cache = MarketDataCache(fetch_historical)
 
 
 @tool
@@ -8,18 +26,15 @@ def get_stock_data(stock_name: str) -> dict:
     """
     GET Stock Data from given stock name
     """
-    print(f"get_stock_data: {stock_name}")
+    logger.info("get_stock_data: %s", stock_name)
 
     try:
-        # 使用 yfinance 获取股票数据
-        share = Share(stock_name)
-
-        # 获取最近5天的历史数据
-        end_date = share.get_trade_datetime()
-        start_date = end_date - timedelta(days=5)
+        # 以交易所所在时区的日期确定数据窗口，同一窗口内的请求共享缓存
+        end_date = datetime.now(MARKET_TIMEZONE).date()
+        start_date = end_date - timedelta(days=HISTORY_WINDOW_DAYS)
 
         # 获取历史数据
-        hist_data = share.get_historical(start=start_date, end=end_date)
+        hist_data = stock_data_cache.get(stock_name, start_date, end_date)
 
         # 转换为字典格式
         result = {
@@ -30,4 +45,4 @@ def get_stock_data(stock_name: str) -> dict:
         return result
 
     except Exception as e:
-        return {"error": f"Failed to get stock data: {str(e)}"}
\ No newline at end of file
+        return {"error": f"Failed to get stock data: {str(e)}"}
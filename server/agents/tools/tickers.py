@@ -0,0 +1,141 @@
+import json
+import re
+from typing import Any, Dict, Iterable, List, Optional
+
+from utils.env import get_env_variable
+
+# 常见股票代码及其公司名称别名（小写）
+DEFAULT_SYMBOLS: Dict[str, List[str]] = {
+    "AAPL": ["apple"],
+    "MSFT": ["microsoft"],
+    "GOOGL": ["google", "alphabet"],
+    "AMZN": ["amazon"],
+    "META": ["meta", "facebook"],
+    "NVDA": ["nvidia"],
+    "TSLA": ["tesla"],
+    "NFLX": ["netflix"],
+    "AMD": ["amd", "advanced micro devices"],
+    "INTC": ["intel"],
+    "IBM": ["ibm"],
+    "ORCL": ["oracle"],
+    "CRM": ["salesforce"],
+    "ADBE": ["adobe"],
+    "AVGO": ["broadcom"],
+    "QCOM": ["qualcomm"],
+    "CSCO": ["cisco"],
+    "PYPL": ["paypal"],
+    "UBER": ["uber"],
+    "DIS": ["disney"],
+    "KO": ["coca-cola", "coca cola"],
+    "PEP": ["pepsi", "pepsico"],
+    "WMT": ["walmart"],
+    "COST": ["costco"],
+    "NKE": ["nike"],
+    "MCD": ["mcdonald's", "mcdonalds"],
+    "SBUX": ["starbucks"],
+    "JPM": ["jpmorgan", "jp morgan"],
+    "BAC": ["bank of america"],
+    "GS": ["goldman sachs"],
+    "V": ["visa"],
+    "MA": ["mastercard"],
+    "BRK-B": ["berkshire hathaway", "berkshire"],
+    "JNJ": ["johnson & johnson", "johnson and johnson"],
+    "PFE": ["pfizer"],
+    "XOM": ["exxon", "exxonmobil"],
+    "BABA": ["alibaba"],
+    "TSM": ["tsmc", "taiwan semiconductor"],
+    "BIDU": ["baidu"],
+    "PDD": ["pinduoduo", "temu"],
+}
+
+# 额外的代码表文件，格式同 DEFAULT_SYMBOLS: {"TICKER": ["alias", ...]}
+TICKER_SYMBOLS_FILE = get_env_variable("TICKER_SYMBOLS_FILE", "")
+# 每次请求最多推测性预取的股票数
+PREFETCH_MAX_TICKERS = int(get_env_variable("PREFETCH_MAX_TICKERS", "2"))
+
+_CASHTAG_RE = re.compile(r"\$([A-Za-z]{1,5}(?:[.-][A-Za-z])?)\b")
+_UPPER_RE = re.compile(r"\b([A-Z]{1,5}(?:[.-][A-Z])?)\b")
+
+
+class SymbolIndex:
+    """
+    本地股票代码索引，用于从用户输入中快速识别股票
+    - $TSLA 形式的 cashtag 总是识别
+    - 全大写单词只在索引中存在时识别（避免 "I"、"AI" 等误判）
+    - 公司名称按整词、不区分大小写匹配
+    """
+
+    def __init__(self, symbols: Dict[str, Iterable[str]]):
+        self.symbols = {ticker.upper() for ticker in symbols}
+        aliases = {
+            alias.lower(): ticker.upper()
+            for ticker, names in symbols.items()
+            for alias in names
+        }
+        self._aliases = aliases
+        # 长别名优先，避免 "bank of america" 被拆开匹配
+        pattern = "|".join(re.escape(alias) for alias in sorted(aliases, key=len, reverse=True))
+        self._alias_re = re.compile(rf"(?<![\w-])({pattern})(?![\w-])", re.I) if pattern else None
+
+    def extract(self, text: str) -> List[str]:
+        """按出现顺序返回去重后的股票代码"""
+        if not text:
+            return []
+        found: List[tuple] = []
+        for match in _CASHTAG_RE.finditer(text):
+            found.append((match.start(), match.group(1).upper()))
+        for match in _UPPER_RE.finditer(text):
+            if match.group(1) in self.symbols and len(match.group(1)) > 1:
+                found.append((match.start(), match.group(1)))
+        if self._alias_re is not None:
+            for match in self._alias_re.finditer(text):
+                found.append((match.start(), self._aliases[match.group(1).lower()]))
+
+        tickers: List[str] = []
+        for _, ticker in sorted(found):
+            if ticker not in tickers:
+                tickers.append(ticker)
+        return tickers
+
+
+def _load_symbols() -> Dict[str, List[str]]:
+    symbols = dict(DEFAULT_SYMBOLS)
+    if TICKER_SYMBOLS_FILE:
+        with open(TICKER_SYMBOLS_FILE, "r", encoding="utf-8") as f:
+            symbols.update(json.load(f))
+    return symbols
+
+
+symbol_index = SymbolIndex(_load_symbols())
+
+
+def latest_user_text(state: Dict[str, Any]) -> str:
+    """最新一轮的用户输入（最后一条用户消息，以及可选的 prompt）"""
+    parts: List[str] = []
+    if state.get("prompt"):
+        parts.append(state["prompt"])
+    for message in reversed(state.get("messages") or []):
+        if getattr(message, "type", None) == "human":
+            content = message.content
+            parts.append(content if isinstance(content, str) else str(content))
+            break
+    return "\n".join(parts)
+
+
+def extract_tickers(text: str, limit: Optional[int] = None) -> List[str]:
+    tickers = symbol_index.extract(text)
+    return tickers[:limit] if limit else tickers
+
+
+
+def speculative_tool_calls(
+    state: Dict[str, Any],
+    tool_name: str = "get_stock_data",
+    arg_name: str = "stock_name",
+    limit: int = PREFETCH_MAX_TICKERS,
+) -> List[Dict[str, Any]]:
+    """根据最新用户输入猜测模型将要发出的行情工具调用"""
+    return [
+        {"name": tool_name, "args": {arg_name: ticker}}
+        for ticker in extract_tickers(latest_user_text(state), limit)
+    ]
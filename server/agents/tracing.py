@@ -0,0 +1,376 @@
+import asyncio
+import json
+import logging
+import random
+import time
+import urllib.request
+from typing import Any, Dict, List, Optional
+
+from utils.env import get_env_variable
+
+logger = logging.getLogger(__name__)
+
+# 头部采样率：请求开始时决定是否记录整条链路，0 表示关闭
+TRACE_SAMPLE_RATE = float(get_env_variable("TRACE_SAMPLE_RATE", "0"))
+# jsonl：追加写入本地文件；otlp：以 OTLP/HTTP JSON 格式 POST 到收集器
+TRACE_EXPORTER = get_env_variable("TRACE_EXPORTER", "jsonl")
+TRACE_FILE = get_env_variable("TRACE_FILE", "traces.jsonl")
+TRACE_OTLP_ENDPOINT = get_env_variable("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+TRACE_BATCH_SIZE = int(get_env_variable("TRACE_BATCH_SIZE", "256"))
+TRACE_FLUSH_INTERVAL = float(get_env_variable("TRACE_FLUSH_INTERVAL", "5"))
+# 等待导出的 span 上限，导出跟不上时丢弃新的 span 而不是占用内存
+TRACE_MAX_QUEUE = int(get_env_variable("TRACE_MAX_QUEUE", "8192"))
+TRACE_SERVICE_NAME = get_env_variable("TRACE_SERVICE_NAME", "genui-server")
+# 每隔多少帧计时一次 SSE 写出，sse.write_ms 按抽样帧的平均耗时估算；1 表示每帧都计时
+TRACE_WRITE_SAMPLE_EVERY = max(1, int(get_env_variable("TRACE_WRITE_SAMPLE_EVERY", "16")))
+
+# 工具输入只保留前若干字符
+TOOL_INPUT_MAX_CHARS = 200
+
+
+def _new_id(bits: int) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns", "attributes", "status")
+
+    def __init__(self, trace_id: str, parent_id: Optional[str], name: str, kind: str, attributes: Dict[str, Any]):
+        self.trace_id = trace_id
+        self.span_id = _new_id(64)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+        self.status = "unset"
+
+    def end(self, status: str = "ok"):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            self.status = status
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class RunTrace:
+    """
+    一次请求的链路：根 span 覆盖整个请求，
+    图节点、模型调用和工具调用的子 span 由 astream_events 的原始事件构造
+    """
+
+    __slots__ = (
+        "trace_id", "root", "_spans", "_open", "_nodes", "_awaiting_first", "_processor",
+        "_write_ns", "_frames", "_timed_frames",
+    )
+
+    def __init__(self, processor: "BatchSpanProcessor", name: str, attributes: Dict[str, Any]):
+        self.trace_id = _new_id(128)
+        self.root = Span(self.trace_id, None, name, "server", attributes)
+        self._spans: List[Span] = [self.root]
+        # 未结束的子 span：run_id -> Span
+        self._open: Dict[str, Span] = {}
+        # 正在运行的图节点：节点名 -> Span，模型和工具调用挂在所属节点下
+        self._nodes: Dict[str, Span] = {}
+        # 还没收到首个 chunk 的模型调用：run_id -> Span，之后的 chunk 不再做任何处理
+        self._awaiting_first: Dict[str, Span] = {}
+        self._processor = processor
+        self._write_ns = 0
+        self._frames = 0
+        self._timed_frames = 0
+
+    def _start(self, run_id: str, parent: Span, name: str, kind: str, attributes: Dict[str, Any]) -> Span:
+        span = Span(self.trace_id, parent.span_id, name, kind, attributes)
+        self._spans.append(span)
+        self._open[run_id] = span
+        return span
+
+    def _parent(self, raw_event: Dict[str, Any]) -> Span:
+        node = (raw_event.get("metadata") or {}).get("langgraph_node")
+        return self._nodes.get(node, self.root)
+
+    def on_raw_event(self, raw_event: Dict[str, Any]):
+        event_type = raw_event.get("event")
+        if event_type == "on_chat_model_stream":
+            # 运行中绝大多数事件是 token，只有每次模型调用的首个 chunk 需要记录
+            if self._awaiting_first:
+                span = self._awaiting_first.pop(raw_event.get("run_id", ""), None)
+                if span is not None:
+                    span.attributes["llm.time_to_first_token_ms"] = round((time.time_ns() - span.start_ns) / 1e6, 3)
+            return
+        run_id = raw_event.get("run_id", "")
+        if event_type == "on_chat_model_start":
+            metadata = raw_event.get("metadata") or {}
+            self._awaiting_first[run_id] = self._start(
+                run_id, self._parent(raw_event), f"llm {raw_event.get('name', '')}", "client", {
+                    "llm.provider": metadata.get("ls_provider", ""),
+                    "llm.model": metadata.get("ls_model_name", ""),
+                },
+            )
+        elif event_type == "on_chat_model_end":
+            self._awaiting_first.pop(run_id, None)
+            span = self._open.pop(run_id, None)
+            if span is not None:
+                output = (raw_event.get("data") or {}).get("output")
+                usage = getattr(output, "usage_metadata", None)
+                if usage:
+                    span.attributes["llm.input_tokens"] = usage.get("input_tokens", 0)
+                    span.attributes["llm.output_tokens"] = usage.get("output_tokens", 0)
+                span.end()
+        elif event_type == "on_tool_start":
+            tool_input = (raw_event.get("data") or {}).get("input")
+            self._start(run_id, self._parent(raw_event), f"tool {raw_event.get('name', '')}", "internal", {
+                "tool.name": raw_event.get("name", ""),
+                "tool.input": str(tool_input)[:TOOL_INPUT_MAX_CHARS],
+            })
+        elif event_type == "on_tool_end":
+            span = self._open.pop(run_id, None)
+            if span is not None:
+                span.end()
+        elif event_type == "on_chain_start":
+            # 只有节点本身的链事件名与 langgraph_node 一致，节点内部的子链不单独成 span
+            name = raw_event.get("name", "")
+            if name and name == (raw_event.get("metadata") or {}).get("langgraph_node"):
+                self._nodes[name] = self._start(run_id, self.root, f"node {name}", "internal", {"graph.node": name})
+        elif event_type == "on_chain_end":
+            span = self._open.pop(run_id, None)
+            if span is not None:
+                span.end()
+                node = span.attributes.get("graph.node")
+                if self._nodes.get(node) is span:
+                    del self._nodes[node]
+
+    def sample_write(self) -> bool:
+        """计数一帧 SSE 写出，返回这一帧是否需要计时（每 TRACE_WRITE_SAMPLE_EVERY 帧一次）"""
+        self._frames += 1
+        return (self._frames - 1) % TRACE_WRITE_SAMPLE_EVERY == 0
+
+    def add_write(self, elapsed_ns: int):
+        """记录一次抽样帧写出（生成器在 yield 处挂起）的耗时"""
+        self._write_ns += elapsed_ns
+        self._timed_frames += 1
+
+    def set_attribute(self, key: str, value: Any):
+        self.root.attributes[key] = value
+
+    def finish(self, status: str = "ok"):
+        """结束根 span 并交给导出器；未收到结束事件的子 span 以相同状态结束"""
+        if self.root.end_ns is not None:
+            return
+        for span in self._open.values():
+            span.end(status)
+        self._open.clear()
+        self._nodes.clear()
+        self._awaiting_first.clear()
+        self.root.attributes["sse.frames"] = self._frames
+        if self._timed_frames:
+            self.root.attributes["sse.write_ms"] = round(self._write_ns / self._timed_frames * self._frames / 1e6, 3)
+        self.root.end(status)
+        self._processor.on_end(self._spans)
+
+
+class JsonlExporter:
+    """每个 span 一行 JSON，追加写入本地文件"""
+
+    def __init__(self, path: str = TRACE_FILE):
+        self.path = path
+
+    def export(self, spans: List[Span]):
+        lines = "".join(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n" for span in spans)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+_OTLP_KINDS = {"internal": 1, "server": 2, "client": 3}
+_OTLP_STATUS = {"unset": 0, "ok": 1}
+
+
+def otlp_payload(spans: List[Span], service_name: str = TRACE_SERVICE_NAME) -> Dict[str, Any]:
+    """按 OTLP/HTTP JSON 编码（ExportTraceServiceRequest）"""
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service_name}}]},
+            "scopeSpans": [{
+                "scope": {"name": __name__},
+                "spans": [
+                    {
+                        "traceId": span.trace_id,
+                        "spanId": span.span_id,
+                        **({"parentSpanId": span.parent_id} if span.parent_id else {}),
+                        "name": span.name,
+                        "kind": _OTLP_KINDS[span.kind],
+                        "startTimeUnixNano": str(span.start_ns),
+                        "endTimeUnixNano": str(span.end_ns),
+                        "attributes": [
+                            {"key": key, "value": _otlp_value(value)} for key, value in span.attributes.items()
+                        ],
+                        "status": (
+                            {"code": _OTLP_STATUS[span.status]} if span.status in _OTLP_STATUS
+                            else {"code": 2, "message": span.status}
+                        ),
+                    }
+                    for span in spans
+                ],
+            }],
+        }],
+    }
+
+
+class OtlpHttpExporter:
+    """以 OTLP/HTTP JSON 格式发送到收集器"""
+
+    def __init__(self, endpoint: str = TRACE_OTLP_ENDPOINT, timeout: float = 5.0):
+        self.endpoint = endpoint
+        self.timeout = timeout
+
+    def export(self, spans: List[Span]):
+        body = json.dumps(otlp_payload(spans), default=str).encode("utf-8")
+        request = urllib.request.Request(
+            self.endpoint, data=body, method="POST", headers={"Content-Type": "application/json"}
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+class BatchSpanProcessor:
+    """
+    攒批导出：满 batch_size 或等待 flush_interval 秒后在后台线程中导出一批
+    导出串行进行，队列超过 max_queue 时丢弃新的 span
+    """
+
+    def __init__(
+        self,
+        exporter: Any,
+        batch_size: int = TRACE_BATCH_SIZE,
+        flush_interval: float = TRACE_FLUSH_INTERVAL,
+        max_queue: int = TRACE_MAX_QUEUE,
+    ):
+        self.exporter = exporter
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self._queue: List[Span] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._lock = asyncio.Lock()
+        self._tasks: set = set()
+        self.exported = 0
+        self.dropped = 0
+        self.batches = 0
+        self.export_errors = 0
+
+    def on_end(self, spans: List[Span]):
+        room = self.max_queue - len(self._queue)
+        if room < len(spans):
+            self.dropped += len(spans) - max(room, 0)
+            spans = spans[:max(room, 0)]
+        self._queue.extend(spans)
+        if len(self._queue) >= self.batch_size:
+            self.flush()
+        elif self._timer is None and self._queue:
+            self._timer = asyncio.get_running_loop().call_later(self.flush_interval, self.flush)
+
+    def flush(self):
+        """把队列中的 span 交给后台任务导出"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._queue:
+            return
+        batch, self._queue = self._queue, []
+        task = asyncio.create_task(self._export(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _export(self, spans: List[Span]):
+        async with self._lock:
+            for start in range(0, len(spans), self.batch_size):
+                batch = spans[start:start + self.batch_size]
+                try:
+                    await asyncio.to_thread(self.exporter.export, batch)
+                    self.exported += len(batch)
+                    self.batches += 1
+                except Exception as e:
+                    self.export_errors += 1
+                    self.dropped += len(batch)
+                    logger.warning("Failed to export %d spans: %s", len(batch), e)
+
+    async def aclose(self):
+        self.flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": len(self._queue),
+            "exported": self.exported,
+            "batches": self.batches,
+            "dropped": self.dropped,
+            "export_errors": self.export_errors,
+        }
+
+
+class Tracer:
+    """按采样率为请求创建 RunTrace，未采样的请求返回 None，不产生任何开销"""
+
+    def __init__(self, sample_rate: float, processor: Optional[BatchSpanProcessor]):
+        self.sample_rate = sample_rate
+        self.processor = processor
+        self.sampled = 0
+        self.unsampled = 0
+
+    def start_run(self, name: str, **attributes: Any) -> Optional[RunTrace]:
+        if self.processor is None or self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            self.unsampled += 1
+            return None
+        self.sampled += 1
+        return RunTrace(self.processor, name, attributes)
+
+    async def aclose(self):
+        if self.processor is not None:
+            await self.processor.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sample_rate": self.sample_rate,
+            "sampled": self.sampled,
+            "unsampled": self.unsampled,
+            **(self.processor.stats() if self.processor is not None else {}),
+        }
+
+
+def create_tracer() -> Tracer:
+    if TRACE_SAMPLE_RATE <= 0:
+        return Tracer(0.0, None)
+    if TRACE_EXPORTER == "otlp":
+        exporter = OtlpHttpExporter(TRACE_OTLP_ENDPOINT)
+    elif TRACE_EXPORTER == "jsonl":
+        exporter = JsonlExporter(TRACE_FILE)
+    else:
+        raise ValueError(f"Unknown TRACE_EXPORTER '{TRACE_EXPORTER}', expected 'jsonl' or 'otlp'.")
+    return Tracer(TRACE_SAMPLE_RATE, BatchSpanProcessor(exporter))
+
+
+tracer = create_tracer()
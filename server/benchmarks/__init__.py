@@ -0,0 +1,4 @@
+# benchmarks package
+#
+# 从 server 目录运行，例如：
+#   python -m benchmarks.agent_resolution
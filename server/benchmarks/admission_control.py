@@ -0,0 +1,136 @@
+"""
+突发流量下的准入控制效果
+
+模拟一个并发上限为 --provider-limit 的 provider：超出上限的调用会像真实 provider 一样返回 429，整个运行失败
+先突发 --batch 个 batch 请求，随后按固定间隔到达 --interactive 个 interactive 请求，对比：
+- 不做准入：所有请求直接打到 provider
+- 准入控制：并发限制为 provider 上限，有界优先级队列，队列满时快速返回 429 + Retry-After
+统计 provider 429 导致的失败运行数、入口拒绝数以及各优先级的端到端延迟分位数
+"""
+import argparse
+import asyncio
+import logging
+import random
+import statistics
+import time
+from typing import Dict, List, Optional
+
+from llm.admission import BATCH, INTERACTIVE, PRIORITY_NAMES, AdmissionController, AdmissionRejected
+
+
+class SimulatedProvider:
+    def __init__(self, limit: int, run_ms: float):
+        self.limit = limit
+        self.run_ms = run_ms
+        self.active = 0
+        self.peak = 0
+        self.throttled = 0
+
+    async def run(self) -> bool:
+        """返回运行是否成功；超出并发上限时 provider 在流中途返回 429"""
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            over_limit = self.active > self.limit
+            await asyncio.sleep(self.run_ms / 1000 * random.uniform(0.8, 1.2) * (0.3 if over_limit else 1))
+            if over_limit:
+                self.throttled += 1
+                return False
+            return True
+        finally:
+            self.active -= 1
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def request(
+    provider: SimulatedProvider,
+    controller: Optional[AdmissionController],
+    priority: int,
+    results: Dict[str, List],
+):
+    started_at = time.perf_counter()
+    name = PRIORITY_NAMES[priority]
+    ticket = None
+    if controller is not None:
+        try:
+            ticket = await controller.admit("sim", "model", priority, tokens=1000)
+        except AdmissionRejected as e:
+            results["rejected"].append((name, e.retry_after))
+            return
+    try:
+        ok = await provider.run()
+    finally:
+        if ticket is not None:
+            ticket.release()
+    if ok:
+        results[name].append((time.perf_counter() - started_at) * 1000)
+    else:
+        results["failed"].append(name)
+
+
+async def scenario(args, admission: bool):
+    random.seed(7)
+    provider = SimulatedProvider(args.provider_limit, args.run_ms)
+    controller = AdmissionController(
+        limits={"sim": {"concurrency": args.provider_limit}},
+        max_queue=args.max_queue,
+        max_wait={INTERACTIVE: 10.0, BATCH: 60.0},
+    ) if admission else None
+    results: Dict[str, List] = {"interactive": [], "batch": [], "failed": [], "rejected": []}
+
+    tasks = [asyncio.create_task(request(provider, controller, BATCH, results)) for _ in range(args.batch)]
+    for _ in range(args.interactive):
+        await asyncio.sleep(args.interval_ms / 1000)
+        tasks.append(asyncio.create_task(request(provider, controller, INTERACTIVE, results)))
+    await asyncio.gather(*tasks)
+    return provider, controller, results
+
+
+async def main(args):
+    # 拒绝日志在突发时非常多，这里只看汇总
+    logging.getLogger("llm.admission").setLevel(logging.ERROR)
+    print(
+        f"provider limit {args.provider_limit}, run {args.run_ms:.0f} ms, "
+        f"{args.batch} batch burst + {args.interactive} interactive every {args.interval_ms:.0f} ms"
+    )
+    header = f"{'mode':<12} {'priority':<12} {'ok':>5} {'p50 ms':>9} {'p99 ms':>9}"
+    print(f"{header} {'provider 429':>13} {'rejected':>9} {'peak':>5}")
+    for admission in (False, True):
+        provider, controller, results = await scenario(args, admission)
+        mode = "admission" if admission else "none"
+        for name in ("interactive", "batch"):
+            latencies = results[name]
+            failed = sum(1 for failed in results["failed"] if failed == name)
+            rejected = sum(1 for rejected, _ in results["rejected"] if rejected == name)
+            print(
+                f"{mode:<12} {name:<12} {len(latencies):>5} {percentile(latencies, 0.5):>9.0f} "
+                f"{percentile(latencies, 0.99):>9.0f} {failed:>13} {rejected:>9} {provider.peak:>5}"
+            )
+        if controller is not None:
+            retry_after = [value for _, value in results["rejected"]]
+            if retry_after:
+                print(f"{'':<12} Retry-After median {statistics.median(retry_after):.1f}s")
+            stats = controller.stats()["sim"]
+            print(
+                f"{'':<12} queue stats: admitted {stats['admitted']}, rejected {stats['rejected']}, "
+                f"p99 wait {stats['p99_wait_ms']:.0f} ms, max wait {stats['max_wait_ms']:.0f} ms"
+            )
+            assert provider.throttled == 0, "admission control let requests exceed the provider limit"
+            assert provider.peak <= args.provider_limit
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--provider-limit", type=int, default=8)
+    parser.add_argument("--run-ms", type=float, default=200)
+    parser.add_argument("--batch", type=int, default=120)
+    parser.add_argument("--interactive", type=int, default=60)
+    parser.add_argument("--interval-ms", type=float, default=25)
+    parser.add_argument("--max-queue", type=int, default=64)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,87 @@
+"""
+代理解析依赖注入开销的微基准
+
+对比旧实现（每个请求 import_clients + 同步依赖走线程池 + 重复解析）
+与启动时构建的 AgentRegistry 在两个端点上的每请求开销：
+  - /api/agents/stream/{agent_name}
+  - /api/agents/v1/chat/completions
+"""
+import argparse
+import asyncio
+import time
+
+from anyio import to_thread
+
+from core.types.models import ChatRequest
+from llm import import_clients
+from agents.router import (
+    AVAILABLE_AGENTS,
+    get_agent,
+    get_agent_from_model_or_query,
+)
+
+
+def legacy_get_agent(agent_name: str):
+    import_clients()
+    if agent_name not in AVAILABLE_AGENTS:
+        raise KeyError(f"Available agents: {list(AVAILABLE_AGENTS.keys())}")
+    return AVAILABLE_AGENTS[agent_name]
+
+
+def legacy_get_agent_from_model(request: ChatRequest):
+    import_clients()
+    if ":" in request.model:
+        target_agent_name, model_name = request.model.split(":", 1)
+        request.model = model_name
+    else:
+        target_agent_name = list(AVAILABLE_AGENTS.keys())[0] if AVAILABLE_AGENTS else "raw_web"
+    if target_agent_name not in AVAILABLE_AGENTS:
+        raise KeyError(f"Available agents: {list(AVAILABLE_AGENTS.keys())}")
+    return AVAILABLE_AGENTS[target_agent_name]
+
+
+async def _measure(label: str, call, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await call()
+    per_call_us = (time.perf_counter() - start) / iterations * 1e6
+    print(f"{label:<40} {per_call_us:10.2f} us/request")
+    return per_call_us
+
+
+async def main(iterations: int):
+    # FastAPI 会把同步依赖放到线程池执行，旧实现的开销需要包含这次调度
+    legacy_stream = await _measure(
+        "legacy   /stream/{agent_name}",
+        lambda: to_thread.run_sync(legacy_get_agent, "enhanced_markdown"),
+        iterations,
+    )
+    registry_stream = await _measure(
+        "registry /stream/{agent_name}",
+        lambda: get_agent("enhanced_markdown"),
+        iterations,
+    )
+
+    legacy_completions = await _measure(
+        "legacy   /v1/chat/completions",
+        lambda: to_thread.run_sync(
+            legacy_get_agent_from_model, ChatRequest(model="enhanced_markdown:gpt-4o")
+        ),
+        iterations,
+    )
+    registry_completions = await _measure(
+        "registry /v1/chat/completions",
+        lambda: get_agent_from_model_or_query(ChatRequest(model="enhanced_markdown:gpt-4o"), None),
+        iterations,
+    )
+
+    print()
+    print(f"saved per request on /stream:           {legacy_stream - registry_stream:10.2f} us")
+    print(f"saved per request on /chat/completions: {legacy_completions - registry_completions:10.2f} us")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=10000)
+    args = parser.parse_args()
+    asyncio.run(main(args.iterations))
@@ -0,0 +1,63 @@
+"""
+/v1/chat/completions 流式与非流式（stream=false）两种模式的单请求开销
+
+流式模式逐个处理图事件并编码 SSE 块；非流式模式直接 ainvoke 图，只序列化一次最终响应
+对比每个请求的 CPU 时间与响应字节数（含 gzip 后大小）
+合成图本身不做任何计算，因此 CPU 时间只反映 handler 一侧的开销
+"""
+import argparse
+import asyncio
+import gzip
+import time
+
+from core.types.models import ChatMessage, ChatRequest, StreamOptions
+from agents.langgraph_handler import OpenAICompatibleLangGraphHandler
+from benchmarks.synthetic_events import SyntheticGraph, agent_run_events
+
+
+def make_request(stream: bool) -> ChatRequest:
+    return ChatRequest(
+        model="gpt-4o",
+        messages=[ChatMessage(role="user", content="Analyze AAPL")],
+        stream=stream,
+        stream_options=StreamOptions(cache=False),
+    )
+
+
+async def run_stream(graph: SyntheticGraph) -> bytes:
+    handler = OpenAICompatibleLangGraphHandler(graph)
+    return "".join([chunk async for chunk in handler.stream(make_request(True))]).encode("utf-8")
+
+
+async def run_complete(graph: SyntheticGraph) -> bytes:
+    handler = OpenAICompatibleLangGraphHandler(graph)
+    completion = await handler.complete(make_request(False))
+    return completion.model_dump_json().encode("utf-8")
+
+
+async def measure(run, graph: SyntheticGraph, repeat: int):
+    body = await run(graph)
+    started_at = time.process_time()
+    for _ in range(repeat):
+        await run(graph)
+    cpu_ms = (time.process_time() - started_at) / repeat * 1000
+    return cpu_ms, len(body), len(gzip.compress(body, compresslevel=5))
+
+
+async def main(report_chars: int, repeat: int):
+    print(f"{'agent':<20} {'mode':<10} {'cpu ms/req':>11} {'bytes':>10} {'gzip':>9}")
+    for agent in ("raw_web", "enhanced_markdown"):
+        graph = SyntheticGraph(agent_run_events(agent, report_chars=report_chars))
+        stream_cpu, stream_bytes, stream_gzip = await measure(run_stream, graph, repeat)
+        complete_cpu, complete_bytes, complete_gzip = await measure(run_complete, graph, repeat)
+        print(f"{agent:<20} {'stream':<10} {stream_cpu:>11.2f} {stream_bytes:>10,} {stream_gzip:>9,}")
+        print(f"{'':<20} {'complete':<10} {complete_cpu:>11.2f} {complete_bytes:>10,} {complete_gzip:>9,}"
+              f"   ({stream_cpu / complete_cpu:.1f}x less CPU)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--report-chars", type=int, default=12000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(main(args.report_chars, args.repeat))
@@ -0,0 +1,96 @@
+"""
+增强 markdown 组件标签的流式解析
+
+- 正确性：任意 token 切分下，流式解析结果与一次性解析完整文档一致
+- 服务端增量解析的每字符耗时随文档长度保持不变（线性），以及最大缓冲字符数
+- 对比客户端每收到一个 token 就重新解析整篇文档（总成本随长度平方增长）
+"""
+import argparse
+import re
+import time
+from typing import List
+
+from agents.components import Component, ComponentParser, Segment, parse_attributes
+from benchmarks.synthetic_events import TOKEN_SIZES, report_text, split_tokens
+
+_DOCUMENT_RE = re.compile(r"<highlight>(.*?)</highlight>|<CandlestickChart\b([^>]*?)/>", re.S)
+
+
+def _merge(out: List[Segment], segment: Segment):
+    if isinstance(segment, str) and out and isinstance(out[-1], str):
+        out[-1] += segment
+    elif segment:
+        out.append(segment)
+
+
+def parse_document(text: str) -> List[Segment]:
+    """参考实现：对完整文档做一次正则解析"""
+    out: List[Segment] = []
+    position = 0
+    for match in _DOCUMENT_RE.finditer(text):
+        _merge(out, text[position:match.start()])
+        if match.group(1) is not None:
+            _merge(out, Component("highlight", {}, match.group(1)))
+        else:
+            _merge(out, Component("CandlestickChart", parse_attributes(match.group(2)), None))
+        position = match.end()
+    _merge(out, text[position:])
+    return out
+
+
+def parse_stream(tokens: List[str], parser: ComponentParser) -> List[Segment]:
+    out: List[Segment] = []
+    for token in tokens:
+        for segment in parser.feed(token):
+            _merge(out, segment)
+    for segment in parser.flush():
+        _merge(out, segment)
+    return out
+
+
+def check(report: str):
+    expected_components = len(_DOCUMENT_RE.findall(report))
+    reference = parse_document(report)
+    assert sum(isinstance(s, Component) for s in reference) == expected_components
+    for token_chars in (1, 2, 3, 5, 7, 16, 64):
+        assert parse_stream(split_tokens(report, token_chars), ComponentParser()) == reference, token_chars
+    # 非组件标签与未闭合标签按原文输出
+    tricky = "a < b <div>x</div> <high <highlight>ok</highlight> <CandlestickChart title='T' days={30} />"
+    assert "".join(s for s in parse_stream(list(tricky), ComponentParser()) if isinstance(s, str)) == (
+        "a < b <div>x</div> <high  "
+    )
+    print(f"correctness: {expected_components} components match across token sizes")
+
+
+def client_reparse_ms(tokens: List[str]) -> float:
+    started_at = time.perf_counter()
+    document = ""
+    for token in tokens:
+        document += token
+        _DOCUMENT_RE.findall(document)
+    return (time.perf_counter() - started_at) * 1000
+
+
+def main(sizes: List[int]):
+    check(report_text("enhanced_markdown", 20000))
+    print(f"{'chars':>8} {'token':>6} {'server ms':>10} {'ns/char':>8} {'max buffer':>11} {'client reparse ms':>18}")
+    for size in sizes:
+        report = report_text("enhanced_markdown", size)
+        for token_chars in TOKEN_SIZES:
+            tokens = split_tokens(report, token_chars)
+            parser = ComponentParser()
+            started_at = time.perf_counter()
+            parse_stream(tokens, parser)
+            server_ms = (time.perf_counter() - started_at) * 1000
+            client_ms = client_reparse_ms(tokens) if size <= 50000 else float("nan")
+            print(
+                f"{size:>8,} {token_chars:>6} {server_ms:>10.2f} {server_ms * 1e6 / size:>8.0f} "
+                f"{parser.max_buffered:>11} {client_ms:>18.1f}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5000, 20000, 80000])
+    args = parser.parse_args()
+    main(args.sizes)
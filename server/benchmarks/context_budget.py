@@ -0,0 +1,64 @@
+"""
+多轮对话中每次模型调用的上下文大小
+
+模拟 N 轮 "分析股票" 对话（工具调用 + 100 条行情 + 完整报告），
+对比直接发送全部历史与经过 ContextManager 后的 prompt token 数，以及 prepare() 耗时
+"""
+import argparse
+import time
+import uuid
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+
+from agents.context import ContextManager
+from agents.tools.encoding import encode_tool_result
+from benchmarks.synthetic_events import report_text, stock_payload
+
+
+def conversation_turn(turn: int, bars: int, report_chars: int) -> list:
+    ticker = ("AAPL", "MSFT", "NVDA", "TSLA")[turn % 4]
+    call_id = f"call_{turn}"
+    return [
+        HumanMessage(content=f"Analyze {ticker}", id=str(uuid.uuid4())),
+        AIMessage(
+            content="",
+            tool_calls=[{"name": "get_stock_data", "args": {"stock_name": ticker}, "id": call_id}],
+            id=str(uuid.uuid4()),
+        ),
+        ToolMessage(
+            content=encode_tool_result("get_stock_data", stock_payload(ticker, bars, seed=turn)),
+            tool_call_id=call_id,
+            name="get_stock_data",
+            id=str(uuid.uuid4()),
+        ),
+        AIMessage(content=report_text("enhanced_markdown", report_chars), id=str(uuid.uuid4())),
+    ]
+
+
+def main(turns: int, bars: int, report_chars: int, budget: int, model: str):
+    manager = ContextManager(default_budget=budget)
+    system = [SystemMessage(content="You are a stock market analyst expert.")]
+    history = []
+    print(f"{'turn':>4} {'full tokens':>12} {'managed':>9} {'saved':>7} {'prepare ms':>11}")
+    for turn in range(turns):
+        history.extend(conversation_turn(turn, bars, report_chars)[:3])
+        # generate_report 调用时的上下文
+        full = sum(manager.count(message, model) for message in system + history)
+        started_at = time.perf_counter()
+        managed_messages = manager.prepare(system, history, model=model, node="generate_report")
+        prepare_ms = (time.perf_counter() - started_at) * 1000
+        managed = sum(manager.count(message, model) for message in managed_messages)
+        print(f"{turn + 1:>4} {full:>12,} {managed:>9,} {1 - managed / full:>7.0%} {prepare_ms:>11.2f}")
+        history.append(conversation_turn(turn, bars, report_chars)[3])
+    print(manager.stats())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--bars", type=int, default=100)
+    parser.add_argument("--report-chars", type=int, default=6000)
+    parser.add_argument("--budget", type=int, default=16000)
+    parser.add_argument("--model", default="gpt-4o")
+    args = parser.parse_args()
+    main(args.turns, args.bars, args.report_chars, args.budget, args.model)
@@ -0,0 +1,213 @@
+"""
+客户端断开连接后上游运行的取消速度
+
+用逐 token 延迟输出的聊天模型模拟慢速 provider，在本地端口启动带真实路由的 FastAPI 应用：
+- 流式：/stream 和 /v1/chat/completions 各读取若干个事件后关闭连接
+- 非流式：stream=false 请求在超时后关闭连接
+- 仅轮询：直接调用 handler，模拟不会取消响应生成器的 ASGI 服务器
+统计断开后模型还继续生成了多少 token、取消耗时，并校验模型确实被提前终止
+"""
+import argparse
+import asyncio
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+import uvicorn
+from fastapi import FastAPI
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langgraph.graph import END, START, StateGraph
+
+from agents.disconnect import disconnect_stats
+from agents.langgraph_handler import LangGraphHandler
+from agents.state import AgentState
+from core.types.models import ChatRequest
+
+
+class SlowChatModel(BaseChatModel):
+    """每个 token 之间 sleep 的聊天模型，记录生成的 token 数以及是否被取消"""
+
+    tokens: int = 200
+    token_ms: float = 20.0
+    generated: int = 0
+    cancelled: bool = False
+    finished: bool = False
+
+    @property
+    def _llm_type(self) -> str:
+        return "slow-fake"
+
+    def _generate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        raise NotImplementedError("SlowChatModel only supports async calls")
+
+    async def _astream(
+        self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        try:
+            for index in range(self.tokens):
+                await asyncio.sleep(self.token_ms / 1000)
+                self.generated += 1
+                chunk = ChatGenerationChunk(message=AIMessageChunk(content=f"token{index} "))
+                if run_manager:
+                    await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+            self.finished = True
+        except (asyncio.CancelledError, GeneratorExit):
+            # 上游被取消，或者流在读取中途被关闭
+            self.cancelled = True
+            raise
+
+    async def _agenerate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        content = "".join([chunk.text async for chunk in self._astream(messages, stop, run_manager)])
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+
+
+def build_graph(model: SlowChatModel):
+    async def chat_node(state: AgentState):
+        return {"messages": [await model.ainvoke(state["messages"])]}
+
+    workflow = StateGraph(AgentState)
+    workflow.add_node("chat_node", chat_node)
+    workflow.add_edge(START, "chat_node")
+    workflow.add_edge("chat_node", END)
+    return workflow.compile(name="slow")
+
+
+class Scenario:
+    def __init__(self, name: str, tokens: int, token_ms: float):
+        self.name = name
+        self.model = SlowChatModel(tokens=tokens, token_ms=token_ms)
+
+    def reset(self):
+        self.model.generated = 0
+        self.model.cancelled = self.model.finished = False
+
+
+def build_app(scenario: Scenario) -> FastAPI:
+    from agents import router as agents_router
+    from agents.registry import AgentRegistry
+
+    agents_router.agent_registry = AgentRegistry({"slow": build_graph(scenario.model)})
+    app = FastAPI()
+    app.include_router(agents_router.router)
+    return app
+
+
+async def start_server(app: FastAPI):
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    return server, task, f"http://127.0.0.1:{port}"
+
+
+async def read_then_close(client: httpx.AsyncClient, url: str, body: Dict[str, Any], events: int) -> float:
+    """读取若干个 SSE 事件后关闭连接，返回关闭时刻"""
+    async with client.stream("POST", url, json=body) as response:
+        seen = 0
+        async for line in response.aiter_lines():
+            if line.startswith("data:"):
+                seen += 1
+                if seen >= events:
+                    break
+    return time.perf_counter()
+
+
+async def close_after(client: httpx.AsyncClient, url: str, body: Dict[str, Any], seconds: float) -> float:
+    try:
+        await client.post(url, json=body, timeout=seconds)
+    except httpx.ReadTimeout:
+        pass
+    return time.perf_counter()
+
+
+async def poll_only(handler: LangGraphHandler, body: Dict[str, Any], seconds: float) -> float:
+    """
+    不经过 HTTP 服务器，只依赖 is_disconnected 轮询
+    对应 ASGI spec >= 2.4 的服务器：服务器不会取消响应生成器，只有下一次写出失败时才会发现断开
+    """
+    disconnected_at: List[float] = []
+
+    async def is_disconnected() -> bool:
+        if time.perf_counter() - started_at >= seconds:
+            disconnected_at.append(time.perf_counter())
+            return True
+        return False
+
+    started_at = time.perf_counter()
+    async for _ in handler.stream(ChatRequest(**body), is_disconnected):
+        pass
+    return disconnected_at[0]
+
+
+async def wait_stopped(model: SlowChatModel, timeout: float = 5.0) -> Optional[float]:
+    """等待模型停止生成，返回停止的时刻"""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if model.cancelled or model.finished:
+            return time.perf_counter()
+        await asyncio.sleep(0.005)
+    return None
+
+
+async def main(tokens: int, token_ms: float, read_events: int):
+    scenario = Scenario("slow", tokens, token_ms)
+    server, server_task, base_url = await start_server(build_app(scenario))
+    messages = [{"role": "user", "content": "Write a long report"}]
+    cases = {
+        "stream": lambda client: read_then_close(
+            client, f"{base_url}/api/agents/stream/slow",
+            {"messages": messages, "stream_options": {"cache": False, "coalesce_tokens": False}}, read_events,
+        ),
+        "openai stream": lambda client: read_then_close(
+            client, f"{base_url}/api/agents/v1/chat/completions?agent_name=slow",
+            {"model": "slow", "messages": messages, "stream_options": {"cache": False}}, read_events,
+        ),
+        "openai complete": lambda client: close_after(
+            client, f"{base_url}/api/agents/v1/chat/completions?agent_name=slow",
+            {"model": "slow", "messages": messages, "stream": False}, read_events * token_ms / 1000,
+        ),
+        "poll only": lambda client: poll_only(
+            LangGraphHandler(build_graph(scenario.model), agent_name="slow"),
+            {"messages": messages, "stream_options": {"cache": False}}, read_events * token_ms / 1000,
+        ),
+    }
+
+    full_ms = tokens * token_ms
+    print(f"full generation: {tokens} tokens, {full_ms:.0f} ms")
+    print(f"{'case':<16} {'generated':>10} {'after close':>12} {'stop ms':>9} {'cancelled':>10}")
+    try:
+        async with httpx.AsyncClient(timeout=30) as client:
+            for name, run in cases.items():
+                scenario.reset()
+                disconnects = disconnect_stats.disconnects
+                closed_at = await run(client)
+                generated_at_close = scenario.model.generated
+                stopped_at = await wait_stopped(scenario.model)
+                stop_ms = (stopped_at - closed_at) * 1000 if stopped_at else float("nan")
+                print(
+                    f"{name:<16} {scenario.model.generated:>10} "
+                    f"{scenario.model.generated - generated_at_close:>12} {stop_ms:>9.1f} "
+                    f"{str(scenario.model.cancelled):>10}"
+                )
+                assert scenario.model.cancelled and not scenario.model.finished, f"{name}: model was not cancelled"
+                assert scenario.model.generated < tokens // 2, f"{name}: model kept generating after disconnect"
+                await asyncio.sleep(0.05)
+                assert disconnect_stats.disconnects == disconnects + 1, f"{name}: disconnect not recorded"
+    finally:
+        server.should_exit = True
+        await server_task
+
+    print("disconnect stats:", disconnect_stats.stats())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tokens", type=int, default=200)
+    parser.add_argument("--token-ms", type=float, default=20.0)
+    parser.add_argument("--read-events", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.tokens, args.token_ms, args.read_events))
@@ -0,0 +1,219 @@
+"""
+事件格式化管线的微基准
+
+把形状接近真实运行的合成 astream_events v2 事件流送入：
+- format：LangGraphEventProcessor._format_event（逐事件的格式化本身）
+- stream：LangGraphHandler.stream（过滤、格式化、SSE 编码）
+- openai：OpenAICompatibleLangGraphHandler.stream（文本增量、chunk 编码）
+事件流分别为：不同大小的 token（1 / 4 / 16 字符）、携带 100 条行情的工具开始 / 结束事件、
+携带多轮历史大状态的节点事件，以及 raw_web / enhanced_markdown 的完整运行。
+
+每组测量事件吞吐（多轮取最好）、tracemalloc 记录的内存峰值和运行后仍保留的内存、
+以及按输出事件类型统计的字节数。结果写入 JSON，--baseline 指定上一次的结果文件时输出对比，
+用于检查 langgraph_handler.py 和 core/types/models.py 的改动对性能的影响。
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import re
+import subprocess
+import time
+import tracemalloc
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from core.types.models import ChatMessage, ChatRequest, StreamOptions
+from agents.langgraph_handler import (
+    LangGraphEventProcessor,
+    LangGraphHandler,
+    OpenAICompatibleLangGraphHandler,
+    StepTracker,
+)
+from benchmarks.synthetic_events import (
+    TOKEN_SIZES,
+    SyntheticGraph,
+    agent_run_events,
+    chain_events,
+    token_stream_events,
+    tool_events,
+)
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+TARGETS = ("format", "stream", "openai")
+
+_EVENT_TYPE = re.compile(r'"type":"(\w+)"')
+
+
+def build_streams(args) -> Dict[str, List[Dict[str, Any]]]:
+    streams = {f"tokens_{size}": token_stream_events(size, args.tokens) for size in TOKEN_SIZES}
+    streams["tool_100_bars"] = tool_events(args.tool_calls, bars=100)
+    streams["chain_large_state"] = chain_events(args.chain_steps, args.history_turns)
+    for agent in ("raw_web", "enhanced_markdown"):
+        streams[f"run_{agent}"] = agent_run_events(agent, report_chars=args.report_chars)
+    return streams
+
+
+def make_request() -> ChatRequest:
+    return ChatRequest(
+        messages=[ChatMessage(role="user", content="Analyze AAPL")],
+        stream_options=StreamOptions(cache=False, include_usage=True),
+    )
+
+
+def stream_frame_type(frame: str) -> str:
+    match = _EVENT_TYPE.search(frame)
+    return match.group(1) if match else "other"
+
+
+def openai_frame_type(frame: str) -> str:
+    if frame.startswith("data: [DONE]"):
+        return "done"
+    if '"choices":[]' in frame:
+        return "usage"
+    if '"content":"' in frame and '"content":""' not in frame:
+        return "content"
+    return "control"
+
+
+async def run_format(events: List[Dict[str, Any]], sizes: Optional[Dict[str, List[int]]]):
+    processor = LangGraphEventProcessor()
+    steps = StepTracker()
+    for raw_event in events:
+        if processor._should_forward_event(raw_event):
+            event = processor._format_event(raw_event, "run", "thread", steps)
+            if sizes is not None and event is not None:
+                sizes[event.event.type.value].append(len(event.model_dump_json().encode("utf-8")))
+
+
+async def run_stream(events: List[Dict[str, Any]], sizes: Optional[Dict[str, List[int]]]):
+    handler = LangGraphHandler(SyntheticGraph(events), agent_name="bench")
+    async for frame in handler.stream(make_request()):
+        if sizes is not None:
+            sizes[stream_frame_type(frame)].append(len(frame.encode("utf-8")))
+
+
+async def run_openai(events: List[Dict[str, Any]], sizes: Optional[Dict[str, List[int]]]):
+    # 与路由一致：OpenAI 兼容处理器每个请求新建
+    handler = OpenAICompatibleLangGraphHandler(SyntheticGraph(events), agent_name="bench")
+    async for frame in handler.stream(make_request()):
+        if sizes is not None:
+            sizes[openai_frame_type(frame)].append(len(frame.encode("utf-8")))
+
+
+RUNNERS: Dict[str, Callable] = {"format": run_format, "stream": run_stream, "openai": run_openai}
+
+
+async def measure(run: Callable, events: List[Dict[str, Any]], repeat: int) -> Dict[str, Any]:
+    sizes: Dict[str, List[int]] = defaultdict(list)
+    await run(events, sizes)
+
+    best = float("inf")
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        await run(events, None)
+        best = min(best, time.perf_counter() - started_at)
+
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        await run(events, None)
+        after, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "events": len(events),
+        "events_per_sec": len(events) / best,
+        "us_per_event": best / len(events) * 1e6,
+        "peak_kib": (peak - before) / 1024,
+        "retained_kib": (after - before) / 1024,
+        "total_bytes": sum(sum(values) for values in sizes.values()),
+        "bytes": {
+            event_type: {"count": len(values), "bytes": sum(values), "bytes_per_event": sum(values) / len(values)}
+            for event_type, values in sorted(sizes.items())
+        },
+    }
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results: Dict[str, Any], baseline: Optional[Dict[str, Any]]):
+    header = f"{'stream':<24} {'target':<7} {'events/s':>11} {'us/event':>9} {'peak KiB':>9} {'kept KiB':>9} {'bytes':>11}"
+    print(header + ("   vs baseline" if baseline else ""))
+    for key, result in results.items():
+        stream, target = key.split("/")
+        line = (
+            f"{stream:<24} {target:<7} {result['events_per_sec']:>11,.0f} {result['us_per_event']:>9.2f} "
+            f"{result['peak_kib']:>9,.0f} {result['retained_kib']:>9,.0f} {result['total_bytes']:>11,}"
+        )
+        previous = (baseline or {}).get(key)
+        if previous:
+            speed = result["events_per_sec"] / previous["events_per_sec"] - 1
+            size = result["total_bytes"] / previous["total_bytes"] - 1 if previous["total_bytes"] else 0.0
+            line += f"   {speed:+7.1%} speed {size:+7.1%} bytes"
+        print(line)
+
+    print()
+    print(f"{'stream':<24} {'target':<7} {'event type':<14} {'count':>7} {'bytes/event':>12}")
+    for key, result in results.items():
+        stream, target = key.split("/")
+        if target == "format":
+            continue
+        for event_type, stats in result["bytes"].items():
+            print(f"{stream:<24} {target:<7} {event_type:<14} {stats['count']:>7,} {stats['bytes_per_event']:>12,.1f}")
+
+
+async def main(args):
+    streams = build_streams(args)
+    results: Dict[str, Any] = {}
+    for name, events in streams.items():
+        for target in args.targets:
+            results[f"{name}/{target}"] = await measure(RUNNERS[target], events, args.repeat)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+    print_results(results, baseline)
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"event_pipeline-{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({
+            "meta": {
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "git": git_revision(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "args": vars(args),
+            },
+            "results": results,
+        }, f, indent=2)
+    print(f"\nresults written to {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--targets", nargs="+", choices=TARGETS, default=list(TARGETS))
+    parser.add_argument("--tokens", type=int, default=2000, help="token 流中的 token 数")
+    parser.add_argument("--tool-calls", type=int, default=20)
+    parser.add_argument("--chain-steps", type=int, default=30)
+    parser.add_argument("--history-turns", type=int, default=8)
+    parser.add_argument("--report-chars", type=int, default=12000)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--output", help="结果文件，默认写入 benchmarks/results/ 下带时间戳的文件")
+    parser.add_argument("--baseline", help="上一次的结果文件，输出吞吐和字节数的变化")
+    asyncio.run(main(parser.parse_args()))
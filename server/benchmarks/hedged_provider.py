@@ -0,0 +1,164 @@
+"""
+对冲（hedged）provider 对首 token 延迟尾部的影响
+
+主、备 provider 都用本地假模型模拟：主 provider 大部分请求很快，但有一小部分首 token 延迟很长（长尾）；
+备用 provider 稳定但中位数更慢。依次运行：
+- 只用主 provider
+- 对冲：主 provider 超出其首 token 延迟分位数预算后向备用发起请求，先到者胜出
+- 主 provider 持续出错：出错时立即切换，连续出错后熔断，之后直接走备用
+同时校验落败的请求被取消、经 astream_events 只上报一份 token
+"""
+import argparse
+import asyncio
+import logging
+import random
+import time
+from typing import Any, AsyncIterator, List, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessageChunk, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+
+from llm.providers import hedged
+from llm.providers.hedged import HedgedChatModel, hedge_stats
+
+
+class FakeProvider(BaseChatModel):
+    """首 token 延迟为 base_ms，以 tail_prob 的概率为 tail_ms；以 error_prob 的概率在首 token 前出错"""
+
+    base_ms: float
+    tail_ms: float = 0.0
+    tail_prob: float = 0.0
+    error_prob: float = 0.0
+    tokens: int = 5
+    token_ms: float = 2.0
+    rng: Any = None
+    active: int = 0
+    cancelled: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-provider"
+
+    def _generate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        raise NotImplementedError
+
+    async def _astream(
+        self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        self.active += 1
+        try:
+            slow = self.rng.random() < self.tail_prob
+            await asyncio.sleep((self.tail_ms if slow else self.base_ms) * self.rng.uniform(0.9, 1.1) / 1000)
+            if self.rng.random() < self.error_prob:
+                raise RuntimeError("provider error")
+            for index in range(self.tokens):
+                yield ChatGenerationChunk(message=AIMessageChunk(content=f"t{index} "))
+                await asyncio.sleep(self.token_ms / 1000)
+        except (asyncio.CancelledError, GeneratorExit):
+            self.cancelled += 1
+            raise
+        finally:
+            self.active -= 1
+
+
+def percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def first_token_ms(model: Any) -> Optional[float]:
+    started_at = time.perf_counter()
+    try:
+        async for _ in model.astream([HumanMessage(content="hi")]):
+            return (time.perf_counter() - started_at) * 1000
+    except RuntimeError:
+        return None
+    return None
+
+
+async def run(model: Any, requests: int, concurrency: int) -> List[Optional[float]]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            return await first_token_ms(model)
+
+    return await asyncio.gather(*(one() for _ in range(requests)))
+
+
+def report(name: str, results: List[Optional[float]], extra: str = ""):
+    ok = [value for value in results if value is not None]
+    print(
+        f"{name:<18} {len(ok):>4}/{len(results):<4} {percentile(ok, 0.5):>8.0f} {percentile(ok, 0.95):>8.0f} "
+        f"{percentile(ok, 0.99):>8.0f}  {extra}"
+    )
+
+
+async def check_events(model: HedgedChatModel):
+    """经 astream_events 时内层模型不应重复上报 token"""
+    tokens = 0
+    async for event in model.astream_events([HumanMessage(content="hi")], version="v2"):
+        if event["event"] == "on_chat_model_stream":
+            tokens += 1
+    assert tokens == 5, f"expected 5 streamed tokens, got {tokens}"
+
+
+async def main(requests: int, concurrency: int):
+    logging.getLogger("llm.providers.hedged").setLevel(logging.ERROR)
+    rng = random.Random(11)
+    hedged.HEDGE_DEFAULT_DELAY = 0.5
+    hedged.HEDGE_MIN_SAMPLES = 20
+    hedged.HEDGE_BREAKER_COOLDOWN = 60
+
+    def primary(**kwargs):
+        return FakeProvider(base_ms=80, tail_ms=2000, tail_prob=0.05, rng=rng, **kwargs)
+
+    def secondary():
+        return FakeProvider(base_ms=150, rng=rng)
+
+    print(f"{'mode':<18} {'ok':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    report("primary only", await run(primary(), requests, concurrency))
+
+    fast, backup = primary(), secondary()
+    model = HedgedChatModel(primary=fast, secondary=backup, primary_name="sim:fast", secondary_name="sim:backup")
+    results = await run(model, requests, concurrency)
+    stats = hedge_stats.stats()
+    report(
+        "hedged",
+        results,
+        f"hedged {stats['hedged']} ({stats['hedge_ratio']:.1%}), backup wins {stats['backup_wins']}, "
+        f"budget {hedge_stats.target('sim:fast').hedge_delay() * 1000:.0f} ms",
+    )
+    await asyncio.sleep(0.05)
+    assert fast.active == 0 and backup.active == 0, "losing requests were not cancelled"
+    print(
+        f"{'':<18} cancelled losers: primary {hedge_stats.target('sim:fast').cancelled}, "
+        f"backup {hedge_stats.target('sim:backup').cancelled}"
+    )
+
+    failing, backup = primary(error_prob=1.0), secondary()
+    model = HedgedChatModel(primary=failing, secondary=backup, primary_name="sim:failing", secondary_name="sim:backup2")
+    before = hedge_stats.failovers
+    results = await run(model, requests, concurrency)
+    target = hedge_stats.target("sim:failing").stats()
+    report(
+        "primary failing",
+        results,
+        f"failovers {hedge_stats.failovers - before}, primary requests {target['requests']}, circuit {target['state']}",
+    )
+    assert all(value is not None for value in results), "failover did not hide primary errors"
+    assert target["state"] == "open" and target["requests"] < requests
+
+    await check_events(HedgedChatModel(
+        primary=primary(), secondary=secondary(), primary_name="sim:events", secondary_name="sim:events-backup"
+    ))
+    print("astream_events: tokens reported once")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency))
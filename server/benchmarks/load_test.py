@@ -0,0 +1,294 @@
+"""
+端到端压测：以固定并发驱动 /api/agents/stream/{agent_name} 和 /api/agents/v1/chat/completions
+
+默认在子进程中启动服务，provider 使用 fake（llm/providers/fake.py），不消耗真实 token；
+假 provider 的首 token 延迟、输出速度、错误率通过 FAKE_LLM_* 环境变量传给服务进程。
+也可以用 --url 压测已经运行的服务，--pid 指定其进程以采集 CPU/RSS。
+报告请求速率、首 token 延迟和完成耗时的分位数、错误数，以及服务进程的 CPU 占用和内存（读取 /proc，仅 Linux）。
+
+raw_web 和 enhanced_markdown 都按请求的 provider 选择模型，--agent 指定压测的 agent。
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 混合快速路径（单一股票，--fast-path 时生效）和需要模型选择工具的请求
+PROMPTS = [
+    "Analyze AAPL",
+    "How has NVDA been trading lately? Give me a short report with a chart",
+    "Write a report on MSFT",
+    "Compare TSLA and the market over the last quarter",
+    "分析一下 GOOGL 的走势",
+]
+
+
+@dataclass
+class Result:
+    endpoint: str
+    status: int
+    ttft: Optional[float]
+    latency: float
+    error: Optional[str] = None
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+class ProcessSampler:
+    """从 /proc 读取进程的 CPU 时间和常驻内存"""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.ticks = os.sysconf("SC_CLK_TCK")
+        self.peak_rss = 0
+
+    def cpu_seconds(self) -> float:
+        with open(f"/proc/{self.pid}/stat") as f:
+            # comm 字段可能含空格，从最后一个右括号之后开始切分
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / self.ticks
+
+    def rss_bytes(self) -> int:
+        with open(f"/proc/{self.pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    rss = int(line.split()[1]) * 1024
+                    self.peak_rss = max(self.peak_rss, rss)
+                    return rss
+        return 0
+
+    async def watch(self, interval: float = 0.25):
+        while True:
+            self.rss_bytes()
+            await asyncio.sleep(interval)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def start_server(args) -> (subprocess.Popen, str):
+    port = free_port()
+    env = {
+        **os.environ,
+        "LOG_LEVEL": args.server_log_level,
+        "FAKE_LLM_TTFT_MS": str(args.ttft_ms),
+        "FAKE_LLM_TOKENS_PER_SECOND": str(args.tokens_per_second),
+        "FAKE_LLM_ERROR_RATE": str(args.error_rate),
+        "FAKE_LLM_RESPONSE_CHARS": str(args.response_chars),
+    }
+    if args.fast_path:
+        env["FAST_PATH_AGENTS"] = args.agent
+    # 服务启动时会创建各 provider 的客户端，压测 fake 时不需要真实的 key
+    env.setdefault("OPENAI_API_KEY", "unused")
+    env.setdefault("GEMINI_API_KEY", "unused")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=SERVER_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL if args.quiet else None,
+    )
+    url = f"http://127.0.0.1:{port}"
+    async with httpx.AsyncClient() as client:
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"Server exited with code {process.returncode}")
+            try:
+                if (await client.get(f"{url}/api/greetings")).status_code == 200:
+                    return process, url
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("Server did not start within 60s")
+
+
+def request_body(args, endpoint: str, index: int) -> Dict[str, Any]:
+    body = {
+        "provider": args.provider,
+        "model": args.model,
+        "messages": [{"role": "user", "content": PROMPTS[index % len(PROMPTS)]}],
+        "stream_options": {"cache": args.cache},
+    }
+    if endpoint == "openai":
+        body["stream"] = True
+    return body
+
+
+def first_token(endpoint: str, payload: str) -> bool:
+    """SSE 数据帧是否携带了非空的模型输出"""
+    if endpoint == "stream":
+        if '"chat_token"' not in payload:
+            return False
+        return bool(json.loads(payload)["event"].get("content"))
+    if '"content"' not in payload or payload == "[DONE]":
+        return False
+    choices = json.loads(payload).get("choices") or []
+    return bool(choices and (choices[0].get("delta") or {}).get("content"))
+
+
+async def one_request(client: httpx.AsyncClient, url: str, args, endpoint: str, index: int) -> Result:
+    if endpoint == "stream":
+        target = f"{url}/api/agents/stream/{args.agent}"
+    else:
+        target = f"{url}/api/agents/v1/chat/completions?agent_name={args.agent}"
+    started_at = time.perf_counter()
+    ttft = None
+    error = None
+    try:
+        async with client.stream("POST", target, json=request_body(args, endpoint, index)) as response:
+            if response.status_code != 200:
+                await response.aread()
+                return Result(endpoint, response.status_code, None, time.perf_counter() - started_at, "http")
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                payload = line[6:]
+                if ttft is None and first_token(endpoint, payload):
+                    ttft = time.perf_counter() - started_at
+                elif error is None and ('"type":"error"' in payload or payload.startswith('{"error"')):
+                    error = "stream"
+            return Result(endpoint, response.status_code, ttft, time.perf_counter() - started_at, error)
+    except httpx.HTTPError as e:
+        return Result(endpoint, 0, None, time.perf_counter() - started_at, type(e).__name__)
+
+
+async def run_load(url: str, args, total: int) -> (List[Result], float):
+    endpoints = ["stream", "openai"] if args.endpoint == "both" else [args.endpoint]
+    results: List[Result] = []
+    next_index = 0
+
+    async def worker(client: httpx.AsyncClient):
+        nonlocal next_index
+        while next_index < total:
+            index = next_index
+            next_index += 1
+            results.append(await one_request(client, url, args, endpoints[index % len(endpoints)], index))
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(args.timeout)) as client:
+        started_at = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(args.concurrency)))
+        return results, time.perf_counter() - started_at
+
+
+def summarize(results: List[Result], elapsed: float) -> Dict[str, Any]:
+    summary: Dict[str, Any] = {}
+    for endpoint in sorted({result.endpoint for result in results}):
+        subset = [result for result in results if result.endpoint == endpoint]
+        ok = [result for result in subset if result.status == 200 and result.error is None]
+        ttfts = [result.ttft for result in ok if result.ttft is not None]
+        latencies = [result.latency for result in ok]
+        summary[endpoint] = {
+            "requests": len(subset),
+            "ok": len(ok),
+            "rejected": sum(result.status == 429 for result in subset),
+            "errors": sum(result.status not in (200, 429) or result.error is not None for result in subset),
+            "rps": len(ok) / elapsed,
+            **{f"ttft_p{int(q * 100)}_ms": percentile(ttfts, q) * 1000 for q in (0.5, 0.95, 0.99)},
+            **{f"latency_p{int(q * 100)}_ms": percentile(latencies, q) * 1000 for q in (0.5, 0.95, 0.99)},
+        }
+    return summary
+
+
+async def main(args):
+    process = None
+    url, pid = args.url, args.pid
+    if url is None:
+        process, url = await start_server(args)
+        pid = process.pid
+    sampler = ProcessSampler(pid) if pid else None
+    watcher = asyncio.create_task(sampler.watch()) if sampler else None
+    try:
+        if args.warmup:
+            await run_load(url, args, args.warmup)
+        cpu_before = sampler.cpu_seconds() if sampler else 0.0
+        results, elapsed = await run_load(url, args, args.requests)
+        cpu_used = sampler.cpu_seconds() - cpu_before if sampler else None
+        rss = sampler.rss_bytes() if sampler else None
+    finally:
+        if watcher is not None:
+            watcher.cancel()
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+
+    summary = {
+        "config": {
+            key: getattr(args, key)
+            for key in ("endpoint", "agent", "provider", "model", "concurrency", "requests", "cache", "fast_path",
+                        "ttft_ms", "tokens_per_second", "error_rate", "response_chars")
+        },
+        "elapsed_s": elapsed,
+        "endpoints": summarize(results, elapsed),
+        "server": {
+            "cpu_percent": cpu_used / elapsed * 100 if cpu_used is not None else None,
+            "cpu_ms_per_request": cpu_used / len(results) * 1000 if cpu_used is not None else None,
+            "rss_mb": rss / 2 ** 20 if rss is not None else None,
+            "peak_rss_mb": sampler.peak_rss / 2 ** 20 if sampler else None,
+        },
+    }
+
+    print(f"{len(results)} requests in {elapsed:.1f}s at concurrency {args.concurrency}")
+    print(
+        f"{'endpoint':<10} {'ok':>6} {'429':>5} {'err':>5} {'rps':>7} "
+        f"{'ttft p50':>9} {'p95':>7} {'p99':>7} {'total p50':>10} {'p95':>7} {'p99':>7}"
+    )
+    for endpoint, stats in summary["endpoints"].items():
+        print(
+            f"{endpoint:<10} {stats['ok']:>6} {stats['rejected']:>5} {stats['errors']:>5} {stats['rps']:>7.1f} "
+            f"{stats['ttft_p50_ms']:>9.0f} {stats['ttft_p95_ms']:>7.0f} {stats['ttft_p99_ms']:>7.0f} "
+            f"{stats['latency_p50_ms']:>10.0f} {stats['latency_p95_ms']:>7.0f} {stats['latency_p99_ms']:>7.0f}"
+        )
+    server = summary["server"]
+    if server["cpu_percent"] is not None:
+        print(
+            f"server: cpu {server['cpu_percent']:.0f}% ({server['cpu_ms_per_request']:.1f} ms/request), "
+            f"rss {server['rss_mb']:.0f} MB (peak {server['peak_rss_mb']:.0f} MB)"
+        )
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="压测已经运行的服务，不启动子进程")
+    parser.add_argument("--pid", type=int, help="--url 对应的服务进程，用于采集 CPU/RSS")
+    parser.add_argument("--endpoint", choices=("stream", "openai", "both"), default="both")
+    parser.add_argument("--agent", default="enhanced_markdown")
+    parser.add_argument("--provider", default="fake")
+    parser.add_argument("--model", default="fake")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--cache", action="store_true", help="允许命中响应缓存（默认关闭，每个请求都完整运行）")
+    parser.add_argument("--fast-path", action="store_true", help="为压测的 agent 开启快速路径（默认关闭）")
+    parser.add_argument("--ttft-ms", type=float, default=400)
+    parser.add_argument("--tokens-per-second", type=float, default=60)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--response-chars", type=int, default=3000)
+    parser.add_argument("--server-log-level", default="WARNING")
+    parser.add_argument("--quiet", action="store_true", help="丢弃服务进程的 stderr")
+    parser.add_argument("--json", help="把结果写入 JSON 文件，便于多次运行之间对比")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,99 @@
+"""
+原始事件日志的格式化开销
+
+- 正确性：content 为 1 MB 的消息、Command 和大状态经 Lazy 格式化后长度受限，
+  且格式化过程的内存峰值与 payload 大小无关（不会先构造完整 repr 再截断）
+- 对比直接 repr 与 Lazy 格式化一条记录的耗时
+"""
+import argparse
+import logging
+import queue
+import time
+import tracemalloc
+
+from langchain_core.messages import AIMessage, ToolMessage
+from langgraph.types import Command
+
+from benchmarks.synthetic_events import report_text, stock_payload
+from utils.log import LOG_PAYLOAD_MAX_BYTES, JSONFormatter, Lazy, _NonBlockingQueueHandler
+
+
+class _Opaque:
+    """repr 会构造巨大字符串的未知对象"""
+
+    def __init__(self):
+        self.reprs = 0
+
+    def __repr__(self) -> str:
+        self.reprs += 1
+        return "x" * 1_000_000
+
+
+def raw_event(content_bytes: int, bars: int) -> dict:
+    tool_message = ToolMessage(content="x" * content_bytes, tool_call_id="call_1", name="get_stock_data")
+    report = AIMessage(content=report_text("raw_web", content_bytes))
+    return {
+        "event": "on_chain_end",
+        "name": "process_tools",
+        "data": {
+            "input": {"messages": [report, tool_message], "next_step": "process_tools"},
+            "output": Command(update={"messages": [tool_message], "payload": stock_payload("AAPL", bars)}),
+        },
+    }
+
+
+def format_record(event: dict) -> str:
+    """与运行时相同的路径：调用线程里 prepare，后台线程 format"""
+    handler = _NonBlockingQueueHandler(queue.Queue())
+    record = logging.makeLogRecord({"msg": "Raw event: %s", "args": (Lazy(event),), "levelno": logging.INFO})
+    return JSONFormatter().format(handler.prepare(record))
+
+
+def peak_bytes(fn, *args) -> int:
+    tracemalloc.start()
+    try:
+        fn(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def check():
+    # 内存峰值不随 content 大小增长：1 MB 与 1 KB 的消息相差不超过几个预算
+    small = raw_event(1_000, 100)
+    large = raw_event(1_000_000, 100)
+    large_peak, small_peak = peak_bytes(format_record, large), peak_bytes(format_record, small)
+    assert large_peak < small_peak + 8 * LOG_PAYLOAD_MAX_BYTES, (large_peak, small_peak)
+    assert large_peak < 100_000, large_peak
+
+    text = str(Lazy(large["data"]["input"]["messages"][1]))
+    assert text.startswith("ToolMessage(content='xxx") and len(text) <= LOG_PAYLOAD_MAX_BYTES + 20, text[-80:]
+
+    opaque = _Opaque()
+    assert str(Lazy({"value": opaque, "items": [opaque]})) == "{'value': <_Opaque>, 'items': [<_Opaque>]}"
+    assert opaque.reprs == 0, "Lazy called the full repr of an unknown object"
+    print(f"correctness: 1 MB message formatted with peak {large_peak:,} bytes (1 KB message: {small_peak:,})")
+
+
+def main(sizes: list, repeat: int):
+    check()
+    print(f"{'content bytes':>14} {'repr ms':>10} {'Lazy ms':>10} {'record bytes':>13}")
+    for size in sizes:
+        event = raw_event(size, 100)
+        started_at = time.perf_counter()
+        for _ in range(repeat):
+            repr(event)
+        repr_ms = (time.perf_counter() - started_at) / repeat * 1000
+        started_at = time.perf_counter()
+        for _ in range(repeat):
+            line = format_record(event)
+        lazy_ms = (time.perf_counter() - started_at) / repeat * 1000
+        print(f"{size:>14,} {repr_ms:>10.3f} {lazy_ms:>10.3f} {len(line.encode('utf-8')):>13,}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    main(args.sizes, args.repeat)
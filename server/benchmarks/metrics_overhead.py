@@ -0,0 +1,109 @@
+"""
+流式指标的开销与 /api/metrics 输出校验
+
+- 逐事件开销：RunMetrics.on_raw_event 处理一次完整运行的原始事件，每个事件的耗时
+- 占比：与 LangGraphHandler.stream 处理同一事件流的每事件耗时对比
+- 输出：运行结束后解析 Prometheus 文本，校验累积桶单调、_count 与 +Inf 桶一致、
+  SSE 字节数与客户端收到的一致、活跃流数回到 0
+"""
+import argparse
+import asyncio
+import re
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from core.types.models import ChatMessage, ChatRequest, StreamOptions
+from agents.langgraph_handler import LangGraphHandler
+from agents.metrics import RunMetrics, metrics_registry
+from benchmarks.synthetic_events import SyntheticGraph, agent_run_events
+
+SAMPLE_LINE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{(.*)\})? (\S+)$')
+LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def parse(text: str) -> List[Tuple[str, Dict[str, str], float]]:
+    samples = []
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        match = SAMPLE_LINE.match(line)
+        assert match, f"malformed sample line: {line!r}"
+        labels = dict(LABEL.findall(match.group(3) or ""))
+        samples.append((match.group(1), labels, float(match.group(4))))
+    return samples
+
+
+def check_histograms(samples: List[Tuple[str, Dict[str, str], float]]) -> int:
+    """每组标签的桶必须累积单调，且 +Inf 桶等于 _count"""
+    buckets: Dict[Tuple, List[Tuple[float, float]]] = defaultdict(list)
+    counts: Dict[Tuple, float] = {}
+    for name, labels, value in samples:
+        if name.endswith("_bucket"):
+            key = (name[:-7], tuple(sorted((k, v) for k, v in labels.items() if k != "le")))
+            buckets[key].append((float(labels["le"]), value))
+        elif name.endswith("_count"):
+            counts[(name[:-6], tuple(sorted(labels.items())))] = value
+    for key, series in buckets.items():
+        values = [value for _, value in series]
+        assert values == sorted(values), f"buckets of {key} are not cumulative"
+        assert series[-1][0] == float("inf") and series[-1][1] == counts[key], f"+Inf bucket of {key} != _count"
+    return len(buckets)
+
+
+def per_event_ns(events: list, repeat: int) -> float:
+    started_at = time.perf_counter()
+    for _ in range(repeat):
+        metrics = RunMetrics("bench", "bench", "bench")
+        for event in events:
+            metrics.on_raw_event(event)
+        metrics.finish()
+    return (time.perf_counter() - started_at) / (repeat * len(events)) * 1e9
+
+
+async def handler_run(handler: LangGraphHandler) -> int:
+    # 关闭响应缓存，每次都真正跑一遍事件流
+    request = ChatRequest(
+        messages=[ChatMessage(role="user", content="Analyze AAPL")],
+        provider="bench",
+        stream_options=StreamOptions(cache=False),
+    )
+    sent = 0
+    async for frame in handler.stream(request):
+        sent += len(frame.encode("utf-8"))
+    return sent
+
+
+async def main(report_chars: int, repeat: int):
+    print(f"{'agent':<20} {'events':>8} {'metrics ns/event':>18} {'handler ns/event':>18} {'share':>8}")
+    sent: Dict[str, int] = {}
+    for agent in ("raw_web", "enhanced_markdown"):
+        events = agent_run_events(agent, report_chars=report_chars)
+        metrics_ns = per_event_ns(events, repeat)
+
+        handler = LangGraphHandler(SyntheticGraph(events), agent_name=agent)
+        started_at = time.perf_counter()
+        sent[agent] = 0
+        for _ in range(repeat):
+            sent[agent] += await handler_run(handler)
+        handler_ns = (time.perf_counter() - started_at) / (repeat * len(events)) * 1e9
+        print(f"{agent:<20} {len(events):>8} {metrics_ns:>18,.0f} {handler_ns:>18,.0f} {metrics_ns / handler_ns:>8.1%}")
+
+    text = metrics_registry.render()
+    samples = parse(text)
+    histograms = check_histograms(samples)
+    values = {(name, labels.get("agent"), labels.get("endpoint")): value for name, labels, value in samples}
+    for agent in sent:
+        assert values[("genui_streams_total", agent, "stream")] == repeat
+        assert values[("genui_sse_bytes_total", agent, None)] == sent[agent], "SSE bytes do not match client bytes"
+        assert values[("genui_active_streams", agent, None)] == 0
+        assert values[("genui_time_to_first_token_seconds_count", agent, None)] == repeat
+    print(f"render: {len(text):,} bytes, {len(samples)} samples, {histograms} histogram series valid")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--report-chars", type=int, default=12000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.report_chars, args.repeat))
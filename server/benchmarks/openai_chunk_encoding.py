@@ -0,0 +1,69 @@
+"""
+/api/agents/v1/chat/completions 每个 token 的 chunk 编码开销
+
+先校验 OpenAIChunkEncoder 的输出与 Pydantic model_dump_json 逐字节一致，
+再对比两种编码方式的单 token CPU 耗时
+"""
+import argparse
+import time
+import uuid
+
+from core.types.models import OpenAIChatCompletionStreamResponse, OpenAIChoice
+from agents.sse import OpenAIChunkEncoder
+
+SAMPLE_TOKENS = [
+    "", " the", "Hello", " 股票", "\n", "\n\n", "\t", "\"quoted\"", "back\\slash",
+    "</script>", "<div class=\"chart\">", "emoji 📈", " ", "\x00\x1f\x7f", "é", "&amp;",
+]
+
+
+def pydantic_chunk(completion_id: str, created: int, model: str, content: str) -> str:
+    chunk = OpenAIChatCompletionStreamResponse(
+        id=completion_id,
+        created=created,
+        model=model,
+        choices=[OpenAIChoice(
+            index=0,
+            delta={"content": content},
+            finish_reason=None
+        )]
+    )
+    return f"data: {chunk.model_dump_json()}\n\n"
+
+
+def check_correctness(completion_id: str, created: int, model: str):
+    encoder = OpenAIChunkEncoder(completion_id, created, model)
+    for token in SAMPLE_TOKENS:
+        expected = pydantic_chunk(completion_id, created, model, token)
+        actual = encoder.encode(token)
+        assert actual == expected, f"mismatch for {token!r}:\n{actual!r}\n{expected!r}"
+    print(f"correctness: {len(SAMPLE_TOKENS)} sample tokens match Pydantic output")
+
+
+def bench(label: str, encode, tokens: int) -> float:
+    start = time.process_time()
+    for i in range(tokens):
+        encode(SAMPLE_TOKENS[i % len(SAMPLE_TOKENS)])
+    per_token_us = (time.process_time() - start) / tokens * 1e6
+    print(f"{label:<12} {per_token_us:8.3f} us CPU/token")
+    return per_token_us
+
+
+def main(tokens: int):
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:20]}"
+    created = int(time.time())
+    model = "gpt-4o"
+
+    check_correctness(completion_id, created, model)
+
+    encoder = OpenAIChunkEncoder(completion_id, created, model)
+    baseline = bench("pydantic", lambda t: pydantic_chunk(completion_id, created, model, t), tokens)
+    optimized = bench("precompiled", encoder.encode, tokens)
+    print(f"speedup: {baseline / optimized:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tokens", type=int, default=200000)
+    args = parser.parse_args()
+    main(args.tokens)
@@ -0,0 +1,81 @@
+"""
+每次 raw_web / enhanced_markdown 运行的 SSE 总字节数
+
+对比步骤事件携带完整图状态（full_state=True，旧行为）与只携带增量（默认）
+"""
+import argparse
+import asyncio
+import json
+import uuid
+from typing import Tuple
+
+from langchain_core.messages import ToolMessage
+
+from core.types.models import ChatMessage, ChatRequest, StreamOptions
+from agents.langgraph_handler import LangGraphHandler
+from agents.tools.executor import ToolExecutor
+from benchmarks.synthetic_events import SyntheticGraph, agent_run_events
+
+
+async def sse_bytes(handler: LangGraphHandler, full_state: bool) -> Tuple[int, int]:
+    """返回 (SSE 总字节数, 其中步骤事件的字节数)"""
+    request = ChatRequest(
+        messages=[ChatMessage(role="user", content="Analyze AAPL")],
+        stream_options=StreamOptions(full_state=full_state),
+    )
+    total = steps = 0
+    async for frame in handler.stream(request):
+        size = len(frame.encode("utf-8"))
+        total += size
+        if '"type":"step_' in frame:
+            steps += size
+    return total, steps
+
+
+async def check():
+    """同一条消息跨步骤只在增量中出现一次，包括节点内创建、add_messages 之后才分配 id 的 ToolMessage"""
+    anonymous = ToolMessage(content="x" * 100, tool_call_id="call_1", name="get_stock_data")
+    with_id = anonymous.model_copy(update={"id": str(uuid.uuid4())})
+    events = []
+    for event in agent_run_events("raw_web", bars=10, report_chars=200):
+        # process_tools 输出的 ToolMessage 还没有 id，之后各步骤看到的是 add_messages 分配了 id 的同一条消息
+        tool_message = anonymous if (event["name"], event["event"]) == ("process_tools", "on_chain_end") else with_id
+        data = {
+            key: {**value, "messages": [tool_message if m.type == "tool" else m for m in value["messages"]]}
+            if isinstance(value, dict) and "messages" in value else value
+            for key, value in event["data"].items()
+        }
+        events.append({**event, "data": data})
+
+    request = ChatRequest(messages=[ChatMessage(role="user", content="Analyze AAPL")])
+    seen = []
+    async for frame in LangGraphHandler(SyntheticGraph(events)).stream(request):
+        if not frame.startswith("data: "):
+            continue
+        metadata = (json.loads(frame[len("data: "):]).get("event") or {}).get("metadata") or {}
+        seen.extend(message["type"] for message in metadata.get("new_messages", []))
+    assert seen.count("tool") == 1, seen
+
+    # 执行器创建的 ToolMessage 构造时就带 id
+    [message] = await ToolExecutor([]).run([{"name": "missing", "args": {}, "id": "call_1"}])
+    assert message.id and uuid.UUID(message.id)
+    print(f"correctness: ToolMessage counted once across steps {seen}")
+
+
+async def main(bars: int, report_chars: int):
+    await check()
+    print(f"{'agent':<20} {'':<8} {'full_state':>12} {'delta':>12} {'saved':>8}")
+    for agent in ("raw_web", "enhanced_markdown"):
+        handler = LangGraphHandler(SyntheticGraph(agent_run_events(agent, bars, report_chars)))
+        before_total, before_steps = await sse_bytes(handler, full_state=True)
+        after_total, after_steps = await sse_bytes(handler, full_state=False)
+        print(f"{agent:<20} {'total':<8} {before_total:>12,} {after_total:>12,} {1 - after_total / before_total:>8.1%}")
+        print(f"{'':<20} {'steps':<8} {before_steps:>12,} {after_steps:>12,} {1 - after_steps / before_steps:>8.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--bars", type=int, default=100)
+    parser.add_argument("--report-chars", type=int, default=12000)
+    args = parser.parse_args()
+    asyncio.run(main(args.bars, args.report_chars))
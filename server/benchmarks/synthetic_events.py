@@ -0,0 +1,177 @@
+"""
+合成的 astream_events v2 事件流
+
+按 raw_web / enhanced_markdown 一次真实运行的形状构造事件：
+chat_node 工具调用 -> process_tools 返回 100 条行情 -> generate_report 流式输出报告
+"""
+import random
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, ToolMessage
+
+TOKEN_SIZES = (1, 4, 16)
+
+
+def stock_payload(ticker: str = "AAPL", bars: int = 100, seed: int = 7) -> Dict[str, List[dict]]:
+    """与 raw_web get_stock_data 相同形状的 OHLCV 数据"""
+    rng = random.Random(seed)
+    rows = []
+    price = 150.0
+    start = datetime(2024, 1, 1)
+    for i in range(bars):
+        open_price = price
+        close_price = open_price * (1 + rng.uniform(-0.03, 0.03))
+        rows.append({
+            "date": (start + timedelta(days=i)).strftime("%Y-%m-%d"),
+            "open": round(open_price, 2),
+            "high": round(max(open_price, close_price) * rng.uniform(1.0, 1.02), 2),
+            "low": round(min(open_price, close_price) * rng.uniform(0.98, 1.0), 2),
+            "close": round(close_price, 2),
+            "volume": rng.randint(1000000, 10000000),
+        })
+        price = close_price
+    return {ticker: rows}
+
+
+def report_text(agent: str, approx_chars: int) -> str:
+    if agent == "raw_web":
+        unit = (
+            "<div class=\"card\"><h2>Trend</h2><p>The stock closed higher on strong volume.</p></div>\n"
+            "<script>d3.select('#chart').append('rect').attr('width', 12);</script>\n"
+        )
+    else:
+        unit = (
+            "## Trend\nThe stock <highlight>closed higher</highlight> on strong volume.\n\n"
+            "<CandlestickChart title=\"AAPL\" />\n\n"
+        )
+    return (unit * (approx_chars // len(unit) + 1))[:approx_chars]
+
+
+def split_tokens(text: str, token_chars: int) -> List[str]:
+    return [text[i:i + token_chars] for i in range(0, len(text), token_chars)]
+
+
+def _event(event: str, name: str, data: Dict[str, Any], run_id: str, node: str = "") -> Dict[str, Any]:
+    return {
+        "event": event,
+        "name": name,
+        "run_id": run_id,
+        "tags": [f"graph:step:{node}"] if node else [],
+        "metadata": {"langgraph_node": node} if node else {},
+        "data": data,
+    }
+
+
+def _node(name: str, state: Dict[str, Any], output: Dict[str, Any], inner: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    run_id = str(uuid.uuid4())
+    return [
+        _event("on_chain_start", name, {"input": state}, run_id, name),
+        *inner,
+        _event("on_chain_end", name, {"input": state, "output": output}, run_id, name),
+    ]
+
+
+def _model_stream(node: str, tokens: List[str]) -> List[Dict[str, Any]]:
+    run_id = str(uuid.uuid4())
+    events = [_event("on_chat_model_start", "ChatOpenAI", {"input": {}}, run_id, node)]
+    for token in tokens:
+        events.append(_event("on_chat_model_stream", "ChatOpenAI", {"chunk": AIMessageChunk(content=token)}, run_id, node))
+    events.append(_event("on_chat_model_end", "ChatOpenAI", {"output": AIMessage(content="".join(tokens))}, run_id, node))
+    return events
+
+
+def agent_run_events(
+    agent: str = "raw_web",
+    bars: int = 100,
+    report_chars: int = 12000,
+    token_chars: int = 4,
+) -> List[Dict[str, Any]]:
+    """构造一次完整代理运行的原始事件序列"""
+    human = HumanMessage(content="Analyze AAPL", id=str(uuid.uuid4()))
+    tool_call = {"name": "get_stock_data", "args": {"stock_name": "AAPL"}, "id": "call_1"}
+    ai_call = AIMessage(content="", tool_calls=[tool_call], id=str(uuid.uuid4()))
+    payload = stock_payload("AAPL", bars)
+    tool_message = ToolMessage(content=str(payload), tool_call_id="call_1", id=str(uuid.uuid4()))
+    report = report_text(agent, report_chars)
+    report_message = AIMessage(content=report, id=str(uuid.uuid4()))
+
+    state0 = {"messages": [human], "next_step": None}
+    state1 = {"messages": [human, ai_call], "next_step": "process_tools"}
+    state2 = {"messages": [human, ai_call, tool_message], "next_step": "generate_report"}
+    state3 = {"messages": [human, ai_call, tool_message, report_message], "next_step": "end"}
+
+    tool_run = str(uuid.uuid4())
+    root_run = str(uuid.uuid4())
+    return [
+        _event("on_chain_start", "LangGraph", {"input": state0}, root_run),
+        *_node("chat_node", state0, state1, _model_stream("chat_node", [""])),
+        *_node("process_tools", state1, state2, [
+            _event("on_tool_start", "get_stock_data", {"input": {"stock_name": "AAPL"}}, tool_run, "process_tools"),
+            _event("on_tool_end", "get_stock_data", {"input": {"stock_name": "AAPL"}, "output": payload}, tool_run, "process_tools"),
+        ]),
+        *_node("generate_report", state2, state3, _model_stream("generate_report", split_tokens(report, token_chars))),
+        _event("on_chain_end", "LangGraph", {"input": state0, "output": state3}, root_run),
+    ]
+
+
+def token_stream_events(token_chars: int, tokens: int = 2000, agent: str = "enhanced_markdown") -> List[Dict[str, Any]]:
+    """generate_report 节点内的一段 token 流，每个 token token_chars 个字符"""
+    state = {"messages": [HumanMessage(content="Analyze AAPL", id=str(uuid.uuid4()))], "next_step": None}
+    text = report_text(agent, token_chars * tokens)
+    return _node("generate_report", state, state, _model_stream("generate_report", split_tokens(text, token_chars)))
+
+
+def tool_events(calls: int = 20, bars: int = 100) -> List[Dict[str, Any]]:
+    """成对的 get_stock_data 工具开始 / 结束事件，结束事件携带 bars 条行情"""
+    events = []
+    for index in range(calls):
+        ticker = f"T{index}"
+        tool_input = {"stock_name": ticker}
+        tool_run = str(uuid.uuid4())
+        events.append(_event("on_tool_start", "get_stock_data", {"input": tool_input}, tool_run, "process_tools"))
+        events.append(_event(
+            "on_tool_end", "get_stock_data",
+            {"input": tool_input, "output": stock_payload(ticker, bars, seed=index)}, tool_run, "process_tools",
+        ))
+    return events
+
+
+def chain_events(steps: int = 30, history_turns: int = 8, bars: int = 100, report_chars: int = 4000) -> List[Dict[str, Any]]:
+    """
+    携带大状态的节点开始 / 结束事件
+    状态中是 history_turns 轮历史对话（每轮一份工具结果和一份报告），每个节点在末尾追加一条消息
+    """
+    messages: List[Any] = []
+    for turn in range(history_turns):
+        ticker = f"T{turn}"
+        tool_call = {"name": "get_stock_data", "args": {"stock_name": ticker}, "id": f"call_{turn}"}
+        messages += [
+            HumanMessage(content=f"Analyze {ticker}", id=str(uuid.uuid4())),
+            AIMessage(content="", tool_calls=[tool_call], id=str(uuid.uuid4())),
+            ToolMessage(content=str(stock_payload(ticker, bars, seed=turn)), tool_call_id=f"call_{turn}", id=str(uuid.uuid4())),
+            AIMessage(content=report_text("enhanced_markdown", report_chars), id=str(uuid.uuid4())),
+        ]
+    nodes = ("chat_node", "process_tools", "generate_report")
+    events = []
+    for step in range(steps):
+        state = {"messages": messages, "next_step": nodes[step % len(nodes)]}
+        messages = messages + [AIMessage(content=f"step {step}", id=str(uuid.uuid4()))]
+        events += _node(nodes[step % len(nodes)], state, {"messages": messages, "next_step": nodes[(step + 1) % len(nodes)]}, [])
+    return events
+
+
+class SyntheticGraph:
+    """回放预先构造的事件序列，接口与 CompiledStateGraph.astream_events / ainvoke 相同"""
+
+    def __init__(self, events: List[Dict[str, Any]]):
+        self.events = events
+
+    async def ainvoke(self, state, config=None, **kwargs):
+        # 根 on_chain_end 的 output 即最终状态
+        return self.events[-1]["data"]["output"]
+
+    async def astream_events(self, state, config=None, version="v2", **kwargs):
+        for event in self.events:
+            yield event
@@ -0,0 +1,86 @@
+"""
+推测性工具预取节省的端到端时间
+
+用与真实代理相同结构的 LangGraph（chat_node -> process_tools）运行，
+chat_node 用固定延迟模拟模型往返，get_stock_data 用固定延迟模拟行情拉取；
+分别统计预取命中（模型调用的股票与用户输入一致）和未命中时的单次运行耗时
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Optional
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import tool
+from langgraph.graph import END, START, StateGraph
+from langgraph.graph.message import MessagesState
+
+from agents.tools.executor import ToolExecutor
+from agents.tools.tickers import speculative_tool_calls
+
+
+class State(MessagesState):
+    called: Optional[str]
+
+
+def build_graph(executor: ToolExecutor, llm_ms: float, prefetch: bool):
+    async def chat_node(state: State, config: RunnableConfig):
+        if prefetch:
+            executor.prefetch(speculative_tool_calls(state), config)
+        await asyncio.sleep(llm_ms / 1000)
+        tool_call = {"name": "get_stock_data", "args": {"stock_name": state["called"]}, "id": "call_1"}
+        return {"messages": [AIMessage(content="", tool_calls=[tool_call])]}
+
+    async def process_tools(state: State, config: RunnableConfig):
+        return {"messages": await executor.run(state["messages"][-1].tool_calls, config)}
+
+    workflow = StateGraph(State)
+    workflow.add_node("chat_node", chat_node)
+    workflow.add_node("process_tools", process_tools)
+    workflow.add_edge(START, "chat_node")
+    workflow.add_edge("chat_node", "process_tools")
+    workflow.add_edge("process_tools", END)
+    return workflow.compile()
+
+
+async def run_once(graph, prompt: str, called: str, run: int) -> float:
+    started_at = time.perf_counter()
+    await graph.ainvoke(
+        {"messages": [HumanMessage(content=prompt)], "called": called},
+        {"configurable": {"run_id": f"run-{run}"}},
+    )
+    return (time.perf_counter() - started_at) * 1000
+
+
+async def main(llm_ms: float, fetch_ms: float, runs: int):
+    @tool
+    def get_stock_data(stock_name: str) -> dict:
+        """GET Stock Data from given stock name"""
+        time.sleep(fetch_ms / 1000)
+        return {"stock_name": stock_name, "data": []}
+
+    print(f"model {llm_ms:.0f} ms, fetch {fetch_ms:.0f} ms, {runs} runs each")
+    print(f"{'case':<28} {'p50 ms':>8} {'saved ms':>9}")
+    baseline = None
+    for case, prefetch, called in (
+        ("no prefetch", False, "AAPL"),
+        ("prefetch, ticker matches", True, "AAPL"),
+        ("prefetch, ticker differs", True, "MSFT"),
+    ):
+        executor = ToolExecutor([get_stock_data])
+        graph = build_graph(executor, llm_ms, prefetch)
+        latencies = [await run_once(graph, "Analyze Apple stock", called, run) for run in range(runs)]
+        p50 = statistics.median(latencies)
+        baseline = baseline or p50
+        print(f"{case:<28} {p50:>8.1f} {baseline - p50:>9.1f}   {executor.stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--llm-ms", type=float, default=800)
+    parser.add_argument("--fetch-ms", type=float, default=400)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.llm_ms, args.fetch_ms, args.runs))
@@ -0,0 +1,78 @@
+"""
+工具结果编码对 prompt token 数和延迟的影响
+
+对 100 条和 1000 条 OHLCV 数据分别比较 repr / columnar / csv 三种编码：
+  - ToolMessage 内容的字节数与 token 数
+  - 本地编码耗时
+  - --live 时调用真实模型，测量一次读入数据后的端到端延迟（会消耗 token）
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from agents.tools.encoding import ENCODINGS, encode_tool_result
+from benchmarks.synthetic_events import stock_payload
+from llm.tokens import count_tokens
+
+
+async def live_latency(content: str, provider: str, model: str) -> float:
+    from llm import LLM, import_clients
+
+    import_clients()
+    client = LLM(provider=provider, model_name=model).get_client()
+    started_at = time.perf_counter()
+    await client.ainvoke([
+        SystemMessage(content="You are a stock market analyst. Answer in one sentence."),
+        HumanMessage(content=f"Stock data:\n{content}\n\nWhat was the last close price?"),
+    ])
+    return time.perf_counter() - started_at
+
+
+def check():
+    """键顺序不同的行按列名取值，不会错位到别的列下"""
+    rows = stock_payload("AAPL", 3)["AAPL"]
+    rows[1] = dict(reversed(list(rows[1].items())))
+    columnar = json.loads(encode_tool_result("get_stock_data", {"AAPL": rows}, "columnar"))["AAPL"]
+    assert [dict(zip(columnar["columns"], row)) for row in columnar["rows"]] == rows
+    lines = encode_tool_result("get_stock_data", {"AAPL": rows}, "csv").splitlines()
+    header = lines.index(",".join(columnar["columns"]))
+    close = columnar["columns"].index("close")
+    assert [float(line.split(",")[close]) for line in lines[header + 1:]] == [row["close"] for row in rows]
+    print("correctness: reordered rows keep values under their own columns")
+
+
+async def main(series: list, live: bool, provider: str, model: str, repeat: int):
+    check()
+    print(f"{'bars':>6} {'encoding':<10} {'bytes':>10} {'tokens':>9} {'encode ms':>10}" + (f" {'e2e s':>8}" if live else ""))
+    for bars in series:
+        payload = stock_payload("AAPL", bars)
+        baseline_tokens = None
+        for encoding in ENCODINGS:
+            started_at = time.perf_counter()
+            for _ in range(repeat):
+                content = encode_tool_result("get_stock_data", payload, encoding)
+            encode_ms = (time.perf_counter() - started_at) / repeat * 1000
+
+            tokens = count_tokens(content, model)
+            baseline_tokens = baseline_tokens or tokens
+            line = (
+                f"{bars:>6} {encoding:<10} {len(content.encode('utf-8')):>10,} "
+                f"{tokens:>9,} {encode_ms:>10.3f}"
+            )
+            if live:
+                line += f" {await live_latency(content, provider, model):>8.2f}"
+            print(f"{line}   ({tokens / baseline_tokens:.0%} of repr tokens)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--bars", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--live", action="store_true", help="调用真实模型测量端到端延迟")
+    parser.add_argument("--provider", default="openai")
+    parser.add_argument("--model", default="gpt-4o")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.bars, args.live, args.provider, args.model, args.repeat))
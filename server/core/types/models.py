@@ -19,6 +19,18 @@ class ChatMessage(BaseModel):
         else:
             return HumanMessage(content=self.content)
 
+class StreamOptions(BaseModel):
+    """流式输出选项，按请求选择"""
+    coalesce_tokens: bool = False  # 合并连续的 CHAT_TOKEN 事件为一帧
+    coalesce_window_ms: int = 50  # 合并时间窗口
+    coalesce_max_bytes: int = 4096  # 单帧合并内容上限
+    full_state: bool = False  # 步骤事件携带完整图状态，默认只发送增量
+    cache: bool = False  # 读写响应缓存，代理需要同时配置了 RESPONSE_CACHE_TTL / RESPONSE_CACHE_AGENT_TTLS
+    replay_pacing: bool = False  # 缓存命中时按原始节奏回放
+    include_usage: bool = False  # OpenAI 兼容流最后发送用量块（choices 为空），与 OpenAI 一样需要显式开启
+    token_budget: Optional[int] = None  # 单次请求的 token 上限，超出后中止运行
+    parse_components: bool = False  # 服务端解析组件标签，输出 chat_component 事件和纯文本增量
+
 class ChatRequest(BaseModel):
     provider: Optional[str] = "openai"
     model: Optional[str] = "gpt-4o"
@@ -27,6 +39,9 @@ class ChatRequest(BaseModel):
     stream: Optional[bool] = True
     config: Optional[Dict[str, Any]] = None
     agent_name: Optional[str] = None  # 代理名称，可选字段
+    stream_options: Optional[StreamOptions] = None
+    thread_id: Optional[str] = None  # 会话 ID，服务端启用 checkpointer 时只需发送新消息
+    priority: Optional[Literal["interactive", "batch"]] = None  # 准入排队优先级，默认流式为 interactive、非流式为 batch
 
 class ChatResponse(BaseModel):
     content: str
@@ -45,6 +60,7 @@ class EventType(str, Enum):
     """LangGraph 事件类型枚举"""
     CHAT_START = "chat_start"
     CHAT_TOKEN = "chat_token"
+    CHAT_COMPONENT = "chat_component"
     CHAT_END = "chat_end"
     TOOL_START = "tool_start"
     TOOL_END = "tool_end"
@@ -137,6 +153,7 @@ class OpenAIChatCompletionStreamResponse(BaseModel):
     created: int
     model: str
     choices: List[OpenAIChoice]
+    usage: Optional[OpenAIUsage] = None
 
 def convert_to_chat_request(openai_request: ChatRequest) -> ChatRequest:
     """将 OpenAI 请求转换为内部 ChatRequest 格式"""
@@ -146,9 +163,11 @@ def convert_to_chat_request(openai_request: ChatRequest) -> ChatRequest:
     ]
 
     return ChatRequest(
-        provider="openai",  # 默认提供商
+        provider=openai_request.provider or "openai",  # 默认提供商
         model=openai_request.model,
         messages=messages,
         stream=openai_request.stream,
+        stream_options=openai_request.stream_options,
+        thread_id=openai_request.thread_id,
     )
 
@@ -1,9 +1,13 @@
 import importlib
 import os
-from typing import Dict, Optional, Type
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Type
 
+import httpx
 from langchain_core.language_models import BaseChatModel
 from llm.base import BaseLLMClient
+from utils.env import get_env_variable
 
 
 class LLMTokenLike:
@@ -42,6 +46,127 @@ def import_clients(directory: str = "providers"):
             importlib.import_module(module_name)
 
 
+LLM_CLIENT_CACHE_SIZE = int(get_env_variable("LLM_CLIENT_CACHE_SIZE", "32"))
+LLM_HTTP_MAX_CONNECTIONS = int(get_env_variable("LLM_HTTP_MAX_CONNECTIONS", "100"))
+LLM_HTTP_MAX_KEEPALIVE = int(get_env_variable("LLM_HTTP_MAX_KEEPALIVE", "20"))
+
+
+class _PooledTransport(httpx.AsyncHTTPTransport):
+    """httpx transport that counts new vs. reused pool connections."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.requests = 0
+        self.new_connections = 0
+        # 连接池只在没有可复用的 keep-alive 连接时调用 create_connection，
+        # 在这里计数不受并发请求同时增减连接池大小的影响
+        create_connection = self._pool.create_connection
+
+        def counted_create_connection(origin):
+            self.new_connections += 1
+            return create_connection(origin)
+
+        self._pool.create_connection = counted_create_connection
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        return await super().handle_async_request(request)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "requests": self.requests,
+            "new_connections": self.new_connections,
+            "reused_connections": self.requests - self.new_connections,
+            "open_connections": len(self._pool.connections),
+        }
+
+
+_http_transports: Dict[str, _PooledTransport] = {}
+_http_clients: Dict[str, httpx.AsyncClient] = {}
+
+
+def get_shared_http_async_client(provider: str) -> httpx.AsyncClient:
+    """Return the process-wide pooled async HTTP client for a provider."""
+    client = _http_clients.get(provider)
+    if client is None:
+        transport = _PooledTransport(
+            limits=httpx.Limits(
+                max_connections=LLM_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_HTTP_MAX_KEEPALIVE,
+            ),
+            http2=False,
+        )
+        client = httpx.AsyncClient(transport=transport, timeout=httpx.Timeout(600.0, connect=10.0))
+        _http_transports[provider] = transport
+        _http_clients[provider] = client
+    return client
+
+
+class LLMClientCache:
+    """Bounded LRU cache of provider client instances."""
+
+    def __init__(self, maxsize: int = LLM_CLIENT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[Hashable, BaseLLMClient]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], BaseLLMClient]) -> BaseLLMClient:
+        with self._lock:
+            client = self._entries.get(key)
+            if client is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return client
+            self.misses += 1
+
+        client = factory()
+
+        with self._lock:
+            # 并发 miss 时保留先写入的实例，避免重复占用连接
+            existing = self._entries.get(key)
+            if existing is not None:
+                self._entries.move_to_end(key)
+                return existing
+            self._entries[key] = client
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return client
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / total if total else 0.0,
+            }
+
+
+llm_client_cache = LLMClientCache()
+
+
+def get_llm_client_stats() -> Dict[str, Any]:
+    """Client cache hit/miss and per-provider connection reuse statistics."""
+    return {
+        "cache": llm_client_cache.stats(),
+        "transports": {
+            provider: transport.stats()
+            for provider, transport in _http_transports.items()
+        },
+    }
+
+
 class LLM:
     llm_token: LLMTokenLike
     client: Optional[BaseLLMClient]
@@ -52,9 +177,23 @@ class LLM:
             model_name: str = "gpt-4o",
             temperature: Optional[float] = 0.2,
             n: Optional[int] = 1,
-            top_p: Optional[float] = None
+            top_p: Optional[float] = None,
+            max_tokens: Optional[int] = 1500,
+            streaming: Optional[bool] = False,
     ):
-        self._client = self.get_llm_client(provider, model_name, temperature=temperature, n=n, top_p=top_p)
+        key = (provider, model_name, temperature, top_p, max_tokens, streaming, n)
+        self._client = llm_client_cache.get_or_create(
+            key,
+            lambda: self.get_llm_client(
+                provider,
+                model_name,
+                temperature=temperature,
+                n=n,
+                top_p=top_p,
+                max_tokens=max_tokens,
+                streaming=streaming,
+            ),
+        )
 
     def get_llm_client(
         self,
@@ -70,14 +209,17 @@ class LLM:
         """Get an LLM client based on the specified name."""
         if provider in llm_client_registry:
             client_class = llm_client_registry[provider]
+            # 未显式传入 api_key 时使用各 provider 自己从环境变量读取的默认值
+            credentials = {"api_key": api_key} if api_key is not None else {}
             return client_class(
                 model_name=model_name,
                 temperature=temperature,
                 n=n,
                 top_p=top_p,
-                api_key=api_key,
                 streaming=streaming,
                 max_tokens=max_tokens,
+                http_async_client=get_shared_http_async_client(provider),
+                **credentials,
             )
 
         raise ValueError(f"Provider '{provider}' not found.")
@@ -0,0 +1,357 @@
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+from llm.tokens import count_tokens
+from utils.env import get_env_variable
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE, BATCH = 0, 1
+PRIORITIES = {"interactive": INTERACTIVE, "batch": BATCH}
+PRIORITY_NAMES = {value: name for name, value in PRIORITIES.items()}
+
+# 按 provider 或 "provider:model" 配置的限额，例如
+# {"openai": {"concurrency": 32, "tokens_per_minute": 400000}, "openai:gpt-4o": {"concurrency": 16}}
+ADMISSION_LIMITS: Dict[str, Dict[str, float]] = json.loads(get_env_variable("ADMISSION_LIMITS", "{}"))
+# 未单独配置的 provider 的并发上限，0 表示不限制
+ADMISSION_DEFAULT_CONCURRENCY = int(get_env_variable("ADMISSION_DEFAULT_CONCURRENCY", "64"))
+# 每个 provider 等待队列的长度上限，队列满时直接拒绝
+ADMISSION_MAX_QUEUE = int(get_env_variable("ADMISSION_MAX_QUEUE", "128"))
+# 各优先级的最长排队时间（秒），超时后拒绝
+ADMISSION_MAX_WAIT = {
+    INTERACTIVE: float(get_env_variable("ADMISSION_INTERACTIVE_MAX_WAIT", "10")),
+    BATCH: float(get_env_variable("ADMISSION_BATCH_MAX_WAIT", "60")),
+}
+# 一次运行预计的输出 token 数（chat_node + generate_report），用于 token 速率限额
+ADMISSION_COMPLETION_TOKENS = int(get_env_variable("ADMISSION_COMPLETION_TOKENS", "2000"))
+
+# 用于计算等待时间分位数的最近样本数
+_WAIT_SAMPLES = 1024
+
+
+class AdmissionRejected(Exception):
+    """provider 容量不足，请求在排队前或排队中被拒绝"""
+
+    def __init__(self, scope: str, reason: str, retry_after: float):
+        super().__init__(f"'{scope}' is over capacity ({reason}), retry after {retry_after:.0f}s")
+        self.scope = scope
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Token-rate limit: refills tokens_per_minute / 60 tokens per second up to one minute's worth."""
+
+    def __init__(self, tokens_per_minute: float):
+        self.capacity = float(tokens_per_minute)
+        self.rate = self.capacity / 60
+        self.level = self.capacity
+        self._updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def wait_seconds(self, tokens: float, now: float) -> float:
+        """Seconds until `tokens` can be taken, 0 if available now."""
+        self._refill(now)
+        missing = min(tokens, self.capacity) - self.level
+        return missing / self.rate if missing > 0 else 0.0
+
+    def take(self, tokens: float, now: float):
+        self._refill(now)
+        self.level -= min(tokens, self.capacity)
+
+    def adjust(self, tokens: float):
+        """Return over-estimated tokens (positive) or charge the shortfall (negative)."""
+        self.level = max(-self.capacity, min(self.capacity, self.level + tokens))
+
+
+class _Scope:
+    """一个限额维度：provider 整体或某个 provider:model"""
+
+    __slots__ = ("name", "concurrency", "bucket", "active")
+
+    def __init__(self, name: str, concurrency: int, tokens_per_minute: float):
+        self.name = name
+        self.concurrency = concurrency
+        self.bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.active = 0
+
+    def wait_seconds(self, tokens: float, now: float) -> Optional[float]:
+        """None 表示并发已满，需等其他请求释放；否则为 token 可用前的等待秒数"""
+        if self.concurrency and self.active >= self.concurrency:
+            return None
+        return self.bucket.wait_seconds(tokens, now) if self.bucket else 0.0
+
+
+class _Waiter:
+    __slots__ = ("key", "priority", "scopes", "tokens", "future", "enqueued_at")
+
+    def __init__(self, key: Tuple[int, int], priority: int, scopes: List[_Scope], tokens: float, future: asyncio.Future):
+        self.key = key
+        self.priority = priority
+        self.scopes = scopes
+        self.tokens = tokens
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class Ticket:
+    """一次运行占用的容量，运行结束时 release"""
+
+    def __init__(self, controller: "AdmissionController", provider: str, scopes: List[_Scope], tokens: float, waited: float):
+        self._controller = controller
+        self.provider = provider
+        self.scopes = scopes
+        self.tokens = tokens
+        self.waited = waited
+        self.admitted_at = time.monotonic()
+        self.released = False
+
+    def release(self, used_tokens: Optional[int] = None):
+        """释放并发名额；提供实际用量时按估算差额修正 token 桶"""
+        if self.released:
+            return
+        self.released = True
+        self._controller._release(self, used_tokens)
+
+
+class _ProviderQueue:
+    def __init__(self):
+        self.waiters: List[_Waiter] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.hold_ewma: Optional[float] = None
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {"queue_full": 0, "timeout": 0, "preempted": 0}
+        self.waits: Deque[float] = deque(maxlen=_WAIT_SAMPLES)
+        self.max_wait = 0.0
+
+
+class AdmissionController:
+    """
+    LLM provider 前的准入控制
+    - 按 provider 和 provider:model 两级限制并发运行数和 token 速率
+    - 超出容量的请求进入按优先级排序的有界队列，interactive 优先于 batch
+    - 队列已满或排队超时时抛出 AdmissionRejected，附带建议的 Retry-After
+    所有状态只在事件循环线程内访问
+    """
+
+    def __init__(
+        self,
+        limits: Optional[Dict[str, Dict[str, float]]] = None,
+        default_concurrency: int = ADMISSION_DEFAULT_CONCURRENCY,
+        max_queue: int = ADMISSION_MAX_QUEUE,
+        max_wait: Optional[Dict[int, float]] = None,
+    ):
+        self.limits = ADMISSION_LIMITS if limits is None else limits
+        self.default_concurrency = default_concurrency
+        self.max_queue = max_queue
+        self.max_wait = ADMISSION_MAX_WAIT if max_wait is None else max_wait
+        self._scopes: Dict[str, _Scope] = {}
+        self._queues: Dict[str, _ProviderQueue] = {}
+        self._seq = 0
+
+    def _scope(self, name: str, default_concurrency: int) -> _Scope:
+        scope = self._scopes.get(name)
+        if scope is None:
+            limit = self.limits.get(name, {})
+            scope = self._scopes[name] = _Scope(
+                name,
+                int(limit.get("concurrency", default_concurrency)),
+                float(limit.get("tokens_per_minute", 0)),
+            )
+        return scope
+
+    def _scopes_for(self, provider: str, model: Optional[str]) -> List[_Scope]:
+        scopes = [self._scope(provider, self.default_concurrency)]
+        if model and f"{provider}:{model}" in self.limits:
+            scopes.append(self._scope(f"{provider}:{model}", 0))
+        return scopes
+
+    @staticmethod
+    def _wait_seconds(scopes: Iterable[_Scope], tokens: float, now: float) -> Optional[float]:
+        longest = 0.0
+        for scope in scopes:
+            wait = scope.wait_seconds(tokens, now)
+            if wait is None:
+                return None
+            longest = max(longest, wait)
+        return longest
+
+    def _grant(self, provider: str, scopes: List[_Scope], tokens: float, waited: float, now: float) -> Ticket:
+        for scope in scopes:
+            scope.active += 1
+            if scope.bucket is not None:
+                scope.bucket.take(tokens, now)
+        queue = self._queues[provider]
+        queue.admitted += 1
+        queue.waits.append(waited)
+        queue.max_wait = max(queue.max_wait, waited)
+        return Ticket(self, provider, scopes, tokens, waited)
+
+    def _retry_after(self, provider: str, scopes: List[_Scope], tokens: float) -> float:
+        """按 token 补充速度和平均占用时长估算多久后重试"""
+        now = time.monotonic()
+        queue = self._queues[provider]
+        retry_after = 1.0
+        for scope in scopes:
+            if scope.bucket is not None:
+                retry_after = max(retry_after, scope.bucket.wait_seconds(tokens, now))
+            if scope.concurrency and queue.hold_ewma:
+                retry_after = max(retry_after, queue.hold_ewma * (len(queue.waiters) + 1) / scope.concurrency)
+        return retry_after
+
+    def _reject(self, provider: str, scopes: List[_Scope], tokens: float, reason: str) -> AdmissionRejected:
+        self._queues[provider].rejected[reason] += 1
+        error = AdmissionRejected(scopes[-1].name, reason, self._retry_after(provider, scopes, tokens))
+        logger.warning(
+            "Admission rejected",
+            extra={"scope": error.scope, "reason": reason, "retry_after": round(error.retry_after, 1)},
+        )
+        return error
+
+    def _dispatch(self, provider: str):
+        """按优先级授予名额；被阻塞的维度上不允许低优先级请求插队"""
+        queue = self._queues[provider]
+        if queue.timer is not None:
+            queue.timer.cancel()
+            queue.timer = None
+        if not queue.waiters:
+            return
+
+        now = time.monotonic()
+        blocked: set = set()
+        next_check: Optional[float] = None
+        remaining: List[_Waiter] = []
+        for waiter in sorted(queue.waiters, key=lambda w: w.key):
+            if waiter.future.done() or any(scope.name in blocked for scope in waiter.scopes):
+                if not waiter.future.done():
+                    remaining.append(waiter)
+                continue
+            waits = [scope.wait_seconds(waiter.tokens, now) for scope in waiter.scopes]
+            if all(wait == 0 for wait in waits):
+                waiter.future.set_result(
+                    self._grant(provider, waiter.scopes, waiter.tokens, now - waiter.enqueued_at, now)
+                )
+                continue
+            remaining.append(waiter)
+            # 只阻塞容量不足的维度，其他模型的请求不受影响
+            blocked.update(scope.name for scope, wait in zip(waiter.scopes, waits) if wait != 0)
+            if None not in waits:
+                wait = max(waits)
+                next_check = wait if next_check is None else min(next_check, wait)
+        queue.waiters = remaining
+
+        # 只受 token 速率限制时，到补充完成的时间点再检查
+        if next_check is not None and remaining:
+            queue.timer = asyncio.get_running_loop().call_later(next_check, self._dispatch, provider)
+
+    def _preempt_batch(self, provider: str) -> bool:
+        """队列已满时，让 interactive 请求挤掉最新排队的 batch 请求"""
+        queue = self._queues[provider]
+        batch = [waiter for waiter in queue.waiters if waiter.priority == BATCH and not waiter.future.done()]
+        if not batch:
+            return False
+        victim = max(batch, key=lambda w: w.key)
+        queue.waiters.remove(victim)
+        victim.future.set_exception(self._reject(provider, victim.scopes, victim.tokens, "preempted"))
+        return True
+
+    def _abandon(self, provider: str, waiter: _Waiter):
+        """等待方放弃（超时或被取消）：已授予则释放，否则移出队列"""
+        queue = self._queues[provider]
+        if waiter.future.done():
+            if not waiter.future.cancelled() and waiter.future.exception() is None:
+                waiter.future.result().release()
+            return
+        waiter.future.cancel()
+        if waiter in queue.waiters:
+            queue.waiters.remove(waiter)
+        # 被移除的请求可能阻塞着后面的请求
+        self._dispatch(provider)
+
+    async def admit(
+        self,
+        provider: str,
+        model: Optional[str] = None,
+        priority: int = INTERACTIVE,
+        tokens: float = 0,
+    ) -> Ticket:
+        """等待名额并返回 Ticket；容量不足时抛出 AdmissionRejected"""
+        provider = provider or "openai"
+        scopes = self._scopes_for(provider, model)
+        queue = self._queues.setdefault(provider, _ProviderQueue())
+        now = time.monotonic()
+
+        # 快速路径：没有人排队且容量充足
+        if not queue.waiters and self._wait_seconds(scopes, tokens, now) == 0:
+            return self._grant(provider, scopes, tokens, 0.0, now)
+
+        if len(queue.waiters) >= self.max_queue:
+            if priority != INTERACTIVE or not self._preempt_batch(provider):
+                raise self._reject(provider, scopes, tokens, "queue_full")
+
+        self._seq += 1
+        waiter = _Waiter((priority, self._seq), priority, scopes, tokens, asyncio.get_running_loop().create_future())
+        queue.waiters.append(waiter)
+        self._dispatch(provider)
+
+        try:
+            await asyncio.wait({waiter.future}, timeout=self.max_wait.get(priority))
+        except asyncio.CancelledError:
+            self._abandon(provider, waiter)
+            raise
+        if not waiter.future.done():
+            self._abandon(provider, waiter)
+            raise self._reject(provider, scopes, tokens, "timeout")
+        return waiter.future.result()
+
+    def _release(self, ticket: Ticket, used_tokens: Optional[int]):
+        for scope in ticket.scopes:
+            scope.active -= 1
+            if used_tokens is not None and scope.bucket is not None:
+                scope.bucket.adjust(min(ticket.tokens, scope.bucket.capacity) - used_tokens)
+        queue = self._queues[ticket.provider]
+        held = time.monotonic() - ticket.admitted_at
+        queue.hold_ewma = held if queue.hold_ewma is None else queue.hold_ewma + 0.2 * (held - queue.hold_ewma)
+        self._dispatch(ticket.provider)
+
+    def stats(self) -> Dict[str, Any]:
+        result: Dict[str, Any] = {}
+        for provider, queue in self._queues.items():
+            waits = sorted(queue.waits)
+            result[provider] = {
+                "queue_depth": len(queue.waiters),
+                "queued": {
+                    name: sum(1 for waiter in queue.waiters if waiter.priority == value)
+                    for name, value in PRIORITIES.items()
+                },
+                "admitted": queue.admitted,
+                "rejected": dict(queue.rejected),
+                "avg_wait_ms": sum(waits) / len(waits) * 1000 if waits else 0.0,
+                "p99_wait_ms": waits[int(len(waits) * 0.99)] * 1000 if waits else 0.0,
+                "max_wait_ms": queue.max_wait * 1000,
+                "avg_hold_ms": (queue.hold_ewma or 0.0) * 1000,
+            }
+        for name, scope in self._scopes.items():
+            provider = name.partition(":")[0]
+            if provider in result:
+                result[provider].setdefault("scopes", {})[name] = {
+                    "active": scope.active,
+                    "concurrency": scope.concurrency,
+                    "tokens_available": round(scope.bucket.level) if scope.bucket else None,
+                }
+        return result
+
+
+def estimate_tokens(texts: Iterable[str], model: Optional[str] = None) -> int:
+    """Estimate the tokens a run will consume: prompt tokens plus the expected completion."""
+    return sum(count_tokens(text, model) for text in texts if text) + ADMISSION_COMPLETION_TOKENS
+
+
+admission_controller = AdmissionController()
@@ -15,6 +15,7 @@ class BaseLLMClient:
         max_tokens: Optional[int] = 1500,
         streaming: Optional[bool] = False,
         api_key: Optional[str] = "",
+        http_async_client: Optional[Any] = None,
     ):
         pass
 
@@ -0,0 +1,221 @@
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.language_models.chat_models import agenerate_from_stream, generate_from_stream
+from langchain_core.messages import AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from core.types.models import MessageContent
+from llm import register_llm_client
+from llm.base import BaseLLMClient
+from utils.env import get_env_variable
+
+# 首 token 延迟（毫秒）与之后的输出速度
+FAKE_LLM_TTFT_MS = float(get_env_variable("FAKE_LLM_TTFT_MS", "400"))
+FAKE_LLM_TOKENS_PER_SECOND = float(get_env_variable("FAKE_LLM_TOKENS_PER_SECOND", "60"))
+# 首 token 延迟的随机抖动比例，0.2 表示 ±20%
+FAKE_LLM_JITTER = float(get_env_variable("FAKE_LLM_JITTER", "0.2"))
+# 在首 token 前失败的概率
+FAKE_LLM_ERROR_RATE = float(get_env_variable("FAKE_LLM_ERROR_RATE", "0"))
+FAKE_LLM_CHARS_PER_TOKEN = int(get_env_variable("FAKE_LLM_CHARS_PER_TOKEN", "4"))
+# 默认脚本中报告的大致长度（字符）
+FAKE_LLM_RESPONSE_CHARS = int(get_env_variable("FAKE_LLM_RESPONSE_CHARS", "3000"))
+# 脚本文件：JSON 数组或每行一条规则的 JSONL（例如从真实运行录制的响应），为空时使用默认脚本
+FAKE_LLM_SCRIPT = get_env_variable("FAKE_LLM_SCRIPT", "")
+FAKE_LLM_SEED = get_env_variable("FAKE_LLM_SEED", "")
+
+_REPORT_UNIT = (
+    "## {ticker} Trend\n"
+    "{ticker} closed <highlight>higher</highlight> on above-average volume, "
+    "holding support near the 20-day moving average.\n\n"
+    "<CandlestickChart title=\"{ticker}\" />\n\n"
+)
+
+
+def default_script(response_chars: int = FAKE_LLM_RESPONSE_CHARS) -> List[Dict[str, Any]]:
+    """与 raw_web / enhanced_markdown 的流程对应：先调用 get_stock_data，拿到工具结果后输出报告"""
+    report = (_REPORT_UNIT * (response_chars // len(_REPORT_UNIT) + 1))[:response_chars]
+    return [
+        {"tools": True, "tool_calls": [{"name": "get_stock_data", "args": {"stock_name": "{ticker}"}}]},
+        {"content": report},
+    ]
+
+
+def load_script(path: str) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    if path.endswith(".jsonl"):
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    return json.loads(text)
+
+
+def _substitute(value: Any, variables: Dict[str, str]) -> Any:
+    """替换字符串中的 {name} 变量；不用 str.format，脚本内容里的花括号（CSS、JSON）原样保留"""
+    if isinstance(value, str):
+        for name, replacement in variables.items():
+            value = value.replace("{" + name + "}", replacement)
+        return value
+    if isinstance(value, dict):
+        return {key: _substitute(item, variables) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_substitute(item, variables) for item in value]
+    return value
+
+
+class FakeProviderError(RuntimeError):
+    """模拟的 provider 错误"""
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    按脚本流式输出的聊天模型，不发起任何网络请求
+    脚本规则按顺序匹配，第一条满足条件的规则决定响应：
+    - match：对最近一条用户消息的正则，可选
+    - tools：为 true 时只在绑定了规则中的工具、且最近的用户消息之后还没有工具结果时匹配；为 false 时只在其余情况匹配
+    - content / tool_calls：响应文本和工具调用，字符串中的 {ticker} 替换为用户消息中的股票代码
+    - ttft_ms / tokens_per_second：覆盖该规则的延迟设置
+    """
+
+    model_name: str = "fake"
+    ttft_ms: float = FAKE_LLM_TTFT_MS
+    tokens_per_second: float = FAKE_LLM_TOKENS_PER_SECOND
+    jitter: float = FAKE_LLM_JITTER
+    error_rate: float = FAKE_LLM_ERROR_RATE
+    chars_per_token: int = FAKE_LLM_CHARS_PER_TOKEN
+    script: List[Dict[str, Any]]
+    tools: List[str] = []
+    rng: Any = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model_name": self.model_name}
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> "FakeChatModel":
+        return self.model_copy(update={"tools": [convert_to_openai_tool(tool)["function"]["name"] for tool in tools]})
+
+    def _select(self, messages: List[BaseMessage]) -> Dict[str, Any]:
+        last_human = max((i for i, message in enumerate(messages) if message.type == "human"), default=-1)
+        user_text = messages[last_human].text() if last_human >= 0 else ""
+        awaiting_tools = bool(self.tools) and not any(message.type == "tool" for message in messages[last_human + 1:])
+        for rule in self.script:
+            if "match" in rule and not re.search(rule["match"], user_text, re.I):
+                continue
+            if "tools" in rule:
+                if rule["tools"] != awaiting_tools:
+                    continue
+                if rule["tools"] and not all(call["name"] in self.tools for call in rule.get("tool_calls", [])):
+                    continue
+            return self._render(rule, user_text)
+        return {"content": ""}
+
+    @staticmethod
+    def _render(rule: Dict[str, Any], user_text: str) -> Dict[str, Any]:
+        # 延迟导入，避免 llm 与 agents 之间的循环依赖
+        from agents.tools.tickers import extract_tickers
+
+        tickers = extract_tickers(user_text)
+        return _substitute(rule, {"ticker": tickers[0] if tickers else "AAPL"})
+
+    def _plan(self, messages: List[BaseMessage]):
+        """返回 (首 token 延迟秒数, token 间隔秒数, 工具调用 chunk, 文本 token 列表, 是否出错)"""
+        rng = self.rng or random
+        rule = self._select(messages)
+        ttft = rule.get("ttft_ms", self.ttft_ms) / 1000 * rng.uniform(1 - self.jitter, 1 + self.jitter)
+        tokens_per_second = rule.get("tokens_per_second", self.tokens_per_second)
+        interval = 1 / tokens_per_second if tokens_per_second > 0 else 0.0
+        tool_call_chunks = [
+            {"name": call["name"], "args": json.dumps(call.get("args", {})), "id": f"call_{uuid.uuid4().hex[:24]}", "index": index}
+            for index, call in enumerate(rule.get("tool_calls", []))
+        ]
+        content = rule.get("content", "")
+        size = max(1, self.chars_per_token)
+        tokens = [content[i:i + size] for i in range(0, len(content), size)]
+        return ttft, interval, tool_call_chunks, tokens, rng.random() < self.error_rate
+
+    def _usage_chunk(self, messages: List[BaseMessage], output_tokens: int) -> ChatGenerationChunk:
+        input_tokens = sum(len(message.text()) for message in messages) // max(1, self.chars_per_token)
+        return ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata={
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        }))
+
+    async def _astream(
+        self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        ttft, interval, tool_call_chunks, tokens, fail = self._plan(messages)
+        await asyncio.sleep(ttft)
+        if fail:
+            raise FakeProviderError("Simulated provider error")
+        if tool_call_chunks:
+            yield ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=tool_call_chunks))
+        # 按绝对时间排程，输出速度很高时不必每个 token 都 sleep
+        first_token_at = time.perf_counter()
+        for index, token in enumerate(tokens):
+            delay = first_token_at + index * interval - time.perf_counter()
+            if delay > 0.001:
+                await asyncio.sleep(delay)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+        yield self._usage_chunk(messages, len(tokens) + len(tool_call_chunks))
+
+    def _stream(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        ttft, interval, tool_call_chunks, tokens, fail = self._plan(messages)
+        time.sleep(ttft)
+        if fail:
+            raise FakeProviderError("Simulated provider error")
+        if tool_call_chunks:
+            yield ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=tool_call_chunks))
+        for token in tokens:
+            time.sleep(interval)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+        yield self._usage_chunk(messages, len(tokens) + len(tool_call_chunks))
+
+    async def _agenerate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        return await agenerate_from_stream(self._astream(messages, stop, **kwargs))
+
+    def _generate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        return generate_from_stream(self._stream(messages, stop, **kwargs))
+
+
+@register_llm_client("fake")
+class FakeClient(BaseLLMClient):
+    """用于压测和本地开发的假 provider，行为由 FAKE_LLM_* 环境变量和脚本文件配置"""
+
+    _client: FakeChatModel
+
+    def __init__(
+        self,
+        model_name: Optional[str] = "fake",
+        temperature: Optional[float] = 0.2,
+        n: Optional[int] = 1,
+        top_p: Optional[float] = None,
+        max_tokens: Optional[int] = 1500,
+        streaming: Optional[bool] = False,
+        api_key: Optional[str] = None,
+        http_async_client: Optional[Any] = None,
+    ):
+        self._client = FakeChatModel(
+            model_name=model_name or "fake",
+            script=load_script(FAKE_LLM_SCRIPT) if FAKE_LLM_SCRIPT else default_script(),
+            rng=random.Random(int(FAKE_LLM_SEED)) if FAKE_LLM_SEED else None,
+        )
+
+    def get_client(self):
+        return self._client
+
+    def get_tools(self, tools: List[Any]):
+        return [convert_to_openai_tool(tool) for tool in tools]
+
+    def parse_content(self, content: List[MessageContent]):
+        return [c.model_dump() for c in content]
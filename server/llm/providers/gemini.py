@@ -36,7 +36,10 @@ class GeminiClient(BaseLLMClient):
         max_tokens: Optional[int] = 1500,
         streaming: Optional[bool] = False,
         api_key: Optional[str] = GEMINI_API_KEY,
+        http_async_client: Optional[Any] = None,
     ):
+        # Gemini 走 google-genai 自己的 gRPC 通道，不使用 httpx；
+        # 通道随客户端实例一起被 LLM 客户端缓存复用
         self._client = ChatGoogleGenerativeAI(
             model=model_name,
             temperature=temperature,
@@ -0,0 +1,391 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.language_models.chat_models import agenerate_from_stream
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from core.types.models import MessageContent
+from llm import LLM, register_llm_client
+from llm.base import BaseLLMClient
+from utils.env import get_env_variable
+
+logger = logging.getLogger(__name__)
+
+# 模型名不含 "|" 时：主 provider 使用请求的模型，备用为 HEDGE_SECONDARY（"provider:model"）
+HEDGE_PRIMARY_PROVIDER = get_env_variable("HEDGE_PRIMARY_PROVIDER", "openai")
+HEDGE_SECONDARY = get_env_variable("HEDGE_SECONDARY", "gemini:gemini-2.0-flash")
+# 主 provider 首 token 延迟超过该分位数时发起备用请求
+HEDGE_PERCENTILE = float(get_env_variable("HEDGE_PERCENTILE", "0.95"))
+# 样本不足时使用的固定预算及预算上下限（秒）
+HEDGE_DEFAULT_DELAY = float(get_env_variable("HEDGE_DEFAULT_DELAY", "2.0"))
+HEDGE_MIN_DELAY = float(get_env_variable("HEDGE_MIN_DELAY", "0.2"))
+HEDGE_MAX_DELAY = float(get_env_variable("HEDGE_MAX_DELAY", "5.0"))
+HEDGE_MIN_SAMPLES = int(get_env_variable("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_WINDOW = int(get_env_variable("HEDGE_WINDOW", "512"))
+# 连续失败达到该次数后熔断，冷却期后放行一次试探请求
+HEDGE_BREAKER_FAILURES = int(get_env_variable("HEDGE_BREAKER_FAILURES", "5"))
+HEDGE_BREAKER_COOLDOWN = float(get_env_variable("HEDGE_BREAKER_COOLDOWN", "30"))
+
+_CLOSED, _OPEN, _HALF_OPEN = "closed", "open", "half_open"
+
+
+class TargetHealth:
+    """单个 provider:model 的首 token 延迟分布与熔断状态，在所有 HedgedChatModel 实例间共享"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._ttft: Deque[float] = deque(maxlen=HEDGE_WINDOW)
+        self.state = _CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.requests = 0
+        self.wins = 0
+        self.failures = 0
+        self.cancelled = 0
+
+    def record_ttft(self, seconds: float):
+        with self._lock:
+            self._ttft.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if not self._ttft:
+                return None
+            samples = sorted(self._ttft)
+        return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+    def hedge_delay(self) -> float:
+        """发起备用请求前等待的时间"""
+        with self._lock:
+            enough = len(self._ttft) >= HEDGE_MIN_SAMPLES
+        if not enough:
+            return HEDGE_DEFAULT_DELAY
+        return min(HEDGE_MAX_DELAY, max(HEDGE_MIN_DELAY, self.percentile(HEDGE_PERCENTILE)))
+
+    def available(self) -> bool:
+        """是否可以向该目标发请求：未熔断，或熔断冷却已结束"""
+        with self._lock:
+            if self.state == _OPEN:
+                return time.monotonic() - self.opened_at >= HEDGE_BREAKER_COOLDOWN
+            return self.state == _CLOSED
+
+    def begin(self) -> bool:
+        """记录一次请求；冷却结束后的第一个请求作为试探，返回是否为试探请求"""
+        with self._lock:
+            self.requests += 1
+            if self.state == _OPEN and time.monotonic() - self.opened_at >= HEDGE_BREAKER_COOLDOWN:
+                self.state = _HALF_OPEN
+                return True
+            return False
+
+    def on_win(self):
+        with self._lock:
+            self.wins += 1
+
+    def on_abandon(self, trial: bool, cancelled: bool):
+        """请求在有结论前被放弃（对冲落败、取消、下游关闭）；试探请求未决时回到熔断状态，冷却后重新试探"""
+        with self._lock:
+            self.cancelled += cancelled
+            if trial and self.state == _HALF_OPEN:
+                self.state = _OPEN
+                self.opened_at = time.monotonic()
+
+    def on_success(self):
+        with self._lock:
+            self.consecutive_failures = 0
+            if self.state != _CLOSED:
+                logger.info("Hedge circuit closed", extra={"target": self.name})
+            self.state = _CLOSED
+
+    def on_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.consecutive_failures += 1
+            if self.state == _HALF_OPEN or self.consecutive_failures >= HEDGE_BREAKER_FAILURES:
+                if self.state != _OPEN:
+                    logger.warning("Hedge circuit opened", extra={"target": self.name})
+                self.state = _OPEN
+                self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        p50, p95, p99 = (self.percentile(q) for q in (0.5, 0.95, 0.99))
+        with self._lock:
+            return {
+                "state": self.state,
+                "requests": self.requests,
+                "wins": self.wins,
+                "failures": self.failures,
+                "cancelled": self.cancelled,
+                "samples": len(self._ttft),
+                "ttft_p50_ms": (p50 or 0.0) * 1000,
+                "ttft_p95_ms": (p95 or 0.0) * 1000,
+                "ttft_p99_ms": (p99 or 0.0) * 1000,
+            }
+
+
+class HedgeStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hedged = 0
+        self.backup_wins = 0
+        self.failovers = 0
+        self.targets: Dict[str, TargetHealth] = {}
+
+    def target(self, name: str) -> TargetHealth:
+        with self._lock:
+            health = self.targets.get(name)
+            if health is None:
+                health = self.targets[name] = TargetHealth(name)
+            return health
+
+    def record(self, hedged: bool, backup_won: bool, failover: bool):
+        with self._lock:
+            self.requests += 1
+            self.hedged += hedged
+            self.backup_wins += backup_won
+            self.failovers += failover
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            targets = dict(self.targets)
+            summary = {
+                "requests": self.requests,
+                "hedged": self.hedged,
+                "hedge_ratio": self.hedged / self.requests if self.requests else 0.0,
+                "backup_wins": self.backup_wins,
+                "failovers": self.failovers,
+            }
+        summary["targets"] = {name: health.stats() for name, health in targets.items()}
+        return summary
+
+
+hedge_stats = HedgeStats()
+
+
+class _Attempt:
+    """一次对某个 provider 的流式请求，first 任务产出首个 chunk"""
+
+    def __init__(self, name: str, stream: AsyncIterator[Any]):
+        self.name = name
+        self.health = hedge_stats.target(name)
+        self.stream = stream
+        self.started_at = time.monotonic()
+        self.first = asyncio.ensure_future(stream.__anext__())
+        self.trial = self.health.begin()
+
+    async def discard(self):
+        """取消尚未胜出的请求并关闭其连接"""
+        cancelled = not self.first.done()
+        if cancelled:
+            self.first.cancel()
+        await asyncio.wait({self.first})
+        error = None if self.first.cancelled() else self.first.exception()
+        if error is not None:
+            self.health.on_failure()
+        else:
+            # 落败请求的耗时只是下界，不计入样本，否则预算会被推向长尾
+            self.health.on_abandon(self.trial, cancelled)
+        await self.stream.aclose()
+
+
+class HedgedChatModel(BaseChatModel):
+    """
+    对主 provider 发起流式请求；超过首 token 延迟预算仍无输出时向备用 provider 发起同样的请求，
+    使用先产出首 token 的一方并取消另一方。主 provider 在首 token 前出错时直接切换到备用，
+    连续出错的 provider 被熔断，熔断期间由另一方单独处理
+    """
+
+    primary: Any
+    secondary: Any
+    primary_name: str
+    secondary_name: str
+
+    @property
+    def _llm_type(self) -> str:
+        return "hedged"
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> "HedgedChatModel":
+        # 两个 provider 分别按各自的格式转换工具定义
+        return self.model_copy(update={
+            "primary": self.primary.bind_tools(tools, **kwargs),
+            "secondary": self.secondary.bind_tools(tools, **kwargs),
+        })
+
+    def _targets(self) -> List[Tuple[str, Any]]:
+        targets = [(self.primary_name, self.primary), (self.secondary_name, self.secondary)]
+        allowed = [target for target in targets if hedge_stats.target(target[0]).available()]
+        # 两个都被熔断时仍按原顺序尝试
+        return allowed or targets
+
+    async def _first_chunk(self, lead: _Attempt, backups: List[Tuple[str, Any]], start, delay: float):
+        """返回 (胜出的请求, 首个 chunk, 是否发起了对冲请求, 是否因出错切换)"""
+        pending: Dict[asyncio.Future, _Attempt] = {lead.first: lead}
+        hedged = failover = False
+        timeout: Optional[float] = delay if backups else None
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                timeout = None
+                if not done:
+                    # 超出首 token 预算，向备用 provider 发起同样的请求
+                    backup = start(*backups.pop(0))
+                    pending[backup.first] = backup
+                    hedged = True
+                    continue
+                for future in done:
+                    attempt = pending.pop(future)
+                    error = future.exception()
+                    if error is None:
+                        attempt.health.record_ttft(time.monotonic() - attempt.started_at)
+                        for other in pending.values():
+                            await other.discard()
+                        return attempt, future.result(), hedged, failover
+                    # 首 token 前出错：记录失败，备用请求尚未发起时立即切换
+                    attempt.health.on_failure()
+                    await attempt.stream.aclose()
+                    logger.warning(
+                        "Hedged provider failed before first token",
+                        extra={"target": attempt.name, "error": str(error)},
+                    )
+                    if backups:
+                        backup = start(*backups.pop(0))
+                        pending[backup.first] = backup
+                        failover = True
+        except asyncio.CancelledError:
+            for attempt in pending.values():
+                await attempt.discard()
+            raise
+        raise error
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        def start(name: str, model: Any) -> _Attempt:
+            # 内层调用不挂回调，token 只通过外层 run_manager 上报一次
+            return _Attempt(name, model.astream(messages, {"callbacks": []}, stop=stop, **kwargs))
+
+        targets = self._targets()
+        lead = start(*targets[0])
+        winner, chunk, hedged, failover = await self._first_chunk(
+            lead, targets[1:], start, lead.health.hedge_delay()
+        )
+        hedge_stats.record(hedged, hedged and winner is not lead, failover)
+        winner.health.on_win()
+
+        try:
+            while True:
+                generation = ChatGenerationChunk(message=chunk)
+                if run_manager:
+                    await run_manager.on_llm_new_token(generation.text, chunk=generation)
+                yield generation
+                try:
+                    chunk = await winner.stream.__anext__()
+                except StopAsyncIteration:
+                    break
+            winner.health.on_success()
+        except Exception:
+            # 已经输出了内容，无法再切换 provider
+            winner.health.on_failure()
+            raise
+        except BaseException:
+            # 下游关闭生成器或取消运行（GeneratorExit / CancelledError），结果未知
+            winner.health.on_abandon(winner.trial, False)
+            raise
+        finally:
+            await winner.stream.aclose()
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        # 对冲依赖首 token 时间，非流式调用也走流式接口
+        return await agenerate_from_stream(self._astream(messages, stop, run_manager, **kwargs))
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        # 同步调用只在脚本中使用，不做对冲
+        message = self.primary.invoke(messages, {"callbacks": []}, stop=stop, **kwargs)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+def _parse_target(spec: str, default_provider: str) -> Tuple[str, str]:
+    provider, sep, model = spec.partition(":")
+    return (provider, model) if sep else (default_provider, spec)
+
+
+@register_llm_client("hedged")
+class HedgedClient(BaseLLMClient):
+    """
+    组合 provider：模型名为 "openai:gpt-4o|gemini:gemini-2.0-flash" 形式时分别指定主、备；
+    否则主 provider 为 HEDGE_PRIMARY_PROVIDER + 请求的模型，备用为 HEDGE_SECONDARY
+    """
+
+    _client: HedgedChatModel
+
+    def __init__(
+        self,
+        model_name: Optional[str] = "gpt-4o",
+        temperature: Optional[float] = 0.2,
+        n: Optional[int] = 1,
+        top_p: Optional[float] = None,
+        max_tokens: Optional[int] = 1500,
+        streaming: Optional[bool] = False,
+        api_key: Optional[str] = None,
+        http_async_client: Optional[Any] = None,
+    ):
+        primary_spec, sep, secondary_spec = (model_name or "").partition("|")
+        primary = _parse_target(primary_spec, HEDGE_PRIMARY_PROVIDER)
+        secondary = _parse_target(secondary_spec if sep else HEDGE_SECONDARY, HEDGE_PRIMARY_PROVIDER)
+        # 内层客户端通过 LLM 创建，复用客户端缓存和各 provider 的连接池
+        self._primary, self._secondary = (
+            LLM(
+                provider=provider,
+                model_name=model,
+                temperature=temperature,
+                n=n,
+                top_p=top_p,
+                max_tokens=max_tokens,
+                streaming=True,
+            )
+            for provider, model in (primary, secondary)
+        )
+        self._client = HedgedChatModel(
+            primary=self._primary.get_client(),
+            secondary=self._secondary.get_client(),
+            primary_name=":".join(primary),
+            secondary_name=":".join(secondary),
+        )
+
+    def get_client(self):
+        return self._client
+
+    def get_tools(self, tools: List[Any]):
+        return self._primary._client.get_tools(tools)
+
+    def parse_content(self, content: List[MessageContent]):
+        return self._primary._client.parse_content(content)
+
+
+def get_hedge_stats() -> Dict[str, Any]:
+    return hedge_stats.stats()
@@ -24,6 +24,7 @@ class OpenAIClient(BaseLLMClient):
         max_tokens: Optional[int] = 1500,
         streaming: Optional[bool] = False,
         api_key: Optional[str] = OPEN_API_KEY,
+        http_async_client: Optional[Any] = None,
     ):
         self._client = ChatOpenAI(
             model_name=model_name,
@@ -34,6 +35,7 @@ class OpenAIClient(BaseLLMClient):
             max_tokens=max_tokens,
             openai_api_key=api_key,
             stream_usage=True,
+            http_async_client=http_async_client,
         )
 
     def get_client(self):
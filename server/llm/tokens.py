@@ -0,0 +1,162 @@
+import asyncio
+import logging
+from typing import Any, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+# 无法加载 tiktoken 编码表时，按平均每 token 约 4 个字符估算
+CHARS_PER_TOKEN = 4
+
+
+_ENCODER_CACHE_SIZE = 32
+_encoders: Dict[Optional[str], Optional[Any]] = {}
+
+
+def _load_encoder(model: Optional[str]) -> Optional[Any]:
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+
+    try:
+        return tiktoken.encoding_for_model(model or "gpt-4o")
+    except KeyError:
+        # 非 OpenAI 模型（例如 Gemini）使用通用编码近似
+        try:
+            return tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            logger.warning("tiktoken encoding unavailable: %s", e)
+            return None
+    except Exception as e:
+        logger.warning("tiktoken encoding unavailable for %s: %s", model, e)
+        return None
+
+
+def get_encoder(model: Optional[str]) -> Optional[Any]:
+    """Return a cached tiktoken encoder for the model, or None if unavailable."""
+    try:
+        return _encoders[model]
+    except KeyError:
+        pass
+    encoder = _load_encoder(model)
+    if len(_encoders) < _ENCODER_CACHE_SIZE:
+        _encoders[model] = encoder
+    return encoder
+
+
+async def aget_encoder(model: Optional[str]) -> Optional[Any]:
+    """
+    Async variant of get_encoder for use on the event loop.
+
+    The first load of an encoding reads (and on a cold cache downloads) its BPE
+    file, so uncached models are loaded in a worker thread.
+    """
+    if model in _encoders:
+        return _encoders[model]
+    return await asyncio.to_thread(get_encoder, model)
+
+
+def warm_encoders(models: Iterable[Optional[str]] = ("gpt-4o",)):
+    """Load encoders ahead of the first request, e.g. from the app lifespan."""
+    for model in models:
+        get_encoder(model)
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """Count tokens in text with the model's tokenizer, falling back to a char estimate."""
+    if not text:
+        return 0
+    encoder = get_encoder(model)
+    if encoder is None:
+        return max(1, (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN)
+    return len(encoder.encode(text, disallowed_special=()))
+
+
+class IncrementalTokenCounter:
+    """Incrementally count tokens of streamed text deltas."""
+
+    def __init__(self, model: Optional[str] = None):
+        self._encoder = get_encoder(model)
+        self._tokens = 0
+        self._chars = 0
+
+    def add(self, text: str):
+        if not text:
+            return
+        if self._encoder is None:
+            self._chars += len(text)
+        else:
+            self._tokens += len(self._encoder.encode(text, disallowed_special=()))
+
+    @property
+    def tokens(self) -> int:
+        if self._encoder is None:
+            return (self._chars + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+        return self._tokens
+
+
+class _RunUsage:
+    __slots__ = ("prompt", "completion", "reported_prompt", "reported_completion")
+
+    def __init__(self, model: Optional[str]):
+        self.prompt = IncrementalTokenCounter(model)
+        self.completion = IncrementalTokenCounter(model)
+        self.reported_prompt: Optional[int] = None
+        self.reported_completion: Optional[int] = None
+
+    @property
+    def prompt_tokens(self) -> int:
+        return self.prompt.tokens if self.reported_prompt is None else self.reported_prompt
+
+    @property
+    def completion_tokens(self) -> int:
+        return self.completion.tokens if self.reported_completion is None else self.reported_completion
+
+
+class UsageTracker:
+    """
+    Token usage across all chat model calls of one request.
+
+    Provider-reported usage_metadata wins when present; otherwise prompt and
+    completion tokens are counted locally as the text streams in.
+    """
+
+    def __init__(self, model: Optional[str] = None):
+        self.model = model
+        self._runs: Dict[str, _RunUsage] = {}
+
+    def _run(self, run_id: str) -> _RunUsage:
+        run = self._runs.get(run_id)
+        if run is None:
+            run = self._runs[run_id] = _RunUsage(self.model)
+        return run
+
+    def on_prompt(self, run_id: str, text: str):
+        self._run(run_id).prompt.add(text)
+
+    def on_completion(self, run_id: str, text: str):
+        self._run(run_id).completion.add(text)
+
+    def on_usage(self, run_id: str, usage_metadata: Optional[Dict[str, Any]], final: bool = False):
+        """Record provider usage; chunk usage accumulates, final (aggregated) usage replaces it."""
+        if not usage_metadata:
+            return
+        run = self._run(run_id)
+        if usage_metadata.get("input_tokens"):
+            previous = 0 if final else (run.reported_prompt or 0)
+            run.reported_prompt = previous + usage_metadata["input_tokens"]
+        if usage_metadata.get("output_tokens"):
+            previous = 0 if final else (run.reported_completion or 0)
+            run.reported_completion = previous + usage_metadata["output_tokens"]
+
+    @property
+    def prompt_tokens(self) -> int:
+        return sum(run.prompt_tokens for run in self._runs.values())
+
+    @property
+    def completion_tokens(self) -> int:
+        return sum(run.completion_tokens for run in self._runs.values())
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
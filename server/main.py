@@ -1,24 +1,48 @@
+import asyncio
 import os
+from contextlib import asynccontextmanager
 
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 
 from dotenv import load_dotenv
 
+from agents.checkpoint import checkpointer
+from agents.metrics import metrics_registry
 from agents.router import router
+from agents.tracing import tracer
+from llm.tokens import warm_encoders
+from utils.log import setup_logging
+from utils.metrics import CONTENT_TYPE
 
 load_dotenv()
+setup_logging()
 
 is_dev = bool(os.environ.get("IS_DEV", False))
 cors_origins_whitelist = os.environ.get("CORS_ORIGINS_WHITELIST", None)
 
-app = FastAPI(title="Generative UI Demo Server", version="1.0", description="Generative UI Demo Server")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+  # 后台预热 tiktoken 编码表（冷缓存时需要下载），不阻塞启动
+  warmup = asyncio.create_task(asyncio.to_thread(warm_encoders))
+  yield
+  warmup.cancel()
+  await tracer.aclose()
+  if checkpointer is not None:
+    await checkpointer.aclose()
+
+app = FastAPI(title="Generative UI Demo Server", version="1.0", description="Generative UI Demo Server", lifespan=lifespan)
 
 @app.get("/api/greetings")
 def home():
   return {"message": "Hello, World!"}
 
+# 各组件的 stats() 读取只在事件循环中修改的状态，必须在事件循环里渲染，不能放进线程池
+@app.get("/api/metrics")
+async def metrics():
+  return Response(content=metrics_registry.render(), media_type=CONTENT_TYPE)
+
 cors_origins = (
     ["*"] if cors_origins_whitelist is None else cors_origins_whitelist.split(",")
 )
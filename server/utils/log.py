@@ -0,0 +1,205 @@
+import atexit
+import copy
+import dataclasses
+import datetime
+import enum
+import json
+import logging
+import queue
+import random
+import sys
+import uuid
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Optional
+
+from pydantic import BaseModel
+
+from utils.env import get_env_variable
+
+LOG_LEVEL = get_env_variable("LOG_LEVEL", "INFO")
+# 原始 LangGraph 事件的采样率，0 表示不记录，1 表示全部记录
+RAW_EVENT_LOG_SAMPLE_RATE = float(get_env_variable("RAW_EVENT_LOG_SAMPLE_RATE", "0.01"))
+# 单个字段写入日志的最大字节数
+LOG_PAYLOAD_MAX_BYTES = int(get_env_variable("LOG_PAYLOAD_MAX_BYTES", "2048"))
+LOG_QUEUE_SIZE = int(get_env_variable("LOG_QUEUE_SIZE", "10000"))
+
+_STANDARD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+_listener: Optional[QueueListener] = None
+
+
+# repr 本身很短的标量类型，直接使用自身的 repr
+_SCALAR_TYPES = (int, float, complex, bool, type(None), enum.Enum, datetime.date, datetime.time, datetime.timedelta, uuid.UUID)
+
+
+def truncate(value: Any, limit: int = LOG_PAYLOAD_MAX_BYTES) -> str:
+    """将任意值转换为字符串并截断到指定字节数，长字符串只编码前 limit 个字符"""
+    text = value if isinstance(value, str) else bounded_repr(value, limit)
+    encoded = text[:limit + 1].encode("utf-8")
+    if len(encoded) <= limit and len(text) <= limit:
+        return text
+    return encoded[:limit].decode("utf-8", errors="ignore") + f"...<{len(text)} chars total>"
+
+
+def _fields(value: Any):
+    """pydantic 模型（包括 LangChain 消息）和 dataclass（包括 Command）按字段逐个取值，空字段省略"""
+    if isinstance(value, BaseModel):
+        names = type(value).model_fields
+    else:
+        names = [field.name for field in dataclasses.fields(value)]
+    for name in names:
+        item = getattr(value, name, None)
+        if item is None or (isinstance(item, (str, dict, list, tuple)) and not item):
+            continue
+        yield f"{name}=", item
+
+
+def _repr_within(value: Any, budget: int) -> str:
+    """
+    按预算构造 repr：长字符串先切片，容器、pydantic 模型和 dataclass 只展开到超出预算为止，
+    消息的 content 同样走切片；其余未知对象只输出类型和长度，不调用可能很大的 repr
+    """
+    if isinstance(value, str):
+        return repr(value[:budget + 1])
+    if isinstance(value, (bytes, bytearray)):
+        return repr(bytes(value[:budget + 1]))
+    if isinstance(value, _SCALAR_TYPES):
+        return repr(value)
+    if isinstance(value, dict):
+        items = ((f"{key!r}: ", item) for key, item in value.items())
+        left, right = "{", "}"
+    elif isinstance(value, (list, tuple)):
+        items = (("", item) for item in value)
+        left, right = ("[", "]") if isinstance(value, list) else ("(", ")")
+    elif isinstance(value, BaseModel) or (dataclasses.is_dataclass(value) and not isinstance(value, type)):
+        items = _fields(value)
+        left, right = f"{type(value).__name__}(", ")"
+    else:
+        try:
+            return f"<{type(value).__name__} len={len(value)}>"
+        except TypeError:
+            return f"<{type(value).__name__}>"
+    parts = []
+    used = len(left)
+    for prefix, item in items:
+        if used > budget:
+            parts.append("...")
+            break
+        part = prefix + _repr_within(item, budget - used)
+        parts.append(part)
+        used += len(part) + 2
+    return left + ", ".join(parts) + right
+
+
+def bounded_repr(value: Any, limit: int = LOG_PAYLOAD_MAX_BYTES) -> str:
+    """repr 的长度上限版本，超长的大状态和消息列表不会先构造完整的 repr 再截断"""
+    text = _repr_within(value, limit)
+    if len(text) <= limit:
+        return text
+    return text[:limit] + "...<truncated>"
+
+
+class Lazy:
+    """
+    延迟格式化的日志参数
+    只有在日志记录真正被输出时才会构造 repr，且构造过程受长度上限约束，未启用的级别没有格式化开销
+    """
+
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value: Any, limit: int = LOG_PAYLOAD_MAX_BYTES):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self) -> str:
+        if isinstance(self.value, str):
+            return truncate(self.value, self.limit)
+        if isinstance(self.value, dict):
+            return "{" + ", ".join(
+                f"{key!r}: {bounded_repr(item, self.limit)}" for key, item in self.value.items()
+            ) + "}"
+        return bounded_repr(self.value, self.limit)
+
+    __repr__ = __str__
+
+
+class Sampler:
+    """按固定比例采样"""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+
+    def __call__(self) -> bool:
+        return self.rate >= 1 or (self.rate > 0 and random.random() < self.rate)
+
+
+raw_event_sampler = Sampler(RAW_EVENT_LOG_SAMPLE_RATE)
+
+
+class JSONFormatter(logging.Formatter):
+    """每条日志输出一行 JSON，extra 字段原样带出"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=truncate)
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """队列满时丢弃日志而不是阻塞事件循环"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        在调用线程里渲染消息并给 extra 字段做浅拷贝，再交给后台线程写出
+        Lazy 参数和运行中的状态 / 消息列表会被事件循环继续修改，留到后台线程格式化会读到不一致的内容；
+        只有通过级别和采样检查的记录会走到这里
+        """
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        for key, value in record.__dict__.items():
+            if key in _STANDARD_ATTRS or key.startswith("_"):
+                continue
+            if isinstance(value, Lazy):
+                record.__dict__[key] = str(value)
+            elif isinstance(value, (dict, list)):
+                record.__dict__[key] = copy.copy(value)
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+def setup_logging(level: str = LOG_LEVEL) -> QueueListener:
+    """
+    配置服务端日志：所有记录先进入内存队列，由后台线程格式化并写出，
+    流式协程不会阻塞在日志 I/O 上
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(JSONFormatter())
+
+    log_queue: queue.Queue = queue.Queue(LOG_QUEUE_SIZE)
+    root = logging.getLogger()
+    root.handlers = [_NonBlockingQueueHandler(log_queue)]
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener